@@ -0,0 +1,232 @@
+import re
+from numpy import asarray, searchsorted, where, argsort, loadtxt, savetxt, column_stack, concatenate, atleast_1d, select, full, inf, char
+from pandas import CategoricalDtype
+from Tools import rel_s
+
+# FCC-ee IR vacuum chamber (design report/mechanical design), segments [start, end) with r = slope*s + offset in [m]
+# (these are the breakpoints formerly hard coded in Tools.calcAper)
+#
+fccIRSegments = [ [-3.640000000, -2.725000000,  0.000000,  .040000000],
+                  [-2.725000000, -2.675000000, -0.100000, -.232500000],
+                  [-2.675000000, -1.750000000,  0.000000,  .035000000],
+                  [-1.750000000, -1.630000000, -0.100000, -.140000000],
+                  [-1.630000000, -1.590000000, -0.025000, -.017750000],
+                  [-1.590000000, -1.252000000,  0.000000,  .022000000],
+                  [-1.252000000, -1.172000000, -0.100000, -.103200000],
+                  [-1.172000000, -1.092000000, -0.006250,  .006675000],
+                  [-1.092000000,  -.620500000,  0.000000,  .013500000],
+                  [ -.620500000,  -.452000000, -0.020772,  0.000611276],
+                  [ -.452000000,  -.220000000, -0.021552,  0.000258621],
+                  [ -.220000000,  -.203340000, -0.002401,  .004471789],
+                  [ -.203340000,  -.112170000,  0.003071,  .005584495],
+                  [ -.112170000,   .094990000,  0.004007,  .005689416],
+                  [  .094990000,   .245000000,  0.026198,  .003581428],
+                  [  .245000000,   .620500000,  0.009321,  .007716378],
+                  [  .620500000,  1.092000000,  0.000000,  .013500000],
+                  [ 1.092000000,  1.172000000,  0.006250,  .006675000],
+                  [ 1.172000000,  1.252000000,  0.100000, -.103200000],
+                  [ 1.252000000,  1.590000000,  0.000000,  .022000000],
+                  [ 1.590000000,  1.630000000,  0.025000, -.017750000],
+                  [ 1.630000000,  1.750000000,  0.100000, -.140000000],
+                  [ 1.750000000,  2.350000000,  0.000000,  .035000000],
+                  [ 2.350000000,  2.400000000,  0.100000, -.200000000],
+                  [ 2.400000000,  3.315000000,  0.000000,  .040000000] ]
+
+class ApertureProfile:
+    """
+    Piecewise linear aperture radius r(s) built from a breakpoint table. Every segment [start, end) carries
+    r = slope*s + offset; outside all segments the default radius is returned. Segments must not overlap.
+        -- start, end:    segment boundaries (S or rel_S, depending on how the profile is used)
+        -- slope, offset: linear coefficients per segment
+        -- default:       radius outside of all segments
+    """
+
+    def __init__( self, start, end, slope, offset, default = 0.040 ):
+
+        order = argsort( asarray( start, dtype = float ), kind = 'stable' )
+        self.start = asarray( start, dtype = float )[order]
+        self.end = asarray( end, dtype = float )[order]
+        self.slope = asarray( slope, dtype = float )[order]
+        self.offset = asarray( offset, dtype = float )[order]
+        self.default = default
+
+        # S - L of an element may be a rounding error below the S of the previous one
+        #
+        if ( self.start[1:] < self.end[:-1] - 1e-9 ).any(): raise ValueError( 'aperture segments overlap' )
+
+    def __len__( self ):
+        return len( self.start )
+
+    def __call__( self, s ):
+        """
+        Evaluate r(s) for a scalar or an array of positions in one searchsorted pass.
+        """
+        s = asarray( s, dtype = float )
+        i = searchsorted( self.start, s, side = 'right' ) - 1
+        inside = ( i >= 0 ) & ( s < self.end[ i.clip(0) ] )
+        i = i.clip(0)
+
+        return where( inside, self.slope[i]*s + self.offset[i], self.default )[()]
+
+    def override( self, start, end, r ):
+        """
+        New profile with constant radii r on the segments [start, end) (e.g. collimators). Existing segments are cut
+        back to the parts outside of the new ones.
+        """
+        from numpy import minimum, maximum
+
+        start, end, r = atleast_1d( start ), atleast_1d( end ), atleast_1d( r )
+        segStart, segEnd, slope, offset = self.start, self.end, self.slope, self.offset
+
+        # every override splits the segments into the parts before and after it; empty parts are dropped
+        #
+        for s0, s1 in zip( start, end ):
+            before = segStart, minimum( segEnd, s0 ), slope, offset
+            after = maximum( segStart, s1 ), segEnd, slope, offset
+            segStart, segEnd, slope, offset = [ concatenate( (b, a) ) for b, a in zip( before, after ) ]
+            keep = segEnd > segStart
+            segStart, segEnd, slope, offset = segStart[keep], segEnd[keep], slope[keep], offset[keep]
+
+        return ApertureProfile( concatenate( (segStart, start) ), concatenate( (segEnd, end) ),
+                                concatenate( (slope, 0*r) ), concatenate( (offset, r) ), self.default )
+
+    def to_file( self, fname ):
+        """
+        Write the breakpoint table (start end slope offset) to a text file.
+        """
+        savetxt( fname, column_stack( (self.start, self.end, self.slope, self.offset) ), header = 'default %.9f\nstart end slope offset' %self.default )
+
+    @classmethod
+    def from_file( cls, fname, default = None ):
+        """
+        Read a breakpoint table with columns start end slope offset ('#' comments; a '# default r' line sets the default).
+        """
+        if default is None:
+            default = 0.040
+            with open( fname ) as file:
+                for line in file:
+                    if line.startswith('# default'): default = float( line.split()[2] )
+
+        table = loadtxt( fname, ndmin = 2 )
+        return cls( table[:, 0], table[:, 1], table[:, 2], table[:, 3], default )
+
+    @classmethod
+    def from_twiss( cls, twiss, column = 'APER_1', relS = 0, default = 0.035 ):
+        """
+        Step profile from the twiss aperture column: every element with non-zero aperture and length
+        defines a segment [S - L, S) with constant radius.
+            -- twiss:   twiss frame (needs S, L and the aperture column)
+            -- column:  aperture column
+            -- relS:    build the profile in rel_S (IP in the center) instead of S
+            -- default: radius where the twiss gives no aperture
+        """
+        S = twiss.S.values; L = twiss.L.values; aper = twiss[column].values
+        withAper = ( aper > 0 ) & ( L > 0 )
+        end = S[withAper]; start = end - L[withAper]
+
+        if relS:
+            Lmax = S.max()
+            start, end = rel_s( start, Lmax ), rel_s( end, Lmax )
+
+            # element crossing the IP/ring end: keep the part after the IP
+            #
+            start = where( start > end, end - L[withAper], start )
+
+        return cls( start, end, 0*end, aper[withAper], default )
+
+    @classmethod
+    def from_gdml( cls, geomFile, twiss, base = None, relS = 0, lunit = 1e-3 ):
+        """
+        Profile with the collimator radii from a GDML geometry (as modified by Tools.collSet). The vacuum tube of a
+        collimator is the tube solid with the smallest rmax whose name contains the twiss name (with '.' -> '_').
+            -- geomFile: GDML file
+            -- twiss:    twiss frame giving S and L of the collimators
+            -- base:     profile used outside the collimators (default: from_twiss of the same twiss)
+            -- relS:     build the profile in rel_S
+            -- lunit:    length unit of the GDML values in [m] (mm by default)
+        """
+        if base is None: base = cls.from_twiss( twiss, relS = relS )
+
+        with open( geomFile ) as file: geometry = file.read()
+        tubes = re.findall( r'<tube[^>]*\bname="([^"]+)"[^>]*\brmax="([\d.eE+-]+)"', geometry )
+
+        colls = twiss[ twiss.NAME.astype( str ).str.startswith('COLL') ]
+        S = colls.S.values; L = colls.L.values
+        if relS: S = rel_s( S, twiss.S.max() )
+
+        start = []; end = []; radius = []
+        for name, s, l in zip( colls.NAME.astype( str ), S, L ):
+            key = name.replace( '.', '_' )
+            radii = [ float(rmax) for solid, rmax in tubes if key in solid ]
+            if radii == [] or l <= 0: continue
+            start.append( s - l ); end.append( s ); radius.append( min( radii )*lunit )
+
+        if start == []: return base
+        return base.override( start, end, radius )
+
+# profile of the FCC-ee interaction region as used by Tools.calcAper (rel_S, IP at 0)
+#
+fccIRProfile = ApertureProfile( *zip( *fccIRSegments ), default = 0.040 )
+
+# rules to invent apertures where the twiss has none (FCC-ee IR, design report/mechanical design), applied in order,
+# the first matching rule wins. Every rule is (smin, smax, bounds, name prefixes, only if APER_1 == 0, radius) where
+# bounds gives open/closed interval ends, prefixes = None matches all names and the radius is a number, 'aper' 
+# (keep APER_1) or 'coll' (collimator setting)
+#
+centralPipeRad = 0.015
+genericPipeRad = 0.035
+
+fccInventRules = [ (  0.0, 5.6, '[)', ('L000013', 'IP', 'SOL'), False, centralPipeRad ),
+                   (  0.0, 5.6, '[)', ('DRIFT',),               True,  centralPipeRad ),
+                   (  0.0, 5.6, '[)', None,                     False, 'aper' ),
+                   (  5.6, 8.2, '()', ('DRIFT',),               True,  0.02 ),
+                   (  5.6, 8.2, '()', None,                     False, 'aper' ),
+                   ( -8.2,-5.6, '()', ('DRIFT',),               True,  0.02 ),
+                   ( -8.2,-5.6, '()', None,                     False, 'aper' ),
+                   ( -5.6, 0.0, '(]', ('L000013', 'IP', 'SOL'), False, centralPipeRad ),
+                   ( -5.6, 0.0, '(]', ('DRIFT',),               True,  centralPipeRad ),
+                   ( -5.6, 0.0, '(]', None,                     False, 'aper' ),
+                   ( -inf, inf, '()', ('COLL',),                False, 'coll' ) ]
+
+def startsWith( names, prefixes ):
+    """
+    Vectorized str.startswith on a NAME column; for categoricals only the categories are tested.
+    """
+    if isinstance( names.dtype, CategoricalDtype ):
+        cats = asarray( names.cat.categories, dtype = str )
+        return startsWith( cats, prefixes )[ names.cat.codes.values ] & ( names.cat.codes.values >= 0 )
+
+    names = asarray( names, dtype = str )
+    mask = full( len(names), False )
+    for prefix in prefixes: mask |= char.startswith( names, prefix )
+
+    return mask
+
+def inventAperture( df, collAper, rules = fccInventRules, default = genericPipeRad, s = 'rel_S', aper = 'APER_1' ):
+    """
+    Column-wise version of Tools.inventAper: fill apertures for a whole twiss frame in one pass of vectorized masks.
+        -- df:       twiss frame (needs NAME, the position column s and the aperture column)
+        -- collAper: aperture set for collimators
+        -- rules:    rule table, see fccInventRules
+        -- default:  radius where no rule applies (generic beam pipe)
+        -- s:        position column the rule windows refer to
+
+    RETURNS: array of apertures
+    """
+    S = df[s].values; aperture = asarray( df[aper].values, dtype = float )
+    prefixMasks = {}
+
+    conditions = []; choices = []
+    for smin, smax, bounds, prefixes, zeroAper, radius in rules:
+        cond = ( S >= smin if bounds[0] == '[' else S > smin ) & ( S <= smax if bounds[1] == ']' else S < smax )
+        if prefixes is not None:
+            if prefixes not in prefixMasks: prefixMasks[prefixes] = startsWith( df.NAME, prefixes )
+            cond &= prefixMasks[prefixes]
+        if zeroAper: cond &= aperture == 0
+
+        conditions.append( cond )
+        if radius == 'aper': choices.append( aperture )
+        elif radius == 'coll': choices.append( full( len(S), float(collAper) ) )
+        else: choices.append( full( len(S), float(radius) ) )
+
+    return select( conditions, choices, default )
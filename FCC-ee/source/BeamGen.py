@@ -1,21 +1,28 @@
-from numpy import sqrt, genfromtxt, float32, array, pi, abs, cos, sin, random
+from numpy import sqrt, genfromtxt, float32, array, pi, abs, cos, sin, random, zeros, column_stack
 from matplotlib import pyplot as plt
-from CS_to_EU import FromNorm, RotY
+from CS_to_EU import FromNorm, RotY, FromNormArr, RotYArr
 from TfsTables import TfsReader
 from Tools import sbplSetUp, readTwissParams
+from TwissTable import asTwissTable
 
 class Beam:
     
-    def __init__(self, beamFile, strtElm, twiss, Emit, Npart, halfCross, pc, verbose = 0):
-        
+    def __init__(self, beamFile, strtElm, twiss, Emit, Npart, halfCross, pc, verbose = 0, seed = None):
+        """
+        Beam of Npart particles starting at strtElm
+            -- seed: seed or numpy Generator for all random numbers of the beam (None: fresh entropy)
+        """
+
         self.beamFile = beamFile
         self.strtElm = strtElm
         self.Emit = Emit
-        self.twiss = twiss
+        self.twiss = asTwissTable( twiss )
         self.Npart = int(Npart)
         self.verbose = verbose
         self.HalfCross = halfCross
         self.pc = pc
+        self.rng = random.default_rng( seed )
+        self.__gun = None
 
         self.Eb = sqrt(pc**2 - (511e-6)**2)
 
@@ -48,12 +55,25 @@ class Beam:
         
         return array( [float32(v_eu[0]), float32(v_eu[1]), float32(v_eu[2]) ] )
 
+    def gunSetup( self ):
+        """
+        Beam sizes, optics record at strtElm and v_EU, read once per beam and reused by every generate_BunchArr call.
+
+        RETURNS: beamsize [x, y], OpticsRecord, v_EU
+        """
+        if self.__gun is None:
+            beamsize = [ self.read_beam_size('x'), self.read_beam_size('y') ]
+            v_EU = genfromtxt( self.beamFile, delimiter = None, skip_header = 3, max_rows = 1 )[3:]
+            self.__gun = beamsize, self.twiss.record( self.strtElm ), v_EU
+
+        return self.__gun
+
     def set_pencil( self ):
 
         # maybe not required
         #
-        phi = random.uniform(0, 2*pi)
-        x = random.uniform(0,1)
+        phi = self.rng.uniform(0, 2*pi)
+        x = self.rng.uniform(0,1)
 
         # all centered at 0 
         #
@@ -74,16 +94,16 @@ class Beam:
         RETURNS: x,x' and y,y' in normalized coordinates
         """
         
-        from random import gauss
         from Tools import Gauss
 
-        phi = random.uniform(0, 2*pi)
-        x = random.uniform(0,6)
-        y = random.uniform(0,1)
+        phi = self.rng.uniform(0, 2*pi)
+        x = self.rng.uniform(0,6)
+        y = self.rng.uniform(0,1)
 
         print('Beam size not provided. Read from TWISS based on start element', self.strtElm )
-        sigmX = sqrt( self.twiss.loc[ self.twiss.NAME == self.strtElm,'BETX' ].values[0]*self.Emit[0] )
-        sigmY = sqrt( self.twiss.loc[ self.twiss.NAME == self.strtElm,'BETY' ].values[0]*self.Emit[1] )
+        optics = self.twiss.record( self.strtElm )
+        sigmX = sqrt( optics.BETX*self.Emit[0] )
+        sigmY = sqrt( optics.BETY*self.Emit[1] )
         beamsize = [sigmX, sigmY]
         
         val = Gauss(x)
@@ -111,7 +131,7 @@ class Beam:
         """
                     
         # phi = array([2*pi*i/self.Npart for i in range(self.Npart)])
-        phi = random.uniform(0,2*pi)
+        phi = self.rng.uniform(0,2*pi)
         
         # horizontal plane -- generate x,x'
         #
@@ -130,12 +150,12 @@ class Beam:
         from numpy import log
         from Tools import Gauss, tail
 
-        x = random.uniform(0,6)
-        y = random.uniform(0,1)
+        x = self.rng.uniform(0,6)
+        y = self.rng.uniform(0,1)
 
-        y1 = random.uniform(0,1)
-        y2 = random.uniform(0,1)
-        phi= random.uniform(0,2*pi)
+        y1 = self.rng.uniform(0,1)
+        y2 = self.rng.uniform(0,1)
+        phi= self.rng.uniform(0,2*pi)
 
         val = Gauss(x)        
         xval = beamsize[0]*tail(y1,y2, Nsig[0])
@@ -169,8 +189,8 @@ class Beam:
 
         # trafo from normalized CS to CS (at start element)
         #
-        FrmNrm = FromNorm( self.twiss.loc[self.twiss.NAME == self.strtElm,'BETX'].values[0], self.twiss.loc[self.twiss.NAME == self.strtElm,'BETY'].values[0], 
-                           self.twiss.loc[self.twiss.NAME == self.strtElm,'ALFX'].values[0], self.twiss.loc[self.twiss.NAME == self.strtElm,'ALFY'].values[0] )
+        optics = self.twiss.record( self.strtElm )
+        FrmNrm = FromNorm( optics.BETX, optics.BETY, optics.ALFX, optics.ALFY )
 
         if self.verbose: print('At', self.strtElm, '\nFromNorm = \n', FrmNrm)
 
@@ -215,9 +235,61 @@ class Beam:
 
         return posEU, dirEU
 
-    def gen_BeamEnergy(self, Edes, acceptance):
+    def generate_BunchArr( self, Type = 'pencil', Nsig = [10,10], seed = None ):
+        """
+        Array version of generate_Bunch: all Npart particles at once, gauss and tails by vectorized rejection.
+            -- Type: 'pencil', 'gauss', 'ring' or 'tails'
+            -- Nsig: radius of the ring/tail parameter in both planes
+            -- seed: seed or numpy Generator for the random numbers (None: the generator of the beam)
+
+        RETURNS: arrays posEU and dirEU (Npart,3)
+        """
+        from Tools import Gauss, tail
+
+        rng = self.rng if seed is None else random.default_rng( seed )
+
+        if self.verbose and self.strtElm: print( 'generating beam at', self.strtElm )
+
+        beamsize, optics, v_EU = self.gunSetup()
+
+        # amplitudes and phases in x,x' and y,y' (normalized), same distributions as set_pencil, set_gauss etc.
+        #
+        ampX = zeros( self.Npart ); ampY = zeros( self.Npart )
+        phi = rng.uniform( 0, 2*pi, self.Npart )
+
+        if Type == 'ring':
+            ampX[:] = abs(Nsig[0])*beamsize[0]; ampY[:] = abs(Nsig[1])*beamsize[1]
+
+        elif Type in ['gauss', 'tails']:
+            filled = 0
+            while filled < self.Npart:
+                n = self.Npart - filled
+                x = rng.uniform( 0, 6, n ); y = rng.uniform( 0, 1, n )
+                accept = y < Gauss(x)
+
+                if Type == 'gauss':
+                    ampX[ filled : filled + accept.sum() ] = beamsize[0]*x[accept]
+                    ampY[ filled : filled + accept.sum() ] = beamsize[1]*x[accept]
+                else:
+                    y1, y2 = rng.uniform( 0, 1, (2, n) )[:, accept]
+                    ampX[ filled : filled + accept.sum() ] = beamsize[0]*tail( y1, y2, Nsig[0] )
+                    ampY[ filled : filled + accept.sum() ] = beamsize[1]*tail( y1, y2, Nsig[1] )
+
+                filled += accept.sum()
+
+        in_n_CS = zeros( (self.Npart, 6) )
+        in_n_CS[:, 0], in_n_CS[:, 1] = ampX*cos(phi), ampX*sin(phi)
+        in_n_CS[:, 2], in_n_CS[:, 3] = ampY*cos(phi), ampY*sin(phi)
+
+        # trafo v_n_CS to v_CS and rot to EU
+        #
+        inCS = FromNormArr( optics.BETX, optics.BETY, optics.ALFX, optics.ALFY, in_n_CS )
+        posCS = column_stack( (inCS[:, 0], inCS[:, 2], inCS[:, 4]) )
+        dirCS = column_stack( (inCS[:, 1], inCS[:, 3], sqrt(1 - inCS[:, 1]**2 - inCS[:, 3]**2)) )
 
-        from random import gauss
+        return RotYArr( -self.HalfCross, posCS ) + v_EU, RotYArr( -self.HalfCross, dirCS )
+
+    def gen_BeamEnergy(self, Edes, acceptance):
         """
         Function to generate the beam energy according to a Gaussian distribution.
             -- Edes:        design energy
@@ -226,7 +298,15 @@ class Beam:
         RETURNS: array of beam energies of length Npart
         """
 
-        return array([ gauss(Edes, acceptance) for i in range(self.Npart) ] )
+        return array([ self.rng.normal(Edes, acceptance) for i in range(self.Npart) ] )
+
+    def gen_BeamEnergyArr( self, Edes, acceptance, seed = None ):
+        """
+        Array version of gen_BeamEnergy, drawn with a numpy Generator
+            -- seed: seed or numpy Generator for the random numbers (None: the generator of the beam)
+        """
+        rng = self.rng if seed is None else random.default_rng( seed )
+        return rng.normal( Edes, acceptance, self.Npart )
 
     def gen_BeamMom( self, elm ):
         """
@@ -235,20 +315,16 @@ class Beam:
 
         RETURNS: array of single dir_EU
         """
-        # new way wiso implemewist: hard coded with line number for respective element.
-        #
-        # lineNumber =  readTwissParams( self.twiss, elm )
-        # twissParam = genfromtxt( self.twiss, delimiter = None, skip_header = lineNumber, max_rows = 1 )
-        # betx, alfx, bety, alfy = twissParam[3], twissParam[4], twissParam[6], twissParam[7]
-        FrmNrm = FromNorm( self.twiss.loc[self.twiss.NAME == elm,'BETX'].values[0], self.twiss.loc[self.twiss.NAME == elm,'BETY'].values[0], 
-                           self.twiss.loc[self.twiss.NAME == elm,'ALFX'].values[0], self.twiss.loc[self.twiss.NAME == elm,'ALFY'].values[0] )
+        optics = self.twiss.record( elm )
+        FrmNrm = FromNorm( optics.BETX, optics.BETY, optics.ALFX, optics.ALFY )
         print('FromNorm(', elm, ') = \n', FrmNrm)
 
-        vecsNCS = array( [array([self.BeamVecX[i], self.BeamVecXprim[i], self.BeamVecY[i], self.BeamVecYprim[i], 0, 0]) for i in range(self.Npart) ] )
+        vecsNCS = zeros( (self.Npart, 6) )
+        vecsNCS[:, 0], vecsNCS[:, 1], vecsNCS[:, 2], vecsNCS[:, 3] = self.BeamVecX, self.BeamVecXprim, self.BeamVecY, self.BeamVecYprim
         
-        vecsCS = array([ FrmNrm @ vec for vec in vecsNCS ] )
-        dirsCS = array([[vec[0], vec[2], sqrt(1 - vec[0]**2 - vec[2]**2)] for vec in vecsCS ] )
-        dirsEU = array([ RotY(self.HalfCross, dirCS) for dirCS in dirsCS ] )
+        vecsCS = FromNormArr( optics.BETX, optics.BETY, optics.ALFX, optics.ALFY, vecsNCS )
+        dirsCS = column_stack( (vecsCS[:, 0], vecsCS[:, 2], sqrt(1 - vecsCS[:, 0]**2 - vecsCS[:, 2]**2)) )
+        dirsEU = RotYArr( self.HalfCross, dirsCS )
 
         return dirsEU, vecsCS
             
\ No newline at end of file
@@ -1,4 +1,4 @@
-from numpy import cos, sin, array, sqrt, arcsin, arccos, identity
+from numpy import cos, sin, array, sqrt, arcsin, arccos, identity, asarray, empty_like
 # class Twiss_utils:
 
 #     """
@@ -85,60 +85,131 @@ def getRotVec3(vec, verbose = 0):
     return theta, phi
 
 
-def ToEuclidian( df, verbose = 1 ):
+# array versions of the transformations above: angles/twiss parameters are scalars or one value per particle, the
+# transformation is applied to (N,3), (N,4) or (N,6) arrays directly, without building N matrices
+#
+def RotYArr( theta, vecs ):
+    """
+    RotY for many vectors
+      -- theta: rotation angle, scalar or array (N)
+      -- vecs:  array of three-vectors (N,3)
+    """
+    vecs = asarray( vecs, dtype = float )
+    c, s = cos(theta), sin(theta)
+    out = empty_like( vecs )
+    out[:, 0] = c*vecs[:, 0] + s*vecs[:, 2]
+    out[:, 1] = vecs[:, 1]
+    out[:, 2] = -s*vecs[:, 0] + c*vecs[:, 2]
+
+    return out
+
+def FromNormArr( betx, bety, alfx, alfy, vecs ):
+    """
+    FromNorm for many vectors
+      -- betx,y, alfx,y: twiss parameters, scalars or arrays (N)
+      -- vecs:           normalized coordinates (N,6)
+    """
+    vecs = asarray( vecs, dtype = float )
+    out = vecs.copy()
+    out[:, 0] = sqrt(betx)*vecs[:, 0]
+    out[:, 1] = (-alfx/sqrt(betx))*vecs[:, 0] + (1/sqrt(betx))*vecs[:, 1]
+    out[:, 2] = sqrt(bety)*vecs[:, 2]
+    out[:, 3] = (-alfy/sqrt(bety))*vecs[:, 2] + (1/sqrt(bety))*vecs[:, 3]
+
+    return out
+
+def RotFrmZArr( theta, phi, vecs ):
+    """
+    RotFrmZ for many four-vectors
+      -- theta, phi: angles, scalars or arrays (N)
+      -- vecs:       four-vectors (N,4)
+    """
+    vecs = asarray( vecs, dtype = float )
+    ct, st, cp, sp = cos(theta), sin(theta), cos(phi), sin(phi)
+    out = empty_like( vecs )
+    out[:, 0] = vecs[:, 0]
+    out[:, 1] = ct*cp*vecs[:, 1] - sp*vecs[:, 2] + cp*st*vecs[:, 3]
+    out[:, 2] = ct*sp*vecs[:, 1] + cp*vecs[:, 2] + st*sp*vecs[:, 3]
+    out[:, 3] = -st*vecs[:, 1] + ct*vecs[:, 3]
+
+    return out
+
+def RotToZArr( theta, phi, vecs ):
+    """
+    RotToZ for many four-vectors (inverse of RotFrmZArr)
+      -- theta, phi: angles, scalars or arrays (N)
+      -- vecs:       four-vectors (N,4)
+    """
+    vecs = asarray( vecs, dtype = float )
+    ct, st, cp, sp = cos(theta), sin(theta), cos(phi), sin(phi)
+    out = empty_like( vecs )
+    out[:, 0] = vecs[:, 0]
+    out[:, 1] = ct*cp*vecs[:, 1] + ct*sp*vecs[:, 2] - st*vecs[:, 3]
+    out[:, 2] = -sp*vecs[:, 1] + cp*vecs[:, 2]
+    out[:, 3] = cp*st*vecs[:, 1] + st*sp*vecs[:, 2] + ct*vecs[:, 3]
+
+    return out
+
+def getRotVec3Arr( vecs ):
+    """
+    getRotVec3 for many unit three-vectors (N,3), same conventions (theta from z, phi from arcsin)
+
+    RETURNS: arrays theta, phi
+    """
+    vecs = asarray( vecs, dtype = float )
+    theta = arccos( vecs[:, 2] )
+    phi = arcsin( vecs[:, 1]/sin(theta) )
+
+    return theta, phi
+
+def ToEuclidian( df, verbose = 0 ):
     """
     Function to calculate survey coordinates (EU) from TWISS S, X, Y
       -- df: data frame
       -- verbose: debug output level
 
-    RETURN: none, adds x_EU, y_EU, z_EU and rotation matrix W to DF
+    All bends rotate around the y axis, so the rotation after element i is W_i = RotY(-theta_i) with theta_i the
+    cumulative bending angle, and the position is the prefix sum of the element chords R_i rotated by W_(i-1):
+        V_i = V_(i-1) + W_(i-1) R_i
+    Both are computed with cumsum over the whole lattice instead of a loop over elements. Elements with L = 0 or
+    ANGLE = 0 are straight; the first row is the start point (W = 1, V = 0).
+
+    RETURN: array of rotation matrices W, shape (N, 3, 3); adds x_EU, y_EU, z_EU and W (views into that array) to DF
     """
-    
-    # init arrays to store rotation matrix and V
+    from numpy import asarray, where, cumsum, concatenate, zeros, divide
+
+    L = asarray( df['L'].values, dtype = float )
+    angle = asarray( df['ANGLE'].values, dtype = float )
+    n = len(L)
+
+    # element chords in the local frame: (0, 0, L) for straight elements, rho*(cos(angle) - 1, 0, sin(angle)) for bends
     #
-    W0 = identity(3); mats = [W0]
-    V0 = array( [0, 0, 0] ); vecs = [V0]
+    bend = ( L != 0 ) & ( angle != 0 )
+    bend[:1] = False
+    rho = divide( L, angle, out = zeros( n ), where = bend )
+    Rx = where( bend, rho*( cos(angle) - 1 ), 0. )
+    Rz = where( bend, rho*sin(angle), L )
 
-    for i in range( df.index.min() + 1, df.index.max() + 1 ):
-        
-        # collect element attributes
-        #
-        L = df.loc[i, 'L']
-        angle = df.loc[i, 'ANGLE']
-        name = df.loc[i, 'NAME']
-        
-        # straight element
-        #
-        if L == 0 or angle == 0:
-            if verbose: print('straight element', name)
-            R = array( [0, 0, L] )
-            if i == df.index.min(): W = W0
-            else: 
-                W = mats[i-1]
-                if verbose: print( 'current %i' %i, 'where W =', W )
-
-        # bend
-        #
-        else:
-            if verbose: print( 'dipole', name, 'length', L, 'angle =', angle )
-            rho = L/angle
-            R = array( [rho*(cos(angle) - 1), 0, rho*sin(angle)] )
-            S = RotY(-angle, W0)
-            W = mats[i-1]@S
-            if verbose: print( 'W%i =' %i, W )
-        
-        # calculate EU coords for current element (shift and rotation)
-        #
-        V = mats[i-1]@R + vecs[i-1]
-        if verbose: print('transformed vector V =', V, '\n ---------------- ')
-            
-        # append rotation matrix and position for next iteration
-        #
-        mats.append(W)
-        vecs.append(V)
-
-    df['x_EU'] = [vec[0] for vec in vecs]
-    df['y_EU'] = [vec[1] for vec in vecs]
-    df['z_EU'] = [vec[2] for vec in vecs]
-    df['W'] = mats
-    
+    # cumulative bending angle after each element and rotation of the frame at its entry
+    #
+    theta = cumsum( where( bend, angle, 0. ) )
+    cosIn = cos( theta[:-1] ); sinIn = sin( theta[:-1] )
+
+    # RotY(-theta) @ (Rx, 0, Rz), summed up along the lattice
+    #
+    x = concatenate( ( [0.], cumsum( cosIn*Rx[1:] - sinIn*Rz[1:] ) ) )
+    z = concatenate( ( [0.], cumsum( sinIn*Rx[1:] + cosIn*Rz[1:] ) ) )
+
+    W = zeros( (n, 3, 3) )
+    W[:, 0, 0] = cos(theta); W[:, 0, 2] = -sin(theta)
+    W[:, 1, 1] = 1
+    W[:, 2, 0] = sin(theta); W[:, 2, 2] = cos(theta)
+
+    if verbose: print( 'ToEuclidian:', n, 'elements,', bend.sum(), 'bends, total angle =', theta[-1] )
+
+    df['x_EU'] = x
+    df['y_EU'] = zeros( n )
+    df['z_EU'] = z
+    df['W'] = list( W )
+
+    return W
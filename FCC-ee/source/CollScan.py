@@ -0,0 +1,105 @@
+import re
+from os import path, makedirs
+from concurrent.futures import ThreadPoolExecutor
+
+# attribute substitutions used for collimator settings in the GDML (same patterns as Tools.collSet)
+#
+patterns = { attr: re.compile( attr + r'="\d+.\d+"' ) for attr in ['rmax', 'rmax1', 'rmax2'] }
+
+class CollimatorScan:
+    """
+    Generate GDML geometry variants for collimator aperture scans. The GDML is read and indexed once: for every
+    collimator the solid lines to change are located (vacuum and material TUBE of the collimator, the neighbouring
+    CONE sections of the drifts). Variants then only substitute these lines.
+    ! Needs to have geometry with collimator closed a bit to have CONE - TUBE - CONE section !
+        -- geomFile:  GDML geometry to work on
+        -- collNames: collimators to index
+        -- verbose:   info-output level
+    """
+
+    def __init__( self, geomFile, collNames, verbose = 0 ):
+
+        self.geomFile = geomFile
+        self.verbose = verbose
+
+        with open( geomFile, "r" ) as sources: self.lines = sources.readlines()
+
+        self.edits = { collName: self.__index( collName ) for collName in collNames }
+
+    def __index( self, collName ):
+        """
+        Find the lines to change for one collimator. Returns a list of (line number, attribute, add thickness).
+        """
+        lines = self.lines; n = len(lines)
+        hits = [ i for i, line in enumerate( lines ) if collName in line ]
+        if hits == []: raise KeyError( 'collimator %s not found in %s' %(collName, self.geomFile) )
+
+        hitSet = set( hits )
+        has = lambda j: 0 <= j < n and j in hitSet
+
+        # candidate lines around every occurrence, rules checked in the same order as in Tools.collSet
+        #
+        edits = []
+        for i in sorted({ i + d for i in hits for d in range(-3, 3) if 0 <= i + d < n }):
+            line = lines[i]
+            if i in hitSet:                      edits.append( (i, 'rmax', 0, 'collimator (vac)') )
+            elif 'COLL' in line and has(i + 1):  edits.append( (i, 'rmax', 1, 'collimator (mat)') )
+            elif 'DRIFT' in line and has(i + 2): edits.append( (i, 'rmax2', 0, 'drift (vac) with collimator') )
+            elif 'DRIFT' in line and has(i + 3): edits.append( (i, 'rmax2', 1, 'drift (mat) with collimator') )
+            elif 'DRIFT' in line and has(i - 1): edits.append( (i, 'rmax1', 1, 'drift (mat) with collimator') )
+            elif 'DRIFT' in line and has(i - 2): edits.append( (i, 'rmax1', 0, 'drift (vac) with collimator') )
+
+        if self.verbose:
+            for i, attr, thick, what in edits: print( collName, ':', what, 'at lines[', i, '] ->', attr )
+
+        return [ (i, attr, thick) for i, attr, thick, what in edits ]
+
+    def variant( self, settings ):
+        """
+        Lines of one geometry variant.
+            -- settings: list of (collName, collh, thickness); collh is the aperture, thickness the beam pipe thickness (material)
+        """
+        lines = list( self.lines )
+        for collName, collh, thickness in settings:
+            for i, attr, thick in self.edits[collName]:
+                lines[i] = patterns[attr].sub( '%s="%s"' %(attr, str(collh + thick*thickness)), lines[i] )
+
+        return lines
+
+    def write( self, fname, settings ):
+        """
+        Write one variant to fname.
+        """
+        with open( fname, "w" ) as sources: sources.writelines( self.variant( settings ) )
+        if self.verbose > 1: print( 'written', fname )
+
+        return fname
+
+    def scan( self, grid, outDir, nameTemplate = '{stem}_{collName}_{collh}_{thickness}.gdml', threads = 8 ):
+        """
+        Emit one GDML file per grid point, written in parallel.
+            -- grid:         list of settings; a setting is (collName, collh, thickness) or a list of those for several collimators
+            -- outDir:       output directory
+            -- nameTemplate: file name pattern; stem, collName, collh and thickness refer to the first collimator of a setting
+            -- threads:      number of writer threads
+
+        RETURNS: list of written files
+        """
+        makedirs( outDir, exist_ok = True )
+        stem = path.splitext( path.basename( self.geomFile ) )[0]
+
+        jobs = []
+        for setting in grid:
+            settings = [setting] if isinstance( setting[0], str ) else list( setting )
+            collName, collh, thickness = settings[0]
+            fname = path.join( outDir, nameTemplate.format( stem = stem, collName = collName, collh = collh, thickness = thickness ) )
+            jobs.append( (fname, settings) )
+
+        if len( set( fname for fname, settings in jobs ) ) != len(jobs): raise ValueError( 'file names of the variants are not unique, adjust nameTemplate' )
+
+        with ThreadPoolExecutor( max_workers = threads ) as pool:
+            files = list( pool.map( lambda job: self.write( *job ), jobs ) )
+
+        if self.verbose: print( 'written', len(files), 'geometry variants to', outDir )
+
+        return files
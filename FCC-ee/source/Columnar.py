@@ -0,0 +1,214 @@
+import json
+from os import makedirs, path, remove
+from numpy import save, load, asarray, stack, ascontiguousarray, dtype
+from pandas import DataFrame, Series, Categorical, CategoricalDtype
+
+# simple columnar storage in .npy files plus a json file describing the frame. Numeric columns of the same
+# dtype are stored together as one (ncols, nrows) block, such that loading can memory-map them without copies
+#
+def save_frame( directory, df, meta = {} ):
+    """
+    Store a data frame in columnar .npy files.
+        -- directory: target directory (created if needed)
+        -- df:        frame to store; numeric, string, categorical and array-valued (e.g. W) columns are supported
+        -- meta:      additional json-serialisable information stored next to the columns
+
+    RETURNS: number of bytes written
+    """
+    makedirs( directory, exist_ok = True )
+    columns = []; blocks = {}; arrays = {}
+
+    for i, name in enumerate( df.columns ):
+        col = df[name]
+        base = 'c%03i' %i
+
+        if isinstance( col.dtype, CategoricalDtype ):
+            columns.append( [name, 'category', base] )
+            arrays[base + '.codes'] = col.cat.codes.values
+            arrays[base + '.cats'] = asarray( col.cat.categories, dtype = str )
+        elif col.dtype.kind in 'biuf':
+            block = 'block_' + col.dtype.name
+            blocks.setdefault( block, [] ).append( col.values )
+            columns.append( [name, 'numeric', block, len(blocks[block]) - 1] )
+        elif len(col) and hasattr( col.iloc[0], 'shape' ):
+            columns.append( [name, 'array', base] )
+            arrays[base] = stack( col.values )
+        else:
+            columns.append( [name, 'string', base] )
+            arrays[base] = asarray( col.values, dtype = str )
+
+    for block, cols in blocks.items(): arrays[block] = stack( cols )
+
+    nbytes = 0
+    for name, array in arrays.items():
+        save( path.join( directory, name + '.npy' ), array )
+        nbytes += array.nbytes
+
+    with open( path.join( directory, 'frame.json' ), 'w' ) as file:
+        json.dump( dict( meta, columns = columns, rows = len(df) ), file )
+
+    return nbytes
+
+def load_meta( directory ):
+    """
+    Read the json description of a stored frame.
+    """
+    with open( path.join( directory, 'frame.json' ) ) as file:
+        return json.load( file )
+
+def load_frame( directory, columns = None, mmap = 'c' ):
+    """
+    Load a frame written by save_frame.
+        -- directory: directory holding the columns
+        -- columns:   optional list of columns to load (default: all)
+        -- mmap:      numpy mmap_mode for the numeric blocks; 'c' (default) maps them copy-on-write, None reads them into memory
+
+    RETURNS: data frame and the stored meta information
+    """
+    meta = load_meta( directory )
+    selected = [ col for col in meta['columns'] if columns is None or col[0] in columns ]
+
+    # numeric columns: wrap the (ncols, nrows) blocks without copying
+    #
+    parts = []
+    for block in sorted({ col[2] for col in selected if col[1] == 'numeric' }):
+        array = load( path.join( directory, block + '.npy' ), mmap_mode = mmap )
+        rows = [ col[3] for col in selected if col[2] == block ]
+        if rows != list( range( len(array) ) ): array = array[rows]
+        parts.append( DataFrame( array.T, columns = [ col[0] for col in selected if col[2] == block ], copy = False ) )
+
+    df = parts[0] if len(parts) == 1 else DataFrame( index = range( meta['rows'] ) )
+    if len(parts) > 1:
+        for part in parts: df[part.columns] = part
+
+    for col in selected:
+        name, kind = col[0], col[1]
+        if kind == 'numeric': continue
+        base = path.join( directory, col[2] )
+
+        if kind == 'category':
+            df[name] = Categorical.from_codes( load( base + '.codes.npy' ), load( base + '.cats.npy' ), validate = False )
+        elif kind == 'column':
+            df[name] = load( base + '.npy', mmap_mode = mmap )
+        elif kind == 'array':
+            df[name] = list( load( base + '.npy', mmap_mode = mmap ) )
+        else:
+            df[name] = Series( load( base + '.npy' ).tolist(), dtype = object )
+
+    return df[[ col[0] for col in selected ]], meta
+
+def load_column( directory, name, mmap = 'r' ):
+    """
+    Memory-map a single numeric column of a stored frame without building a data frame.
+    """
+    meta = load_meta( directory )
+    found = [ col for col in meta['columns'] if col[0] == name ]
+    if not found: raise KeyError( 'column %s not in %s, stored columns: %s' %( name, directory, [ col[0] for col in meta['columns'] ] ) )
+
+    col = found[0]
+    array = load( path.join( directory, col[2] + '.npy' ), mmap_mode = mmap )
+
+    return array[ col[3] ] if col[1] == 'numeric' else array
+
+def concat_frames( directories, directory, chunk = 1000000, meta = {} ):
+    """
+    Concatenate the numeric columns of several stored frames (same columns) into one ColumnWriter output, copied
+    chunk-wise through memory maps.
+        -- directories: stored frames, in output order; empty frames (e.g. from a ColumnWriter without rows) are skipped
+        -- directory:   target directory
+        -- chunk:       rows per copy
+
+    RETURNS: number of rows written
+    """
+    sources = [ ( source, load_meta( source ) ) for source in directories ]
+    sources = [ ( source, info ) for source, info in sources if info['rows'] > 0 ]
+
+    with ColumnWriter( directory, meta ) as writer:
+        if not sources: return 0
+        names = [ col[0] for col in sources[0][1]['columns'] ]
+
+        for source, sourceMeta in sources:
+            columns = { name: load_column( source, name ) for name in names }
+            for start in range( 0, sourceMeta['rows'], chunk ):
+                writer.append({ name: col[ start : start + chunk ] for name, col in columns.items() })
+
+    return writer.rows
+
+class ColumnWriter:
+    """
+    Columnar output written incrementally: every numeric column is one .npy file that chunks are appended to, the
+    header is fixed (rewritten with the final length on close). Memory use is that of one chunk, independent of the
+    total number of rows; the result is read with load_frame like a frame stored by save_frame.
+        -- directory: target directory (created if needed)
+        -- meta:      additional json-serialisable information stored next to the columns
+    """
+    headerSize = 128
+
+    def __init__( self, directory, meta = {} ):
+        makedirs( directory, exist_ok = True )
+        # the output only becomes readable (frame.json) once close succeeded
+        #
+        if path.isfile( path.join( directory, 'frame.json' ) ): remove( path.join( directory, 'frame.json' ) )
+        self.directory = directory
+        self.meta = meta
+        self.files = {}; self.dtypes = {}
+        self.rows = 0; self.closed = False
+
+    def __header( self, name ):
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%i,), }" %(self.dtypes[name].str, self.rows)
+        header = b'\x93NUMPY\x01\x00' + ( self.headerSize - 10 ).to_bytes( 2, 'little' ) + header.encode( 'latin1' )
+
+        return header + b' '*( self.headerSize - 1 - len(header) ) + b'\n'
+
+    def append( self, columns ):
+        """
+        Append a chunk of rows.
+            -- columns: dict (or frame) of equally long 1d numeric arrays; the first chunk defines names and dtypes
+        """
+        columns = { name: ascontiguousarray( columns[name] ) for name in columns }
+        n = { len(col) for col in columns.values() }
+        if len(n) != 1: raise ValueError( 'ColumnWriter: columns of different length ' + str(n) )
+
+        if not self.files:
+            for i, name in enumerate( columns ):
+                self.dtypes[name] = dtype( columns[name].dtype )
+                self.files[name] = open( path.join( self.directory, 'c%03i.npy' %i ), 'wb' )
+                self.files[name].write( self.__header( name ) )
+        elif list( columns ) != list( self.files ):
+            raise ValueError( 'ColumnWriter: expected columns ' + str( list( self.files ) ) )
+
+        for name, col in columns.items():
+            self.files[name].write( col.astype( self.dtypes[name], copy = False ).data )
+        self.rows += n.pop()
+
+    def close( self ):
+        """
+        Write the final headers and the json description.
+
+        RETURNS: number of rows written
+        """
+        columns = []
+        for i, ( name, file ) in enumerate( self.files.items() ):
+            file.seek( 0 ); file.write( self.__header( name ) ); file.close()
+            columns.append( [name, 'column', 'c%03i' %i] )
+        self.closed = True
+
+        with open( path.join( self.directory, 'frame.json' ), 'w' ) as file:
+            json.dump( dict( self.meta, columns = columns, rows = self.rows ), file )
+
+        return self.rows
+
+    def abort( self ):
+        """
+        Close the column files without writing the json description, such that load_frame rejects the incomplete output.
+        """
+        for file in self.files.values(): file.close()
+        self.closed = True
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        if self.closed: return
+        if args[0] is None: self.close()
+        else: self.abort()
@@ -0,0 +1,156 @@
+from numpy import asarray, stack, zeros, where, sin, cos, arctan2, ceil, repeat, arange, concatenate, einsum, divide, argmin, take_along_axis, maximum, empty, unique
+from pandas import DataFrame, Categorical
+from scipy.spatial import cKDTree
+
+class CurvilinearMap:
+    """
+    Inverse of the survey: Euclidean hit positions (e.g. Geant4 x_eu, y_eu, z_eu) to the curvilinear frame (s, x, y)
+    of the reference orbit. The reference path of every element with L > 0 is sampled and put in a k-d tree; a hit is
+    compared to the elements of its nearest samples and their neighbours and projected into the local frame of the
+    best one (straight line for drifts/quadrupoles, arc for bends, rolled by TILT).
+        -- survey:  frame from Survey.survey (X, Y, Z, attrs['W']) or a twiss frame after ToEuclidian (x_EU, y_EU, z_EU, W);
+                    needs S, L and ANGLE, TILT is used if present
+        -- step:    sampling distance along the reference path [m]
+        -- verbose: choose verbosity level
+    """
+
+    def __init__( self, survey, step = 1.0, verbose = 0 ):
+
+        self.verbose = verbose
+
+        # a twiss frame also has an X column (orbit), so look for the ToEuclidian columns first
+        #
+        if 'x_EU' in survey:
+            P = survey[['x_EU', 'y_EU', 'z_EU']].values.astype( float )
+            W = stack( survey.W.values )
+        elif 'Z' in survey and 'W' in survey.attrs:
+            P = survey[['X', 'Y', 'Z']].values.astype( float )
+            W = asarray( survey.attrs['W'] )
+        else:
+            raise ValueError( 'CurvilinearMap: need a frame from Survey.survey (X, Y, Z, attrs W) or after ToEuclidian (x_EU, y_EU, z_EU, W)' )
+
+        L = asarray( survey.L.values, dtype = float )
+        angle = asarray( survey.ANGLE.values, dtype = float )
+        tilt = asarray( survey.TILT.values, dtype = float ) if 'TILT' in survey else zeros( len(L) )
+        self.names, self.nameCodes = unique( asarray( survey.NAME.values, dtype = str ), return_inverse = True )
+
+        # elements with a length, described from their entry (= exit of the previous row)
+        #
+        rows = ( L > 0 ).nonzero()[0]
+        rows = rows[ rows > 0 ]
+        self.rows = rows
+        self.Pin = P[rows - 1]; self.Win = W[rows - 1]
+        self.L = L[rows]; self.Sin = asarray( survey.S.values, dtype = float )[rows] - self.L
+        self.rho = divide( self.L, angle[rows], out = zeros( len(rows) ), where = angle[rows] != 0 )
+        self.cosTilt = cos( tilt[rows] ); self.sinTilt = sin( tilt[rows] )
+
+        # sample the reference path, every sample knows its element
+        #
+        nSamples = ceil( self.L/step ).astype( int ) + 1
+        self.owner = repeat( arange( len(rows) ), nSamples )
+        first = concatenate( ( [0], nSamples.cumsum()[:-1] ) )
+        frac = ( arange( len(self.owner) ) - first[self.owner] )/( nSamples[self.owner] - 1 )
+        self.tree = cKDTree( self.path( self.owner, frac*self.L[self.owner] ) )
+
+        if verbose: print( 'CurvilinearMap:', len(rows), 'elements,', len(self.owner), 'path samples' )
+
+    def path( self, elements, ds ):
+        """
+        Euclidean position of the reference orbit at distance ds from the entry of the elements (indices into self.rows).
+        """
+        rho = self.rho[elements]
+        bend = rho != 0
+        phi = divide( ds, rho, out = zeros( len(ds) ), where = bend )
+        dx = where( bend, rho*( cos(phi) - 1 ), 0. )
+        dz = where( bend, rho*sin(phi), ds )
+
+        local = stack( ( self.cosTilt[elements]*dx, self.sinTilt[elements]*dx, dz ), axis = -1 )
+
+        return self.Pin[elements] + einsum( 'nij,nj->ni', self.Win[elements], local )
+
+    def local( self, hits, elements ):
+        """
+        Local coordinates of hits in the frame of the given elements (same shapes, broadcast over the last axis of elements).
+
+        RETURNS: ds (distance from the element entry along the orbit), x, y
+        """
+        d = hits[:, None, :] - self.Pin[elements]
+        q = einsum( 'mkji,mkj->mki', self.Win[elements], d )
+
+        # undo the roll of the bend plane, then project onto the arc around the bend center (-rho, 0, 0)
+        #
+        ct, st, rho = self.cosTilt[elements], self.sinTilt[elements], self.rho[elements]
+        qx = ct*q[..., 0] + st*q[..., 1]
+        qy = -st*q[..., 0] + ct*q[..., 1]
+
+        bend = rho != 0
+        safe = where( bend, rho, 1. )
+        dx = qx + rho
+        phi = arctan2( q[..., 2]/safe, dx/safe )
+        bx = dx*cos(phi) + q[..., 2]*sin(phi) - rho
+
+        ds = where( bend, rho*phi, q[..., 2] )
+        x = where( bend, ct*bx - st*qy, q[..., 0] )
+        y = where( bend, st*bx + ct*qy, q[..., 1] )
+
+        return ds, x, y
+
+    def transform( self, hits, k = 1, chunk = 1000000 ):
+        """
+        Curvilinear coordinates of hits, processed in chunks.
+            -- hits:  array (N, 3) of Euclidean positions, same units as the survey
+            -- k:     number of nearest path samples whose elements (and their neighbours) are candidates
+            -- chunk: hits per chunk (memory ~ chunk*k*100 bytes)
+
+        RETURNS: frame with s, x, y, row (row of the element in the survey frame) and NAME
+        """
+        hits = asarray( hits, dtype = float )
+        n = len(hits); last = len(self.rows) - 1
+        result = { col: empty( n ) for col in ['s', 'x', 'y'] }
+        result['row'] = empty( n, dtype = int )
+
+        for start in range( 0, n, chunk ):
+            part = hits[ start : start + chunk ]
+            idx = self.tree.query( part, k = k, workers = -1 )[1].reshape( len(part), -1 )
+            owner = self.owner[idx]
+            cand = concatenate( ( owner, ( owner - 1 ).clip( 0 ), ( owner + 1 ).clip( max = last ) ), axis = 1 )
+
+            ds, x, y = self.local( part, cand )
+
+            # best candidate: smallest distance to the reference orbit, counting the distance outside the element ends
+            #
+            outside = maximum( maximum( -ds, ds - self.L[cand] ), 0 )
+            best = argmin( x**2 + y**2 + outside**2, axis = 1 )[:, None]
+            elements = take_along_axis( cand, best, axis = 1 )[:, 0]
+
+            end = start + len(part)
+            result['s'][start:end] = self.Sin[elements] + take_along_axis( ds, best, axis = 1 )[:, 0]
+            result['x'][start:end] = take_along_axis( x, best, axis = 1 )[:, 0]
+            result['y'][start:end] = take_along_axis( y, best, axis = 1 )[:, 0]
+            result['row'][start:end] = self.rows[elements]
+
+            if self.verbose > 1: print( 'transformed hits', start, 'to', end )
+
+        result = DataFrame( result )
+        result['NAME'] = Categorical.from_codes( self.nameCodes[ result.row.values ], self.names )
+
+        if self.verbose: print( 'transformed', n, 'hits' )
+
+        return result
+
+    def add_columns( self, df, columns = ['x_eu', 'y_eu', 'z_eu'], lunit = 1.0, **kwargs ):
+        """
+        Add s, x_cs, y_cs and element (NAME) to a frame of hits, e.g. a Geant4 ntuple.
+            -- df:      hit frame
+            -- columns: Euclidean position columns
+            -- lunit:   length unit of the hit columns in units of the survey (e.g. 1e-3 for mm hits and a survey in m);
+                        s, x_cs, y_cs are returned in the units of the hits
+            -- kwargs:  passed on to transform (k, chunk)
+        """
+        curvi = self.transform( df[columns].values*lunit, **kwargs )
+        df['s'] = curvi.s.values/lunit
+        df['x_cs'] = curvi.x.values/lunit
+        df['y_cs'] = curvi.y.values/lunit
+        df['element'] = curvi.NAME.values
+
+        return df
@@ -1,13 +1,26 @@
 from numpy import exp, random, log, sqrt, asarray
-import random as rnd
 
-def genPlanck( stats ):
+def genPlanck( stats, seed = None, method = 'rejection' ):
     """
     Simple generator for the energy spectrum of thermal photons. Follows the Planck distribution
-        -- stats: number of overall events
+        -- stats:  number of overall events
+        -- seed:   seed or numpy Generator for the random numbers (None: fresh entropy)
+        -- method: 'rejection' or 'table' (inverse CDF from SamplerTables, one uniform per value)
+
+    Candidates are drawn in blocks and accepted with array masks, same envelope and acceptance tests as the 
+    original scalar loop. The uniform choosing the envelope region is rescaled to sample w inside the region
+    (two instead of three random numbers per candidate). Blocks are drawn until stats values are accepted,
+    the last one sized by the envelope efficiency 2 zeta(3)/(p1 + p2 + p3).
 
     RETURNS: array of photon energies.
     """
+    from numpy import where, empty, ceil, expm1
+
+    rng = random.default_rng( seed )
+
+    if method == 'table':
+        from SamplerTables import samplePlanck
+        return samplePlanck( rng.random( stats ) )
 
     # define some constants; a,b,c specific for this generator
     c = .648; a = 1.266; b = -.6
@@ -18,51 +31,55 @@ def genPlanck( stats ):
     # basically solutions to the integrals I_1 to I_3
     p1 = x1*x1/2; p2 = x1*xDiff; p3 = -1/b*exp(a + b*x2)
     P12 = p1/(p1+p2+p3); P23 = (p1+p2)/(p1+p2+p3)
+    efficiency = 2.4041138063191885/(p1+p2+p3)
+
+    values = empty( stats ); filled = 0
+    while filled < stats:
+
+        # blocks of at most 2^16 candidates stay in the cache during the array operations
+        #
+        n = min( int( ceil( 1.05*(stats - filled)/efficiency ) ) + 64, 65536 )
+        r1, r3 = rng.random( (2, n) )
+
+        # choose which function to use, based on interval; r1 rescaled to (0,1) inside the interval gives w
+        reg1 = r1 < P12; reg3 = r1 >= P23
+        w = where( reg1, x1*sqrt( r1/P12 ), where( reg3, x2 + log( (1 - r1)/(1 - P23) )/b, x1 + xDiff*(r1 - P12)/(P23 - P12) ) )
 
-    values = []; i = 0
-    while i < stats:
-
-        # generate a couple of random numbers on (0,1)
-        r1 = rnd.uniform(0,1)
-        r2 = rnd.uniform(0,1)
-        r3 = rnd.uniform(0,1)
-
-        # choose which function to use, based on interval
-        if r1 < P12: 
-            w = x1*sqrt(r2)
-            if w > (exp(w) - 1)*r3: 
-                values.append(w)
-                i += 1 
-        elif r1 < P23: 
-            w = x1 + xDiff*r2
-            if w**2 > x1*(exp(w) - 1)*r3: 
-                values.append(w)
-                i += 1
-        else: 
-            w = x2 + log(r2)/b
-            if w**2 > (exp(w) - 1)*exp(a + b*w)*r3: 
-                values.append(w)
-                i += 1
+        # acceptance w^2 > (exp(w) - 1)*envelope(w)*r3 with envelope w, x1 and exp(a + b*w) in the three intervals
+        envelope = where( reg1, w, where( reg3, exp(a + b*w), x1 ) )
+        accepted = w[ w**2 > expm1(w)*envelope*r3 ][ : stats - filled ]
+
+        values[ filled : filled + len(accepted) ] = accepted
+        filled += len(accepted)
         
-    return asarray(values)
+    return values
 
 def cmpt(x, m0, k):
-        return (1 + x**2 + m0/(m0 + k*(1-x)) + (m0 + k*(1-x))/m0 - 2)*(m0/(m0 + k*(1-x)))**2
+    """
+    Compton (Klein-Nishina) angular distribution up to a constant, bounded by 2; works element-wise on arrays
+        -- x:  cosine of the scattering angle
+        -- m0: electron rest mass
+        -- k:  photon energy (rest frame of the electron)
+    """
+    ratio = kratio(m0, k, x)
+    return (1 + x**2 + ratio + 1/ratio - 2)*ratio**2
 
-def genCompt( energ, m0, verbose = 0 ):
+def genCompt( energ, m0, verbose = 0, seed = None ):
     """
     Simple generator for scattering angle follwoing the Compton cross section
         -- energ:   a photon energy
         -- m0   :   electron rest mass
         -- verbose: set level of output information
+        -- seed:    seed or numpy Generator for the random numbers (None: fresh entropy)
 
     RETURNS: value for cosine(theta) and number of events called before value was accepted
     """
+    rng = random.default_rng( seed )
     stp = 0; count = 0
     while stp < 1:
         count += 1
-        cost = random.uniform(-1,1)
-        r2 = random.uniform(0,1)
+        cost = rng.uniform(-1,1)
+        r2 = rng.uniform(0,1)
         if verbose: print('generate cost, r2:', cost, r2)
         if cmpt( cost, m0, energ ) > 2*r2:
             stp += 1
@@ -70,7 +87,51 @@ def genCompt( energ, m0, verbose = 0 ):
     
     return cost, count
 
+def genComptArr( energ, m0, seed = None, counts = 0, method = 'rejection' ):
+    """
+    Array version of genCompt: one scattering angle for each photon energy. Every round of the rejection draws
+    only for the photons not accepted yet.
+        -- energ:  array of photon energies (rest frame of the electron)
+        -- m0:     electron rest mass
+        -- seed:   seed or numpy Generator for the random numbers (None: fresh entropy)
+        -- counts: also return the number of trials per photon
+        -- method: 'rejection' or 'table' (inverse CDF from SamplerTables, one uniform per photon); photons above
+                   the table range (k/m0 > SamplerTables.kappaMax) are always generated by rejection
+
+    RETURNS: array of cosine(theta) (and array of trial counts)
+    """
+    from numpy import empty, zeros, arange, int64
+
+    rng = random.default_rng( seed )
+    energ = asarray( energ, dtype = float )
+
+    cost = empty( len(energ) ); count = zeros( len(energ), dtype = int64 )
+    todo = arange( len(energ) )
+
+    if method == 'table':
+        from SamplerTables import sampleCompton, kappaMax
+
+        table = energ/m0 <= kappaMax
+        cost[table] = sampleCompton( energ[table]/m0, rng.random( table.sum() ) )
+        count[table] = 1
+        todo = todo[~table]
+
+    while len(todo):
+        x = rng.uniform( -1, 1, len(todo) )
+        r2 = rng.random( len(todo) )
+        accept = cmpt( x, m0, energ[todo] ) > 2*r2
+
+        cost[ todo[accept] ] = x[accept]
+        count[todo] += 1
+        todo = todo[~accept]
+
+    if counts: return cost, count
+    return cost
+
 def kratio(m0, k, cost):
+    """
+    Ratio of scattered to incoming photon energy k'/k; works element-wise on arrays
+    """
     return m0/(m0 + k*(1 - cost))
 
         
@@ -0,0 +1,110 @@
+from pandas import DataFrame, Categorical, cut, concat
+from numpy import arange, asarray, searchsorted, where, nan, abs as npabs, linspace, full
+
+# compare optics versions element by element
+#
+def matchRows( ref, other, Stol = 1e-3 ):
+    """
+    Match the rows of one twiss frame to another. Elements are first matched by NAME to the element of the same
+    name closest in S, if within Stol (repeated names inserted or removed elsewhere do not shift the matching);
+    elements without a name match (renamed, sliced or moved) are matched by S overlap, i.e. to the element
+    of the other table whose interval [S-L, S] contains the center of the reference element.
+        -- ref:   reference twiss frame
+        -- other: twiss frame to align to the reference
+        -- Stol:  maximum S difference [m] of a match by name
+
+    RETURNS: array of row numbers in other (-1 if no match) and array of match types ('name', 'S', '')
+    """
+    from pandas import merge_asof
+
+    # several elements of the same name at the same S (thin elements) are told apart by their occurrence there
+    #
+    keys = []
+    for df in [ref, other]:
+        key = DataFrame( { 'NAME': df.NAME.astype( str ).values, 'S': asarray( df.S.values, dtype = float ), 'row': arange( len(df) ) } )
+        key['n'] = key.groupby( ['NAME', 'S'] ).cumcount()
+        keys.append( key.sort_values( 'S', kind = 'stable' ) )
+
+    matched = merge_asof( keys[0], keys[1].rename( columns = { 'row': 'match' } ), on = 'S', by = ['NAME', 'n'],
+                          direction = 'nearest', tolerance = Stol )
+    rows = full( len(ref), -1 )
+    rows[ matched.row.values ] = matched.match.fillna( -1 ).values.astype( int )
+    how = where( rows >= 0, 'name', '' ).astype( object )
+
+    # S-overlap matching for the rest
+    #
+    missing = rows < 0
+    if missing.any():
+        S = other.S.values; L = other.L.values if 'L' in other else 0*S
+        center = ref.S.values[missing] - ( ref.L.values[missing] if 'L' in ref else 0 )/2
+        j = searchsorted( S, center, side = 'left' ).clip( 0, len(S) - 1 )
+        inside = ( S[j] - L[j] <= center ) & ( center <= S[j] )
+        rows[ missing.nonzero()[0][inside] ] = j[inside]
+        how[ missing.nonzero()[0][inside] ] = 'S'
+
+    return rows, how
+
+def diff_optics( tables, labels = None, columns = ['BETX', 'BETY', 'APER_1'], Stol = 1e-3, verbose = 0 ):
+    """
+    Align two or more twiss tables to the first one and compute element-by-element differences.
+        -- tables:  list of twiss frames (e.g. from read_twiss); the first one is the reference
+        -- labels:  names of the optics versions (default: 0, 1, 2, ...)
+        -- columns: columns to compare; S is always compared as well
+        -- Stol:    maximum S difference of a match by name, see matchRows
+        -- verbose: choose verbosity level
+
+    RETURNS: frame with NAME, S and the reference columns, and for every other table <col>_<label>,
+             d<col>_<label> (difference to the reference) and match_<label> ('name', 'S' or '' if unmatched)
+    """
+    if labels is None: labels = [ str(i) for i in range( len(tables) ) ]
+    ref = tables[0]
+    columns = [ col for col in columns if col != 'S' ]
+
+    diff = DataFrame( { 'NAME': ref.NAME.astype( str ).values, 'S': ref.S.values } )
+    if 'rel_S' in ref: diff['rel_S'] = ref.rel_S.values
+    for col in columns: diff[col] = ref[col].values
+
+    for other, label in zip( tables[1:], labels[1:] ):
+        rows, how = matchRows( ref, other, Stol )
+        diff['match_' + label] = how
+        if verbose: print( label, ': matched', (how == 'name').sum(), 'by name,', (how == 'S').sum(), 'by S overlap,', (how == '').sum(), 'unmatched' )
+
+        for col in ['S'] + columns:
+            values = where( rows >= 0, asarray( other[col].values, dtype = float )[rows], nan )
+            diff[col + '_' + label] = values
+            diff['d' + col + '_' + label] = values - diff[col].values
+
+    return diff
+
+def largest_changes( diff, column, label = '1', regions = 10, n = 5, relS = 0 ):
+    """
+    Report the largest changes of a column per region of the machine.
+        -- diff:    output of diff_optics
+        -- column:  compared column, e.g. 'BETX'
+        -- label:   which optics version to report
+        -- regions: number of equal S regions, or dict {region name: [Smin, Smax]}
+        -- n:       number of elements reported per region
+        -- relS:    regions are given in rel_S instead of S
+
+    RETURNS: frame with region, NAME, S, reference and new value and the change, largest |change| first in every region
+    """
+    S = diff.rel_S if relS else diff.S
+    delta = 'd' + column + '_' + label
+    table = diff[[ 'NAME', 'S', column, column + '_' + label, delta ]].copy()
+    table['absDelta'] = npabs( table[delta].values )
+
+    if isinstance( regions, dict ):
+        parts = []
+        for name, (smin, smax) in regions.items():
+            part = table[ (S >= smin) & (S <= smax) ].copy()
+            part.insert( 0, 'region', name )
+            parts.append( part )
+        table = concat( parts, ignore_index = True )
+        table['region'] = Categorical( table.region, categories = list( regions ) )
+    else:
+        table.insert( 0, 'region', cut( S, linspace( S.min(), S.max(), regions + 1 ), include_lowest = True ) )
+
+    table = table.dropna( subset = ['absDelta'] ).sort_values( 'absDelta', ascending = False )
+    report = table.groupby( 'region', sort = False, observed = True ).head( n )
+
+    return report.sort_values( ['region', 'absDelta'], ascending = [True, False] ).drop( columns = 'absDelta' ).reset_index( drop = True )
@@ -70,7 +70,8 @@ class PlotOptics:
 
         RETURN: the figure
         """
-        from Tools import sigm, inventAper
+        from Tools import sigm
+        from Aperture import inventAperture
         from VisualSpecs import myColors as colors 
         from VisualSpecs import align_yaxis
     
@@ -85,7 +86,7 @@ class PlotOptics:
         if collAp == 'None': collAp = maxAper 
         print('set collAp to generic', collAp)
         
-        self.df['APER'] = self.df.apply( lambda x: inventAper( x.rel_S, x.NAME, x.APER_1, collAp ), axis = 1 )
+        self.df['APER'] = inventAperture( self.df, collAp )
         condition = ( self.df.S > Smax - Srange ) & ( self.df.S <= Smax )
         slFr = self.df[condition]
 
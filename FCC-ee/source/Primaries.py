@@ -2,6 +2,7 @@ import matplotlib.pyplot as plt
 from os.path import isdir, isfile
 from re import findall
 import uproot
+from TwissTable import asTwissTable
 
 class Bunch:
 
@@ -26,6 +27,9 @@ class Bunch:
         self.verbose = verbose
         self.plotpath = plotpath
 
+        # twiss frame last used for element lookups and its TwissTable (name index built once per frame)
+        self.__twiss = None; self.__twissTable = None
+
     # currently as private. Could also be made publicly available to create selected DFs
     def __readData( self, ntuple, columns = [], optics = 'fcc_ee' ):
         """
@@ -78,10 +82,10 @@ class Bunch:
         if 'DRIFT' in nameSplt: nameInTwiss = '_'.join( nameSplt[:-1] )
         else: nameInTwiss = '.'.join( nameSplt[:-1] )
         
-        twiss = twiss[ ['NAME','S', 'BETX','BETY'] ]
-        twiss = twiss[ twiss.NAME == nameInTwiss ]
-        print('Using name', nameInTwiss, ':\n', twiss)
-        bmSz = sqrt( self.emit[0]*twiss.iloc[0]['BETX'] ) 
+        if twiss is not self.__twiss: self.__twiss, self.__twissTable = twiss, asTwissTable( twiss )
+        optics = self.__twissTable.record( nameInTwiss )
+        print('Using name', nameInTwiss, ':\n', optics)
+        bmSz = sqrt( self.emit[0]*optics.BETX ) 
         
         return bmSz
 
@@ -1,7 +1,22 @@
-from numpy import array
+from numpy import array, asarray, empty_like
 
 def Boost( gam, bet ):
     return array( [ [gam, 0, 0, -bet*gam],
                        [0, 1, 0, 0],
                        [0, 0, 1, 0],
-                       [-bet*gam, 0, 0, gam] ] )
\ No newline at end of file
+                       [-bet*gam, 0, 0, gam] ] )
+
+def BoostArr( gam, bet, vecs ):
+    """
+    Boost for many four-vectors (E, px, py, pz) along z
+      -- gam, bet: Lorentz factors, scalars or arrays (N)
+      -- vecs:     four-vectors (N,4)
+    """
+    vecs = asarray( vecs, dtype = float )
+    out = empty_like( vecs )
+    out[:, 0] = gam*vecs[:, 0] - bet*gam*vecs[:, 3]
+    out[:, 1] = vecs[:, 1]
+    out[:, 2] = vecs[:, 2]
+    out[:, 3] = -bet*gam*vecs[:, 0] + gam*vecs[:, 3]
+
+    return out
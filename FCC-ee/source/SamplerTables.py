@@ -0,0 +1,176 @@
+import os
+from os import path
+from numpy import minimum, linspace, sqrt, log, log1p, exp, expm1, interp, where, asarray, stack, save, load, clip, float64
+from scipy.integrate import cumulative_simpson
+
+# inverse-CDF tables for the thermal-photon generators (Planck spectrum, Klein-Nishina angle). Tables are built once,
+# stored as .npy in tableDir and memory-mapped afterwards; sampling is interpolation in the table.
+#
+tableDir = os.environ.get( 'SAMPLER_TABLE_DIR', path.join( path.expanduser('~'), '.cache', 'sampler_tables' ) )
+zeta3x2 = 2.4041138063191885    # integral of x^2/(exp(x) - 1) over (0, inf) = 2 zeta(3)
+
+loaded = {}
+
+def cachedTable( name, build ):
+    """
+    Load a table from tableDir (memory-mapped) or build and store it.
+        -- name:  file name without extension
+        -- build: function returning the table array
+    """
+    if name in loaded: return loaded[name]
+
+    fname = path.join( tableDir, name + '.npy' )
+    if not path.exists( fname ):
+        os.makedirs( tableDir, exist_ok = True )
+        tmp = fname + '.%i.tmp' %os.getpid()
+        with open( tmp, 'wb' ) as file: save( file, build() )
+        os.replace( tmp, fname )
+
+    loaded[name] = load( fname, mmap_mode = 'r' )
+    return loaded[name]
+
+def gridInterp( t, lo, hi, values ):
+    """
+    Linear interpolation in a table on the uniform grid linspace( lo, hi, len(values) ), clamped at the ends;
+    the cell index is computed directly instead of searched.
+    """
+    n = len(values)
+    f = clip( ( t - lo )*( ( n - 1 )/( hi - lo ) ), 0, n - 1 - 1e-9 )
+    i = f.astype( int )
+    f -= i
+
+    return values[i]*( 1 - f ) + values[i + 1]*f
+
+# Planck spectrum x^2/(exp(x) - 1): the inverse CDF x(u) is tabulated on two uniform grids, in sqrt(u) for the bulk
+# (x ~ sqrt(u) at small u, so x is smooth in sqrt(u)) and in -log(1 - u) for the tail u > 1 - planckTail.
+# With the default sizes the sampled quantiles deviate from the exact CDF by less than 5e-9 in u (checked by
+# planckAccuracy); values beyond x = 50 (probability 1e-19) are not produced.
+#
+planckTail = 0.2
+planckLmax = 45.
+
+def planckCDF( xmax = 50., n = 2**22 + 1 ):
+    """
+    Normalized CDF of the Planck spectrum on a fine grid (cumulative Simpson integration).
+
+    RETURNS: x grid, CDF values
+    """
+    x = linspace( 0, xmax, n )
+    density = where( x > 0, x**2/expm1( where( x > 0, x, 1. ) ), 0. )
+    F = cumulative_simpson( density, x = x, initial = 0 )/zeta3x2
+
+    return x, F
+
+def buildPlanck( n = 2**16 ):
+    """
+    Build the Planck table: row 0 x(sqrt(u)) on [0, sqrt(1 - planckTail)], row 1 x(-log(1 - u)) on
+    [-log(planckTail), planckLmax], n points each.
+    """
+    x, F = planckCDF()
+    s = linspace( 0, sqrt( 1 - planckTail ), n )
+    l = linspace( -log( planckTail ), planckLmax, n )
+
+    return stack( ( interp( s**2, F, x ), interp( -expm1( -l ), F, x ) ) )
+
+def planckTable( n = 2**16 ):
+    return cachedTable( 'planck_%i' %n, lambda: buildPlanck( n ) )
+
+def samplePlanck( u, n = 2**16 ):
+    """
+    Planck distributed values x (photon energy in units of kT) from uniforms u.
+    """
+    table = planckTable( n )
+    u = asarray( u, dtype = float64 )
+
+    x = gridInterp( sqrt(u), 0, sqrt( 1 - planckTail ), table[0] )
+    tail = u >= 1 - planckTail
+    x[tail] = gridInterp( -log1p( -minimum( u[tail], 1 - 2**-53 ) ), -log( planckTail ), planckLmax, table[1] )
+
+    return x
+
+def planckAccuracy( n = 2**16, samples = 10**6, seed = 0 ):
+    """
+    Maximum deviation |F(x(u)) - u| of the table sampler from the exact CDF, for random and worst case grid-midpoint u.
+    """
+    from numpy import random, concatenate
+
+    x, F = planckCDF()
+    s = linspace( 0, sqrt( 1 - planckTail ), n ); l = linspace( -log( planckTail ), planckLmax, n )
+    mids = concatenate( ( ( ( s[1:] + s[:-1] )/2 )**2, -expm1( -( l[1:] + l[:-1] )/2 ) ) )
+    u = concatenate( ( random.default_rng( seed ).random( samples ), mids ) )
+
+    return abs( interp( samplePlanck( u, n ), x, F ) - u ).max()
+
+# Klein-Nishina angle: for kappa = k/m0 the CDF of cmpt in cos(theta) is inverted on a uniform u grid, for kappa on
+# a logarithmic grid; sampling interpolates bilinearly in (log kappa, u). Below kappaMin the Thomson limit is
+# reached (the table at kappaMin is used); kappa above kappaMax is outside the table (Generators.genComptArr falls
+# back to the rejection sampler there, sampleCompton raises ValueError). With the default sizes the sampled
+# angles deviate from the exact CDF by less than 1e-4 in u for kappa inside the grid (checked by comptonAccuracy).
+#
+kappaMin = 1e-6
+kappaMax = 1e3
+
+def comptonCDF( kappa, n = 20001 ):
+    """
+    Normalized CDF of the Compton angular distribution for one kappa = k/m0 on a fine cos(theta) grid.
+    """
+    from Generators import cmpt
+
+    x = linspace( -1, 1, n )
+    F = cumulative_simpson( cmpt( x, 1., kappa ), x = x, initial = 0 )
+
+    return x, F/F[-1]
+
+def buildCompton( nk = 256, nu = 2049 ):
+    """
+    Build the Klein-Nishina table: row i holds cos(theta)(u) on a uniform u grid for kappa_i (log grid).
+    """
+    u = linspace( 0, 1, nu )
+    kappas = exp( linspace( log( kappaMin ), log( kappaMax ), nk ) )
+
+    rows = []
+    for kappa in kappas:
+        x, F = comptonCDF( kappa )
+        rows.append( interp( u, F, x ) )
+
+    return stack( rows )
+
+def comptonTable( nk = 256, nu = 2049 ):
+    return cachedTable( 'compton_%ix%i' %(nk, nu), lambda: buildCompton( nk, nu ) )
+
+def sampleCompton( kappa, u, nk = 256, nu = 2049 ):
+    """
+    cos(theta) following the Klein-Nishina distribution for photon energies kappa = k/m0 (rest frame) from uniforms u.
+    """
+    table = comptonTable( nk, nu )
+    kappa = asarray( kappa, dtype = float64 ); u = asarray( u, dtype = float64 )
+    if ( kappa > kappaMax ).any(): raise ValueError( 'sampleCompton: kappa = %g above the table range %g' %(kappa.max(), kappaMax) )
+
+    # fractional table coordinates and bilinear interpolation
+    #
+    fk = clip( ( log( kappa ) - log( kappaMin ) )*( ( nk - 1 )/( log( kappaMax ) - log( kappaMin ) ) ), 0, nk - 1 - 1e-9 )
+    fu = clip( u*( nu - 1 ), 0, nu - 1 - 1e-9 )
+    i = fk.astype( int ); j = fu.astype( int )
+    dk = fk - i; du = fu - j
+
+    low = table[i, j]*( 1 - du ) + table[i, j + 1]*du
+    high = table[i + 1, j]*( 1 - du ) + table[i + 1, j + 1]*du
+
+    return low*( 1 - dk ) + high*dk
+
+def comptonAccuracy( nk = 256, nu = 2049, nkappa = 50, samples = 20000, seed = 0 ):
+    """
+    Maximum deviation |F_kappa(cos(theta)(u)) - u| of the table sampler from the exact CDF, for kappa between the
+    grid points (worst case for the interpolation in kappa).
+    """
+    from numpy import random
+
+    rng = random.default_rng( seed )
+    step = ( log( kappaMax ) - log( kappaMin ) )/( nk - 1 )
+    worst = 0
+    for logk in log( kappaMin ) + step*( rng.integers( 0, nk - 1, nkappa ) + 0.5 ):
+        x, F = comptonCDF( exp( logk ) )
+        u = rng.random( samples )
+        worst = max( worst, abs( interp( sampleCompton( exp( logk ), u, nk, nu ), x, F ) - u ).max() )
+
+    return worst
@@ -0,0 +1,346 @@
+from numpy import asarray, zeros, where, sin, cos, arctan2, sqrt, divide, unwrap, concatenate, einsum, char, abs as npabs, pi
+from pandas import DataFrame
+
+# survey of a lattice from its twiss table, following the MAD-X SURVEY conventions (MAD-X user guide, chapter survey):
+#   global position V = (X, Y, Z), orientation W = Theta Phi Psi; every element is a local displacement R and rotation S
+#   applied as V_i = V_(i-1) + W_(i-1) R_i,  W_i = W_(i-1) S_i
+#
+def rotation( theta = 0, phi = 0, psi = 0 ):
+    """
+    Orientation matrix W = Theta Phi Psi from the survey angles (as MAD-X suinit), works on scalars and arrays.
+        -- theta: azimuthal angle (rotation around y)
+        -- phi:   elevation angle (rotation around x)
+        -- psi:   roll angle (rotation around z)
+
+    RETURNS: array of shape (..., 3, 3)
+    """
+    theta, phi, psi = asarray( theta, dtype = float ), asarray( phi, dtype = float ), asarray( psi, dtype = float )
+    ct, st, cp, sp, cs, ss = cos(theta), sin(theta), cos(phi), sin(phi), cos(psi), sin(psi)
+
+    W = zeros( ct.shape + (3, 3) )
+    W[..., 0, 0] = ct*cs - st*sp*ss;  W[..., 0, 1] = -ct*ss - st*sp*cs; W[..., 0, 2] = st*cp
+    W[..., 1, 0] = cp*ss;             W[..., 1, 1] = cp*cs;             W[..., 1, 2] = sp
+    W[..., 2, 0] = -st*cs - ct*sp*ss; W[..., 2, 1] = st*ss - ct*sp*cs;  W[..., 2, 2] = ct*cp
+
+    return W
+
+def surveyAngles( W, theta0 = 0, psi0 = 0 ):
+    """
+    Survey angles THETA, PHI, PSI from orientation matrices (inverse of rotation). THETA and PSI are kept
+    continuous along the lattice starting from theta0/psi0, as MAD-X does (e.g. THETA runs to -2 pi for a ring).
+
+    RETURNS: theta, phi, psi arrays
+    """
+    arg = sqrt( W[:, 1, 0]**2 + W[:, 1, 1]**2 )
+    phi = arctan2( W[:, 1, 2], arg )
+    theta = arctan2( W[:, 0, 2], W[:, 2, 2] )
+    psi = arctan2( W[:, 1, 0], W[:, 1, 1] )
+
+    theta = unwrap( concatenate( ([theta0], theta) ) )[1:]
+    psi = unwrap( concatenate( ([psi0], psi) ) )[1:]
+
+    return theta, phi, psi
+
+def elementTransforms( df ):
+    """
+    Local displacement R and rotation S of every element of a twiss frame.
+        * bends (L != 0, ANGLE != 0): R = rho (cos(angle) - 1, 0, sin(angle)), S = rotation by -angle around y,
+          with TILT the bend plane is rolled around z: R -> T R, S -> T S T^-1 (TILT = pi/2 gives a vertical bend)
+        * thin bends/multipoles (L = 0, ANGLE != 0): rotation only, R = 0
+        * SROTATION, XROTATION, YROTATION (if KEYWORD is available): rotation by ANGLE around z, x, y
+        * everything else: R = (0, 0, L), S = 1
+        -- df: twiss frame, needs L and ANGLE; TILT and KEYWORD are used if present
+
+    RETURNS: S of shape (N, 3, 3), R of shape (N, 3)
+    """
+    n = len(df)
+    L = asarray( df['L'].values, dtype = float )
+    angle = asarray( df['ANGLE'].values, dtype = float )
+    tilt = asarray( df['TILT'].values, dtype = float ) if 'TILT' in df else zeros( n )
+
+    if 'KEYWORD' in df: keyword = asarray( df.KEYWORD.values, dtype = str )
+    else: keyword = zeros( n, dtype = str )
+    srot = char.startswith( keyword, 'SROTATION' )
+    xrot = char.startswith( keyword, 'XROTATION' )
+    yrot = char.startswith( keyword, 'YROTATION' )
+    rot = srot | xrot | yrot
+
+    bend = ( angle != 0 ) & ~rot
+    thick = bend & ( L != 0 )
+
+    # bend in its own plane
+    #
+    ca, sa = cos( where( bend, angle, 0. ) ), sin( where( bend, angle, 0. ) )
+    rho = divide( L, angle, out = zeros( n ), where = thick )
+    dx = where( thick, rho*( ca - 1 ), 0. )
+    dz = where( thick, rho*sa, where( bend | rot, 0., L ) )
+
+    # roll the bend plane by TILT: R = T (dx, 0, dz), S = T S0 T^-1
+    #
+    cp, sp = cos(tilt), sin(tilt)
+    R = zeros( (n, 3) )
+    R[:, 0] = cp*dx; R[:, 1] = sp*dx; R[:, 2] = dz
+
+    S = zeros( (n, 3, 3) )
+    S[:, 0, 0] = ca*cp**2 + sp**2;  S[:, 0, 1] = ( ca - 1 )*cp*sp;  S[:, 0, 2] = -sa*cp
+    S[:, 1, 0] = ( ca - 1 )*cp*sp;  S[:, 1, 1] = ca*sp**2 + cp**2;  S[:, 1, 2] = -sa*sp
+    S[:, 2, 0] = sa*cp;             S[:, 2, 1] = sa*sp;             S[:, 2, 2] = ca
+
+    # rotation elements
+    #
+    if rot.any():
+        c, s = cos( angle[rot] ), sin( angle[rot] )
+        M = zeros( (rot.sum(), 3, 3) )
+        kind = where( srot[rot], 2, where( xrot[rot], 0, 1 ) )
+        for axis in range(3):
+            sel = kind == axis
+            i, j = [ k for k in range(3) if k != axis ]
+            M[sel, axis, axis] = 1
+            M[sel, i, i] = c[sel]; M[sel, j, j] = c[sel]
+            # same sense as the survey angles: XROTATION adds to PHI, YROTATION to THETA, SROTATION to PSI
+            sign = 1 if axis == 2 else -1
+            M[sel, i, j] = -sign*s[sel]; M[sel, j, i] = sign*s[sel]
+        S[rot] = M
+
+    return S, R
+
+def prefixScan( S, R ):
+    """
+    Inclusive prefix composition of the element transforms (S_i, R_i), (A, a) (B, b) = (A B, a + A b), by recursive
+    doubling: log2(N) steps of batched 3x3 products instead of a loop over elements.
+
+    RETURNS: W (N, 3, 3) and V (N, 3), orientation and position after every element for a start at W0 = 1, V0 = 0
+    """
+    W = S.copy(); V = R.copy()
+    n = len(W); d = 1
+    while d < n:
+        A = W[:-d]
+        V[d:] = V[:-d] + einsum( 'nij,nj->ni', A, V[d:] )
+        W[d:] = A @ W[d:]
+        d *= 2
+
+    return W, V
+
+def survey( df, X0 = 0, Y0 = 0, Z0 = 0, THETA0 = 0, PHI0 = 0, PSI0 = 0, verbose = 0 ):
+    """
+    3D survey of a lattice from its twiss table, same conventions and start parameters as MAD-X SURVEY.
+    Values are given at the exit of every element (first row: start point plus the first element).
+        -- df:       twiss frame (e.g. from TfsReader.read_twiss), needs NAME, S, L, ANGLE; TILT and KEYWORD are used if present
+        -- X0,Y0,Z0: start position
+        -- THETA0, PHI0, PSI0: start orientation
+        -- verbose:  choose verbosity level
+
+    RETURNS: frame with NAME, S, L, ANGLE, X, Y, Z, THETA, PHI, PSI (and TILT if given); the orientation matrices are in attrs['W'] (N, 3, 3)
+    """
+    S, R = elementTransforms( df )
+    W, V = prefixScan( S, R )
+
+    W0 = rotation( THETA0, PHI0, PSI0 )
+    W = W0 @ W
+    V = einsum( 'ij,nj->ni', W0, V ) + asarray( [X0, Y0, Z0], dtype = float )
+
+    theta, phi, psi = surveyAngles( W, THETA0, PSI0 )
+
+    result = DataFrame( { 'NAME': df.NAME.values, 'S': df.S.values, 'L': df.L.values, 'ANGLE': df.ANGLE.values,
+                          'X': V[:, 0], 'Y': V[:, 1], 'Z': V[:, 2], 'THETA': theta, 'PHI': phi, 'PSI': psi } )
+    if 'TILT' in df: result['TILT'] = df.TILT.values
+    result.attrs['W'] = W
+
+    if verbose: print( 'survey:', len(df), 'elements, end point X, Y, Z =', V[-1], 'THETA, PHI, PSI =', theta[-1], phi[-1], psi[-1] )
+
+    return result
+
+def compare_survey( result, reference, columns = ['X', 'Y', 'Z', 'THETA', 'PHI', 'PSI'], tol = 1e-6, verbose = 1 ):
+    """
+    Cross-check a survey against MAD-X SURVEY output (e.g. TfsReader.read_survey), row by row.
+        -- result:    output of survey
+        -- reference: survey frame or path to a MAD-X survey file
+        -- columns:   columns to compare
+        -- tol:       tolerance on the maximum deviation (m, rad)
+        -- verbose:   print the deviations
+
+    RETURNS: dict column -> maximum absolute deviation; raises ValueError if a deviation exceeds tol
+    """
+    if isinstance( reference, str ):
+        from TfsParser import read_tfs
+        reference = read_tfs( reference, columns = ['NAME'] + list( columns ) )[1]
+
+    if len( reference ) != len( result ): raise ValueError( 'survey has %i rows, reference %i' %(len(result), len(reference)) )
+
+    deviation = {}
+    for col in columns:
+        delta = asarray( result[col].values, dtype = float ) - asarray( reference[col].values, dtype = float )
+        if col in ['THETA', 'PSI']: delta = ( delta + pi ) % ( 2*pi ) - pi
+        deviation[col] = npabs( delta ).max()
+        if verbose: print( 'max |d%s| =' %col, deviation[col] )
+
+    bad = [ col for col in columns if not deviation[col] <= tol ]
+    if bad: raise ValueError( 'survey deviates from reference in %s' %bad )
+
+    return deviation
+
+def homogeneous( S, R ):
+    """
+    Element transforms (S, R) as 4x4 affine matrices [[S, R], [0, 1]], such that composition is a matrix product.
+    """
+    T = zeros( (len(S), 4, 4) )
+    T[:, :3, :3] = S; T[:, :3, 3] = R; T[:, 3, 3] = 1
+
+    return T
+
+class IncrementalSurvey:
+    """
+    Survey that can be updated element by element, e.g. in layout optimisation loops around the IP. The element
+    transforms are the leaves of a segment tree whose nodes hold the composed 4x4 affine transforms of their
+    subtrees. Changing k elements recomputes only their ancestors, O(k log N); the position and orientation
+    after any element is the product of O(log N) nodes.
+        -- df:       twiss frame as for survey (NAME, S, L, ANGLE; TILT, KEYWORD if present)
+        -- X0,Y0,Z0, THETA0, PHI0, PSI0: start point and orientation as in survey
+        -- verbose:  choose verbosity level
+    """
+
+    def __init__( self, df, X0 = 0, Y0 = 0, Z0 = 0, THETA0 = 0, PHI0 = 0, PSI0 = 0, verbose = 0 ):
+
+        from numpy import identity
+
+        columns = [ col for col in ['NAME', 'KEYWORD', 'S', 'L', 'ANGLE', 'TILT'] if col in df ]
+        self.df = df[columns].reset_index( drop = True ).copy()
+        if 'TILT' not in self.df: self.df['TILT'] = 0.
+        self.verbose = verbose
+        self.THETA0, self.PSI0 = THETA0, PSI0
+
+        self.start = identity(4)
+        self.start[:3, :3] = rotation( THETA0, PHI0, PSI0 ); self.start[:3, 3] = [X0, Y0, Z0]
+
+        self.n = len( self.df )
+        # one spare leaf, such that no prefix covers the whole tree (queries then only walk the right boundary)
+        #
+        self.size = 1
+        while self.size <= self.n: self.size *= 2
+
+        self.tree = zeros( (2*self.size, 4, 4) ); self.tree[:] = identity(4)
+        self.tree[ self.size : self.size + self.n ] = homogeneous( *elementTransforms( self.df ) )
+
+        # build the internal nodes level by level
+        #
+        level = self.size//2
+        while level >= 1:
+            nodes = asarray( range( level, 2*level ) )
+            self.tree[nodes] = self.tree[2*nodes] @ self.tree[2*nodes + 1]
+            level //= 2
+
+        self.changed = 0
+        self.index = dict( zip( self.df.NAME.values[::-1], range( self.n - 1, -1, -1 ) ) )
+
+        if verbose: print( 'IncrementalSurvey:', self.n, 'elements, tree depth', self.size.bit_length() - 1 )
+
+    def rows( self, elements ):
+        """
+        Row numbers of elements given by NAME (first occurrence) or already as row numbers.
+        """
+        from numpy import atleast_1d
+
+        elements = atleast_1d( elements )
+        if elements.dtype.kind in 'iu': return elements.astype( int )
+
+        try: return asarray( [ self.index[name] for name in elements ], dtype = int )
+        except KeyError as error: raise KeyError( 'element %s not found in survey' %error.args[0] ) from None
+
+    def update( self, elements, **columns ):
+        """
+        Change attributes of some elements and update the tree, e.g. update( ['QC1L1.1'], L = [1.2] ).
+        If L changes, S of all following elements is shifted accordingly.
+            -- elements: names or row numbers
+            -- columns:  new values of L, ANGLE, TILT (scalar or one value per element)
+        """
+        from numpy import unique, cumsum, broadcast_to
+
+        rows = self.rows( elements )
+        for col, values in columns.items():
+            if col not in ['L', 'ANGLE', 'TILT']: raise KeyError( 'cannot update column %s' %col )
+            values = broadcast_to( asarray( values, dtype = float ), rows.shape )
+
+            if col == 'L':
+                dL = zeros( self.n ); dL[rows] = values - self.df.L.values[rows]
+                self.df['S'] = self.df.S.values + cumsum( dL )
+            self.df.loc[ rows, col ] = values
+
+        nodes = unique( rows ) + self.size
+        self.tree[nodes] = homogeneous( *elementTransforms( self.df.iloc[ nodes - self.size ] ) )
+
+        # recompute the ancestors, one batched product per level
+        #
+        while nodes[0] > 1:
+            nodes = unique( nodes//2 )
+            self.tree[nodes] = self.tree[2*nodes] @ self.tree[2*nodes + 1]
+
+        self.changed = min( self.changed, rows.min() ) if self.changed is not None else rows.min()
+
+        if self.verbose: print( 'updated', len(rows), 'elements', columns.keys() )
+
+    def transforms( self, elements = None ):
+        """
+        Composed 4x4 transforms (start point included) after the given elements, one O(log N) walk per element,
+        vectorized over all of them.
+            -- elements: names or row numbers (default: all)
+
+        RETURNS: array (m, 4, 4); [:3, :3] is the orientation W, [:3, 3] the position X, Y, Z
+        """
+        from numpy import identity, arange
+
+        rows = arange( self.n ) if elements is None else self.rows( elements )
+
+        # collect the nodes covering [0, row] from right to left: whenever the (exclusive) right boundary is a right
+        # child, its left sibling belongs to the prefix
+        #
+        right = rows + 1 + self.size
+        result = zeros( (len(rows), 4, 4) ); result[:] = identity(4)
+        while ( right > 1 ).any():
+            take = right % 2 == 1
+            result[take] = self.tree[ right[take] - 1 ] @ result[take]
+            right //= 2
+
+        return self.start @ result
+
+    def coordinates( self, elements = None ):
+        """
+        Survey frame (as survey) for the given elements (default: all).
+        """
+        rows = None if elements is None else self.rows( elements )
+        T = self.transforms( rows )
+        W = T[:, :3, :3]
+        theta, phi, psi = surveyAngles( W, self.THETA0, self.PSI0 )
+
+        part = self.df if rows is None else self.df.iloc[rows]
+        result = DataFrame( { 'NAME': part.NAME.values, 'S': part.S.values, 'L': part.L.values, 'ANGLE': part.ANGLE.values,
+                              'X': T[:, 0, 3], 'Y': T[:, 1, 3], 'Z': T[:, 2, 3], 'THETA': theta, 'PHI': phi, 'PSI': psi } )
+        result.attrs['W'] = W
+
+        return result
+
+    def apply( self, df ):
+        """
+        Write x_EU, y_EU, z_EU and W (as from ToEuclidian, input for Plot.PlotBendCones) into df, which must have the
+        rows of the survey. Only rows from the first element changed since the last call on are recomputed.
+        """
+        from numpy import arange
+
+        if self.changed is None: return df
+        first = 0 if not { 'x_EU', 'y_EU', 'z_EU', 'W' }.issubset( df.columns ) else self.changed
+        rows = arange( first, self.n )
+
+        T = self.transforms( rows )
+        for k, col in enumerate( ['x_EU', 'y_EU', 'z_EU'] ):
+            values = df[col].values.copy() if col in df else zeros( self.n )
+            values[rows] = T[:, k, 3]
+            df[col] = values
+
+        W = list( df.W.values ) if 'W' in df else [None]*self.n
+        W[first:] = list( T[:, :3, :3] )
+        df['W'] = W
+        df['S'] = self.df.S.values
+
+        if self.verbose: print( 'recomputed', len(rows), 'rows from', first )
+        self.changed = None
+
+        return df
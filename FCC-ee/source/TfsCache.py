@@ -0,0 +1,153 @@
+import time
+from os import environ, listdir, path, stat, walk, replace, getpid
+from threading import get_ident
+from shutil import rmtree
+from hashlib import blake2b
+from Columnar import save_frame, load_frame, load_meta
+
+# default location of the cache, can be moved with the environment variable TFS_CACHE_DIR
+#
+defaultCacheDir = environ.get( 'TFS_CACHE_DIR', path.join( path.expanduser('~'), '.cache', 'tfs' ) )
+
+def fingerprint( tfs, block = 1 << 20 ):
+    """
+    Identify the content of a TFS file: absolute path, size, modification time and a content hash.
+    The hash covers the first, middle and last block of the file, so fingerprinting stays in the
+    millisecond range also for multi-hundred-MB files.
+        -- tfs:   path to the file
+        -- block: size of the hashed blocks in bytes
+    """
+    tfs = path.abspath( tfs )
+    info = stat( tfs )
+
+    digest = blake2b( str(info.st_size).encode(), digest_size = 16 )
+    with open( tfs, 'rb' ) as file:
+        for pos in sorted({ 0, max( 0, info.st_size//2 - block//2 ), max( 0, info.st_size - block ) }):
+            file.seek( pos )
+            digest.update( file.read( block ) )
+
+    return { 'path': tfs, 'size': info.st_size, 'mtime': info.st_mtime_ns, 'hash': digest.hexdigest() }
+
+class TfsCache:
+    """
+    On-disk cache for parsed TFS tables (frame, header and derived columns) in columnar .npy format.
+    Entries are keyed by file path and read options and are invalidated when size, modification time
+    or content hash of the source change. The total size is bounded, least recently used entries are evicted.
+        -- cacheDir: directory holding the cache entries
+        -- maxSize:  maximum total size of the cache in bytes
+        -- verbose:  choose verbosity level
+    """
+
+    def __init__( self, cacheDir = defaultCacheDir, maxSize = 5e9, verbose = 0 ):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        self.verbose = verbose
+
+    def entry( self, tfs, variant = '' ):
+        """
+        Directory of the cache entry for a given file and read variant (e.g. 'twiss-relS1-float64').
+        """
+        key = blake2b( ( path.abspath( tfs ) + '|' + variant ).encode(), digest_size = 16 ).hexdigest()
+        return path.join( self.cacheDir, key )
+
+    def load( self, tfs, variant = '', columns = None ):
+        """
+        Look up a parsed table.
+            -- columns: only load these columns (default: all)
+
+        RETURNS: header dict and data frame, or None if there is no valid entry
+        """
+        entry = self.entry( tfs, variant )
+        if not path.isfile( path.join( entry, 'frame.json' ) ): return None
+
+        # an entry replaced by another process while reading counts as a miss
+        #
+        try:
+            meta = load_meta( entry )
+            if meta['source'] != fingerprint( tfs ):
+                if self.verbose: print( ' *** cache entry for', tfs, 'is outdated - removing it' )
+                rmtree( entry, ignore_errors = True )
+                return None
+
+            df, meta = load_frame( entry, columns = columns )
+            self.touch( entry )
+        except ( OSError, ValueError, KeyError ): return None
+
+        if self.verbose: print( 'loaded', tfs, '(', variant, ') from cache', entry )
+
+        return meta['header'], df
+
+    def store( self, tfs, header, df, variant = '' ):
+        """
+        Store a parsed table (with any derived columns) and evict old entries if the cache grew too large.
+        """
+        entry = self.entry( tfs, variant )
+
+        # written into a temporary directory and renamed into place, such that readers in other processes
+        # never see a half-written entry; if another process stored the same entry meanwhile, its entry is kept
+        #
+        tmp = entry + '.%i.%i.tmp' %(getpid(), get_ident())
+        rmtree( tmp, ignore_errors = True )
+        try:
+            nbytes = save_frame( tmp, df, meta = { 'source': fingerprint( tfs ), 'variant': variant, 'header': header } )
+            self.touch( tmp )
+        except Exception:
+            rmtree( tmp, ignore_errors = True )
+            raise
+
+        old = entry + '.%i.%i.old' %(getpid(), get_ident())
+        try: replace( entry, old )
+        except FileNotFoundError: pass
+        try: replace( tmp, entry )
+        except OSError: rmtree( tmp, ignore_errors = True )
+        rmtree( old, ignore_errors = True )
+        if self.verbose: print( 'cached', tfs, '(', variant, ')', nbytes/1e6, 'MB in', entry )
+
+        self.evict()
+
+    def touch( self, entry ):
+        """
+        Record the access time of an entry (used for LRU eviction).
+        """
+        with open( path.join( entry, 'lastUsed' ), 'w' ) as file:
+            file.write( str( time.time() ) )
+
+    def entries( self ):
+        """
+        List all cache entries as (last used, size in bytes, directory), least recently used first. Entries being
+        written by store are not listed.
+        """
+        if not path.isdir( self.cacheDir ): return []
+
+        entries = []
+        for key in listdir( self.cacheDir ):
+            if key.endswith( ('.tmp', '.old') ): continue
+            entry = path.join( self.cacheDir, key )
+            try:
+                with open( path.join( entry, 'lastUsed' ) ) as file: lastUsed = float( file.read() )
+            except ( OSError, ValueError ): lastUsed = 0.
+
+            size = sum( path.getsize( path.join( root, f ) ) for root, dirs, files in walk( entry ) for f in files )
+            entries.append( (lastUsed, size, entry) )
+
+        return sorted( entries )
+
+    def evict( self ):
+        """
+        Remove least recently used entries until the cache is below maxSize.
+        """
+        entries = self.entries()
+        total = sum( size for lastUsed, size, entry in entries )
+
+        for lastUsed, size, entry in entries:
+            if total <= self.maxSize: break
+            if self.verbose: print( 'evicting cache entry', entry, size/1e6, 'MB' )
+            rmtree( entry, ignore_errors = True )
+            total -= size
+
+    def clear( self ):
+        """
+        Remove all entries, including left-overs of interrupted writes.
+        """
+        if not path.isdir( self.cacheDir ): return
+        for key in listdir( self.cacheDir ): rmtree( path.join( self.cacheDir, key ), ignore_errors = True )
@@ -0,0 +1,110 @@
+import mmap
+import shlex
+from numpy import asarray, int64
+from pandas import DataFrame, Index
+from TfsParser import parse_header, headerValue
+from TfsCache import TfsCache
+
+class TfsIndex:
+    """
+    Element index of a TFS file: NAME -> byte offset and line number of its row. Built with one scan of the file
+    and stored as sidecar next to the cached tables (TfsCache, variant 'index'), afterwards single rows are read
+    from the memory-mapped file without parsing the rest of it.
+        -- tfs:     path to the TFS file
+        -- cache:   TfsCache used to store the index; 1 selects the default cache, 0 (default) keeps it in memory only
+        -- verbose: choose verbosity level
+    """
+
+    def __init__( self, tfs, cache = 0, verbose = 0 ):
+
+        self.tfs = tfs
+        self.verbose = verbose
+
+        if isinstance( cache, TfsCache ): self.cache = cache
+        elif cache: self.cache = TfsCache( verbose = verbose )
+        else: self.cache = None
+
+        self.header, self.names, self.formats, offset, nlines = parse_header( tfs )
+
+        cached = self.cache.load( tfs, 'index' ) if self.cache is not None else None
+        if cached is not None: index = cached[1]
+        else:
+            index = self.__build( offset, nlines )
+            if self.cache is not None: self.cache.store( tfs, self.header, index, 'index' )
+
+        # first occurrence wins (as .values[0] on a NAME selection)
+        #
+        index = index.drop_duplicates( subset = 'NAME', keep = 'first' )
+        self.offsets = asarray( index.offset.values, dtype = int64 )
+        self.lineNumbers = asarray( index.line.values, dtype = int64 )
+        self.index = Index( index.NAME.values )
+
+        if verbose: print( 'TfsIndex:', len(self.index), 'elements in', tfs )
+
+    def __build( self, offset, nlines ):
+        """
+        Scan the table once and record NAME, byte offset and line number of every row.
+        """
+        names = []; offsets = []; lines = []
+        col = self.names.index('NAME')
+
+        with open( self.tfs, 'rb' ) as file:
+            file.seek( offset )
+            line = nlines
+            for raw in file:
+                fields = raw.split( None, col + 1 )
+                if fields:
+                    names.append( fields[col].strip(b'"').decode() )
+                    offsets.append( offset ); lines.append( line )
+                offset += len(raw); line += 1
+
+        if self.verbose: print( 'indexed', len(names), 'rows of', self.tfs )
+
+        return DataFrame( { 'NAME': names, 'offset': asarray( offsets, dtype = int64 ), 'line': asarray( lines, dtype = int64 ) } )
+
+    def __contains__( self, name ):
+        return name in self.index
+
+    def __position( self, name ):
+        try: return self.index.get_loc( name )
+        except KeyError: raise KeyError( 'element %s not found in %s' %(name, self.tfs) ) from None
+
+    def line( self, name ):
+        """
+        Line number (0-based) of the element row in the file.
+        """
+        return int( self.lineNumbers[ self.__position( name ) ] )
+
+    def raw( self, names ):
+        """
+        Raw text rows of the elements, read from the memory-mapped file.
+        """
+        rows = []
+        with open( self.tfs, 'rb' ) as file, mmap.mmap( file.fileno(), 0, access = mmap.ACCESS_READ ) as mm:
+            for name in names:
+                start = self.offsets[ self.__position( name ) ]
+                end = mm.find( b'\n', start )
+                rows.append( mm[ start : end if end >= 0 else len(mm) ].decode() )
+
+        return rows
+
+    def row( self, name ):
+        """
+        Typed values of one element row, e.g. the optics at the start of a beam without parsing all of a large file:
+            optics = TfsIndex( tfsFile ).row( elm ); FromNorm( optics['BETX'], optics['BETY'], optics['ALFX'], optics['ALFY'] )
+            -- name: element name
+
+        RETURNS: dict column -> value
+        """
+        return self.rows( [name] ).iloc[0].to_dict()
+
+    def rows( self, names ):
+        """
+        Typed rows of several elements as a data frame (in the order of names).
+        """
+        data = []
+        for text in self.raw( names ):
+            fields = shlex.split( text, posix = False )
+            data.append( [ headerValue( fmt, value ) for fmt, value in zip( self.formats, fields ) ] )
+
+        return DataFrame( data, columns = self.names )
@@ -0,0 +1,366 @@
+from pandas import read_csv, concat
+from pandas.errors import ParserError
+from numpy import float64, int64, ones
+from concurrent.futures import ProcessPoolExecutor
+from Tools import rel_s
+
+# map the TFS format specifiers ($ line) to dtypes
+#
+def tfsDtype( fmt, floatType = float64 ):
+    """
+    Translate a TFS format string (%le, %s, %d, ...) into a numpy/pandas dtype.
+        -- fmt:       format string as given in the $ line or an @ line
+        -- floatType: dtype used for real numbers (float64 or float32)
+    """
+    if fmt.endswith('s'): return object
+    elif fmt.endswith('d'): return int64
+    else: return floatType
+
+def headerValue( fmt, value ):
+    """
+    Convert a single header value according to its TFS format string.
+    """
+    if fmt.endswith('s'): return value.strip().strip('"')
+    elif fmt.endswith('d'): return int( value )
+    else: return float( value )
+
+def parse_header( tfs ):
+    """
+    Read the head of a TFS file (@, * and $ lines) without touching the table itself.
+        -- tfs: path to the TFS file
+
+    RETURNS: header dict {parameter: typed value}, column names, column formats,
+             byte offset of the first table row and number of header lines
+    """
+    header = {}; names = []; formats = []
+    offset = 0; nlines = 0
+
+    with open( tfs, 'rb' ) as file:
+        for raw in file:
+            line = raw.decode().strip()
+
+            if line.startswith('@'):
+                key, fmt, value = line[1:].split( None, 2 )
+                header[key] = headerValue( fmt, value )
+            elif line.startswith('*'): names = line[1:].split()
+            elif line.startswith('$'): formats = line[1:].split()
+            elif line != '': break
+
+            offset += len(raw); nlines += 1
+
+    if len(names) != len(formats):
+        raise ValueError('TFS file %s: %i column names but %i column formats' %(tfs, len(names), len(formats)) )
+
+    return header, names, formats, offset, nlines
+
+def readTable( tfs, offset, names, dtypes, sep = ' ', usecols = None, chunksize = None, select = None, stop = None ):
+    """
+    Load the table part of a TFS file, starting at byte offset (first row after the $ line).
+        -- usecols:   only parse these columns
+        -- chunksize: stream the table in chunks of this many rows (bounded memory)
+        -- select:    function chunk -> boolean mask of rows to keep (chunked mode only)
+        -- stop:      function chunk -> True if no further chunks are needed (chunked mode only)
+    """
+    with open( tfs, 'rb' ) as file:
+        file.seek( offset )
+        reader = read_csv( file, sep = sep, skipinitialspace = True, header = None, names = names, dtype = dtypes,
+                           usecols = usecols, chunksize = chunksize, quotechar = '"', na_filter = False,
+                           index_col = False, engine = 'c' )
+        if chunksize is None: return reader
+
+        chunks = []
+        for chunk in reader:
+            done = stop is not None and stop( chunk )
+            if select is not None: chunk = chunk[ select( chunk ) ]
+            chunks.append( chunk )
+            if done: break
+
+    return concat( chunks, ignore_index = True )
+
+def windowMask( S, Srange = None, relSrange = None, Lmax = 0 ):
+    """
+    Select rows inside an S window and/or a rel_S window (IP in the center).
+        -- S:         array of S positions
+        -- Srange:    [Smin, Smax]
+        -- relSrange: [relSmin, relSmax], rel_S computed with ring length Lmax
+
+    RETURNS: boolean mask
+    """
+    mask = ones( len(S), dtype = bool )
+    if Srange is not None: mask &= ( S >= Srange[0] ) & ( S <= Srange[1] )
+    if relSrange is not None:
+        relS = rel_s( S, Lmax = Lmax )
+        mask &= ( relS >= relSrange[0] ) & ( relS <= relSrange[1] )
+
+    return mask
+
+def ringLength( tfs, header, S = None ):
+    """
+    Length of the sequence: LENGTH header parameter if available, otherwise the maximum of the S column.
+    Used for rel_S by all readers, full and windowed.
+        -- S: S column of the full table if already read (otherwise only S is read from the file)
+    """
+    if header.get( 'LENGTH', 0 ): return header['LENGTH']
+    if S is not None: return S.max()
+
+    header, names, formats, offset, nlines = parse_header( tfs )
+    return readTable( tfs, offset, names, { 'S': float64 }, sep = r'\s+', usecols = ['S'] ).S.max()
+
+def read_tfs( tfs, floatType = float64, categorical = ['NAME', 'KEYWORD'], columns = None, Srange = None, relSrange = None, 
+              chunksize = None, verbose = 0 ):
+    """
+    Single-pass reader for TFS files (MAD-X twiss/survey output). Parameters are taken from the
+    @ lines, column names from the * line and column types from the $ line.
+        -- tfs:         path to the TFS file
+        -- floatType:   dtype for real columns, float64 (default) or float32 for compact frames
+        -- categorical: string columns stored as pandas categoricals
+        -- columns:     only parse and keep these columns (default: all)
+        -- Srange:      only keep rows with Smin <= S <= Smax
+        -- relSrange:   only keep rows with relSmin <= rel_S <= relSmax (ring length from the LENGTH header parameter)
+        -- chunksize:   stream the table in chunks of this many rows; defaults to 20000 if a window is given
+        -- verbose:     choose verbosity level
+
+    RETURNS: header dict and data frame
+    """
+    header, names, formats, offset, nlines = parse_header( tfs )
+
+    if columns is not None and not set( columns ).issubset( names ):
+        raise KeyError( 'columns not found in %s: %s' %(tfs, sorted( set(columns) - set(names) )) )
+
+    window = Srange is not None or relSrange is not None
+    if window and chunksize is None: chunksize = 20000
+
+    # parse only the requested columns (S is needed for the window selection)
+    #
+    usecols = None
+    if columns is not None: usecols = [ name for name in names if name in columns or ( window and name == 'S' ) ]
+
+    # categoricals are built after concatenating the chunks, such that all chunks share the same categories
+    #
+    dtypes = { name: tfsDtype( fmt, floatType ) for name, fmt in zip(names, formats) if usecols is None or name in usecols }
+    toCategory = [ name for name in categorical if dtypes.get( name ) is object ]
+    if chunksize is None:
+        for name in toCategory: dtypes[name] = 'category'
+
+    if verbose: print( 'reading', tfs, '\n    * header parameters:', len(header), '\n    * columns:', usecols or names )
+
+    select = None; stop = None
+    if window:
+        Lmax = 0
+        if relSrange is not None:
+            Lmax = ringLength( tfs, header )
+            if verbose: print( '    * rel_S window', relSrange, 'using ring length', Lmax )
+
+        select = lambda chunk: windowMask( chunk.S.values, Srange, relSrange, Lmax )
+
+        # S increases along the table: stop streaming once past the window
+        #
+        Sstop = [ Srange[1] ] if Srange is not None else []
+        if relSrange is not None and relSrange[0] >= 0: Sstop.append( relSrange[1] )
+        if Sstop: stop = lambda chunk: chunk.S.values[-1] > min( Sstop )
+
+    # fast path: MAD-X separates columns by blanks only, which the C tokenizer handles much quicker 
+    # than a whitespace regex; fall back to the generic separator for irregular rows (tabs)
+    #
+    with open( tfs, 'rb' ) as file:
+        file.seek( offset )
+        sep = r'\s+' if b'\t' in file.readline() else ' '
+
+    try:
+        df = readTable( tfs, offset, names, dtypes, sep = sep, usecols = usecols, chunksize = chunksize, select = select, stop = stop )
+    except ( ParserError, ValueError ):
+        if verbose: print( ' *** irregular separators in', tfs, '- falling back to generic whitespace parsing' )
+        df = readTable( tfs, offset, names, dtypes, sep = r'\s+', usecols = usecols, chunksize = chunksize, select = select, stop = stop )
+
+    if chunksize is not None:
+        for name in toCategory: df[name] = df[name].astype( 'category' )
+    if columns is not None and 'S' not in columns and 'S' in df: df = df.drop( columns = 'S' )
+
+    if verbose > 1: print( " DF contains: \n", df.keys(), "\n data types are: \n", df.dtypes )
+
+    return header, df
+
+# writing TFS files: every column is formatted into a fixed-width byte block (floats with %-formatting, integers
+# with vectorized integer arithmetic, strings once per distinct value), the blocks are put side by side and written
+# as one buffer per row block
+#
+def expDigits( x ):
+    """
+    Number of exponent digits (2 or 3) needed to write the float array x in exponential notation.
+    """
+    from numpy import abs as npabs, isfinite
+
+    a = npabs( x[ isfinite( x ) ] )
+    return 3 if ( ( a >= 1e99 ) | ( ( a > 0 ) & ( a < 1e-99 ) ) ).any() else 2
+
+def formatFloats( x, precision = 12, nExp = 2 ):
+    """
+    Format an array of floats in exponential notation with % .<precision-1>e, exponents padded to nExp digits, such
+    that all rows have the same width.
+        -- x:         float array
+        -- precision: number of significant digits; 17 digits round-trip every float64
+        -- nExp:      number of exponent digits (see expDigits)
+
+    RETURNS: uint8 array (N, width) with the characters, width = precision + 3 + nExp (+ 1 for the decimal point)
+    """
+    from numpy import asarray, isfinite, array, uint8
+
+    x = asarray( x, dtype = float64 )
+    width = precision + 3 + nExp + ( precision > 1 )
+
+    # % writes at least two exponent digits: rows that came out one short get the missing leading zero
+    # (formatting the list of floats is about twice as fast as numpy.char.mod on the array)
+    #
+    fmt = '%% .%ie' %(precision - 1)
+    text = array( [ fmt %v for v in x.tolist() ], dtype = 'S%i' %width )
+    out = text.view( uint8 ).reshape( len(x), width ).copy()
+    short = ( out[:, -1] == 0 ).nonzero()[0]
+    out[ short, -2: ] = out[ short, -3:-1 ]; out[ short, -3 ] = ord('0')
+
+    # nan and inf as text
+    #
+    for i in ( ~isfinite( x ) ).nonzero()[0]: out[i] = list( ( '%*s' %(width, x[i]) ).encode() )
+
+    return out
+
+def formatInts( x, digits ):
+    """
+    Format an integer array right aligned with a leading sign place.
+        -- digits: number of digits of the largest absolute value
+
+    RETURNS: uint8 array (N, digits + 1)
+    """
+    from numpy import asarray, abs as npabs, where, full, uint8, ones
+
+    x = asarray( x, dtype = int64 )
+    a = npabs( x )
+    nDigits = ones( len(x), dtype = int64 )
+    for k in range( 1, digits ): nDigits += a >= 10**k
+
+    out = full( (len(x), digits + 1), ord(' '), dtype = uint8 )
+    for j in range( digits ):
+        out[:, digits - j] = where( j < nDigits, ord('0') + ( a//10**j ) % 10, ord(' ') )
+
+    negative = ( x < 0 ).nonzero()[0]
+    out[ negative, digits - nDigits[negative] ] = ord('-')
+
+    return out
+
+def formatStrings( codes, uniques ):
+    """
+    Format factorized strings quoted and left aligned; every distinct value is formatted only once.
+        -- codes, uniques: output of pandas.factorize
+
+    RETURNS: uint8 array (N, width)
+    """
+    from numpy import asarray, frombuffer, uint8
+
+    quoted = asarray( [ ( '"%s"' %value ).encode() for value in uniques ] )
+    width = quoted.dtype.itemsize
+    table = frombuffer( quoted.tobytes(), dtype = uint8 ).reshape( len(uniques), width ).copy()
+    table[ table == 0 ] = ord(' ')
+
+    return table[codes]
+
+def tfsColumns( df, precision = 12 ):
+    """
+    Split a frame into TFS columns. Array valued cells (e.g. the rotation matrices W from ToEuclidian) are expanded
+    into one column per component, W -> W11 ... W33.
+
+    RETURNS: list of (name, format, values, width of the formatted values, formatting parameter)
+    """
+    from numpy import stack, ndindex, abs as npabs
+    from pandas import factorize
+    from pandas.api.types import is_float_dtype, is_integer_dtype, is_bool_dtype
+
+    def floatColumn( name, values ):
+        nExp = expDigits( values )
+        return (name, '%le', values, precision + 3 + nExp + ( precision > 1 ), nExp)
+
+    columns = []
+    for name in df.columns:
+        values = df[name]
+        if is_float_dtype( values.dtype ): columns.append( floatColumn( name, values.values.astype( float64 ) ) )
+        elif is_integer_dtype( values.dtype ) or is_bool_dtype( values.dtype ):
+            values = values.values.astype( int64 )
+            digits = len( str( npabs( values ).max() ) ) if len(values) else 1
+            columns.append( (name, '%d', values, digits + 1, digits) )
+        elif len(values) and hasattr( values.iloc[0], 'shape' ) and values.iloc[0].shape != ():
+            block = stack( values.values ).astype( float64 )
+            for index in ndindex( block.shape[1:] ):
+                columns.append( floatColumn( name + ''.join( str(i + 1) for i in index ), block[ (slice(None),) + index ] ) )
+        else:
+            codes, uniques = factorize( values.values, use_na_sentinel = False )
+            width = max( [ len( str(value) ) for value in uniques ] + [0] ) + 2
+            columns.append( (name, '%s', codes, width, list( uniques )) )
+
+    return columns
+
+def formatBlock( columns, precision = 12 ):
+    """
+    Format a block of table rows into bytes.
+        -- columns: list of (format, values of the block, column width, formatting parameter)
+    """
+    from numpy import full, uint8, concatenate
+
+    blocks = []
+    for fmt, values, width, param in columns:
+        if fmt == '%le': block = formatFloats( values, precision, param )
+        elif fmt == '%d': block = formatInts( values, param )
+        else: block = formatStrings( values, param )
+
+        # separator and padding to the column width: numbers right aligned, strings left aligned
+        #
+        pad = full( (len(block), 1 + width - block.shape[1]), ord(' '), dtype = uint8 )
+        blocks.append( concatenate( (pad, block) if fmt != '%s' else (pad[:, :1], block, pad[:, 1:]), axis = 1 ) )
+
+    blocks.append( full( (len(blocks[0]), 1), ord('\n'), dtype = uint8 ) )
+
+    return concatenate( blocks, axis = 1 ).tobytes()
+
+def headerLine( key, value ):
+    """
+    @ line of a TFS header, format taken from the type of the value.
+    """
+    from numpy import integer, bool_
+
+    if isinstance( value, str ): return '@ %-16s %%%02is "%s"\n' %(key, len(value), value)
+    elif isinstance( value, ( bool, int, integer, bool_ ) ): return '@ %-16s %%d %i\n' %(key, value)
+    else: return '@ %-16s %%le %.17g\n' %(key, value)
+
+def write_tfs( tfs, df, header = {}, precision = 12, blockRows = 50000, processes = 1, verbose = 0 ):
+    """
+    Write a frame as TFS file (@ header lines, * column names, $ column formats and the table), e.g. a twiss frame
+    extended by rel_S, x_EU, y_EU, z_EU, W and invented apertures, for MAD-X, SAD or MDISim.
+        -- tfs:       output path
+        -- df:        data frame; float columns are written as %le, integer/bool as %d, everything else as quoted %s,
+                      array valued columns are expanded (W -> W11 ... W33)
+        -- header:    dict {parameter: value} for the @ lines (e.g. the header returned by read_tfs)
+        -- precision: significant digits of real numbers
+        -- blockRows: number of rows formatted and written at once
+        -- processes: number of processes formatting row blocks in parallel (1: serial)
+        -- verbose:   choose verbosity level
+
+    RETURNS: path of the written file
+    """
+    columns = tfsColumns( df, precision )
+    widths = [ max( width, len(name) ) for name, fmt, values, width, param in columns ]
+
+    blocks = []
+    for start in range( 0, len(df), blockRows ):
+        blocks.append( [ (fmt, values[ start : start + blockRows ], width, param) for (name, fmt, values, w, param), width in zip( columns, widths ) ] )
+
+    with open( tfs, 'wb' ) as file:
+        file.write( ''.join( headerLine( key, value ) for key, value in header.items() ).encode() )
+        file.write( ( '*' + ''.join( ' %-*s' %(width, column[0]) for column, width in zip( columns, widths ) ) + '\n' ).encode() )
+        file.write( ( '$' + ''.join( ' %-*s' %(width, column[1]) for column, width in zip( columns, widths ) ) + '\n' ).encode() )
+
+        if processes > 1 and len(blocks) > 1:
+            with ProcessPoolExecutor( max_workers = processes ) as pool:
+                for text in pool.map( formatBlock, blocks, [precision]*len(blocks) ): file.write( text )
+        else:
+            for block in blocks: file.write( formatBlock( block, precision ) )
+
+    if verbose: print( 'written', len(df), 'rows,', len(columns), 'columns to', tfs )
+
+    return tfs
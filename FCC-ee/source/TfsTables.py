@@ -1,48 +1,102 @@
-from pandas import read_table
+from pandas import read_table, concat, Categorical
+from glob import glob
+from os import path
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
-from numpy import pi, double
+from numpy import pi, double, float64, dtype
+from TfsParser import read_tfs, write_tfs, parse_header, windowMask, ringLength
+from TfsCache import TfsCache
 from Tools import rel_s
 
 # read twiss files, should be as flexible as possible
 class TfsReader:
     
-    def __init__(self, tfs, verbose = 1):
+    def __init__(self, tfs, verbose = 1, cache = 0):
+        """
+            -- tfs:     path to the TFS file (or a data frame for checkRing)
+            -- verbose: choose verbosity level
+            -- cache:   TfsCache to use for parsed tables; 1 selects the default cache (TfsCache.defaultCacheDir,
+                        up to 5 GB on disk), 0 (default) disables caching
+        """
         self.tfs = tfs
         self.verbose = verbose
 
-    def read_twiss(self, relS = 0 ):
+        if isinstance( cache, TfsCache ): self.cache = cache
+        elif cache: self.cache = TfsCache( verbose = verbose )
+        else: self.cache = None
+        self.variant = None
+        self.header = None
+
+    def __fromCache( self, variant ):
         
+        self.variant = variant
+        if self.cache is None: return None
+
+        cached = self.cache.load( self.tfs, variant )
+        if cached is None: return None
+
+        self.header, df = cached
+        return df
+
+    def update_cache( self, df ):
         """
-        Function to read general twiss files.
-            -- relS:    choose if another column with relative S position is added (IP in the center)
-            -- verbose: choose verbosity level
+        Store a frame with additional derived columns (e.g. x_EU, y_EU, z_EU, W from ToEuclidian) in the cache,
+        such that the next read_twiss/read_survey with the same options returns it directly.
+            -- df: frame as returned by the last read call, extended by derived columns
+        """
+        if self.cache is None or self.variant is None: raise RuntimeError('no cached table to update: caching disabled or nothing read yet')
+        self.cache.store( self.tfs, self.header, df, self.variant )
+
+    def __readWindow( self, variant, relS, floatType, columns, Srange, relSrange, verbose ):
+        """
+        Read only the selected columns and the rows inside the S/rel_S window. A cached full table is
+        used if available, otherwise the file is streamed in chunks and not cached.
         """
+        self.variant = None
+        keep = None if columns is None else list( columns ) + [ 'rel_S' ] * relS
+
+        cached = None
+        if self.cache is not None: 
+            cached = self.cache.load( self.tfs, variant, columns = None if keep is None else keep + ['S'] )
+
+        if cached is not None:
+            self.header, df = cached
+            df = df[ windowMask( df.S.values, Srange, relSrange, ringLength( self.tfs, self.header, df.S.values ) ) ].reset_index( drop = True )
+        else:
+            self.header, df = read_tfs( self.tfs, floatType = floatType, columns = None if columns is None else list( columns ) + ['S'], 
+                                        Srange = Srange, relSrange = relSrange, verbose = verbose )
+            if relS: df["rel_S"] = rel_s( df.S.values, Lmax = ringLength( self.tfs, self.header ) )
+
+        if keep is not None: df = df[[ col for col in df.columns if col in keep ]]
+
+        return df
+
+    def read_twiss(self, relS = 0, floatType = float64, columns = None, Srange = None, relSrange = None ):
         
-        specDtypes = { 0:str,   1:str,     2:float,  3:float,  4:float,  5:float,  6:float,  7:float, 8:float,   9:float, 
-                      10:float, 11:float, 12:float, 13:float, 14:float, 15:float, 16:float, 17:float, 18:float, 19:float, 
-                      20:float, 21:float, 22:float, 23:float, 24:float, 25:float, 26:float, 27:float, 28:float, 29:float, 30:float, 
-                      31:str,   32:float, 33:float, 34:float, 35:float, 36:str,   37:float, 38:float, 39:float, 40:float, 41:float, 
-                      42:float, 43:float, 44:float, 45:float, 46:float, 47:float, 48:float, 49:float, 50:float, 51:float, 52:float,
-                      53:float, 54:float, 55:float, 56:float, 57:float, 58:float, 59:float, 60:float, 61:float, 62:float, 63:float, 
-                      64:float, 65:float, 66:float, 67:float, 68:float, 69:float, 70:float, 71:float, 72:float, 73:float, 74:float, 
-                      75:float, 76:float, 77:float, 78:float, 79:float } 
-
-        df = read_table( self.tfs, sep = r'\s+', comment = '@', skiprows=[47], dtype = specDtypes )
-
-        # read columns and drop the first one (*) to actually match the right header
-        #
-        twissHeader = df.columns[1:]
-        if self.verbose: print( 'set twiss header:', twissHeader )
+        """
+        Function to read general twiss files. Column names and types are taken from the file (* and $ lines).
+            -- relS:      choose if another column with relative S position is added (IP in the center, ring length
+                          from the LENGTH header or the maximum in S)
+            -- floatType: dtype for real columns, float64 (default) or float32
+            -- columns:   only read these columns, e.g. ['NAME', 'S', 'BETX', 'BETY'] (default: all)
+            -- Srange:    only read elements with Smin <= S <= Smax
+            -- relSrange: only read elements with relSmin <= rel_S <= relSmax
+            -- verbose:   choose verbosity level
+        """
+        
+        variant = 'twiss-relS%i-%s' %(relS, dtype(floatType).name)
+        if columns is not None or Srange is not None or relSrange is not None: 
+            return self.__readWindow( variant, relS, floatType, columns, Srange, relSrange, self.verbose )
 
-        # drop last NaN column and reset header 
-        # (1st single space in TWISS header causes the issue )
-        #
-        df.drop(df.columns[len(df.columns)-1], axis=1, inplace=True)
-        df.columns = twissHeader
+        df = self.__fromCache( variant )
+        if df is not None: return df
+
+        self.header, df = read_tfs( self.tfs, floatType = floatType, verbose = self.verbose )
+        if self.verbose: print( 'set twiss header:', df.columns )
 
-        # determine the maximum in S
+        # ring length for rel_S (LENGTH header, or the maximum in S), same as for windowed reads
         #
-        Lmax = df.S.max()
+        Lmax = ringLength( self.tfs, self.header, df.S.values )
 
         if self.verbose:
             print("----------------------------------")
@@ -51,45 +105,71 @@ class TfsReader:
 
         if relS: 
             print(" Add column 'rel_S' -- S position shifted with IP in the center. Using Lmax = ", Lmax)
-            df["rel_S"] = df.apply( lambda row: rel_s( df, row, Lmax = Lmax ), axis = 1 )
+            df["rel_S"] = rel_s( df.S.values, Lmax = Lmax )
         
+        if self.cache is not None: self.cache.store( self.tfs, self.header, df, self.variant )
+
         return df
 
+    def write_twiss( self, df, tfs, header = None, **kwargs ):
+        """
+        Write a (derived) twiss or survey frame to a TFS file, see TfsParser.write_tfs.
+            -- df:     frame to write, e.g. after adding rel_S, x_EU, y_EU, z_EU, W or apertures
+            -- tfs:    output path
+            -- header: @ parameters; default: the header of the file read by this reader
+            -- kwargs: precision, blockRows, processes passed to write_tfs
+        """
+        if header is None: header = self.read_header()
+
+        return write_tfs( tfs, df, header, verbose = self.verbose, **kwargs )
+
+    def read_header( self ):
+        """
+        Parse the @ lines of the file once and keep them on the reader (also set by read_twiss/read_survey).
+
+        RETURNS: header dict {parameter: typed value}
+        """
+        if self.header is None: self.header = parse_header( self.tfs )[0]
+
+        return self.header
+
     def read_twiss_header( self, parameter ):
+        """
+        Access header parameters, e.g. 'GAMMA', 'EX' or 'PARTICLE'. Strings are returned as str, numbers as double.
+            -- parameter: name of a parameter or list of names
+
+        RETURNS: value, or list of values if a list of names is given
+        """
+        header = self.read_header()
         
-        header = read_table( self.tfs, nrows = 45, sep = r'\s+' )
-        header = header.drop( header.columns[[0, 2]], axis = 1 )
-        
-        header.columns = ['Parameter', 'Value']
-        
-        param = header.loc[ header.Parameter == parameter,'Value'].values[0]
-        if parameter == 'PARTICLE': param = str( param )
-        else: param = double( param )
+        if isinstance( parameter, str ): names = [parameter]
+        else: names = list( parameter )
+
+        params = [ header[name] if isinstance( header[name], str ) else double( header[name] ) for name in names ]
         
-        if self.verbose: print( param, type(param))
+        if self.verbose: print( dict( zip(names, params) ) )
 
-        return param
+        if isinstance( parameter, str ): return params[0]
+        return params
     
-    def read_survey(self, relS = 0, verbose = 0):
+    def read_survey(self, relS = 0, verbose = 0, floatType = float64, columns = None, Srange = None, relSrange = None ):
         """
         Function to read general survey files.
+            -- columns, Srange, relSrange: restrict the columns and rows read, see read_twiss
         """
         
-        surveyDF = read_table( self.tfs, sep = r'\s+', comment = '@', skiprows = [7], index_col = False, dtype = float )
-        
-        # read columns and drop the first one (*) to actually match the right header
-        #
-        surveyHeader = surveyDF.columns[1:]
-        
-        # drop last column and reset header
-        # (1st single space in SURVEY header causes the issue)
-        #
-        surveyDF.drop( surveyDF.columns[len(surveyDF.columns)-1], axis = 1, inplace = True )
-        surveyDF.columns = surveyHeader
+        variant = 'survey-relS%i-%s' %(relS, dtype(floatType).name)
+        if columns is not None or Srange is not None or relSrange is not None: 
+            return self.__readWindow( variant, relS, floatType, columns, Srange, relSrange, verbose )
+
+        surveyDF = self.__fromCache( variant )
+        if surveyDF is not None: return surveyDF
+
+        self.header, surveyDF = read_tfs( self.tfs, floatType = floatType, verbose = verbose )
         
-        # determine maximum in S 
+        # ring length for rel_S (LENGTH header, or the maximum in S), same as for windowed reads
         #
-        Lmax = surveyDF.S.max()
+        Lmax = ringLength( self.tfs, self.header, surveyDF.S.values )
         
         if verbose:
             print("----------------------------------")
@@ -98,7 +178,9 @@ class TfsReader:
 
         if relS: 
             print(" Add column 'rel_S' -- S position shifted with IP in the center. Using Lmax = ", Lmax)
-            surveyDF["rel_S"] = surveyDF.apply( lambda row: rel_s( surveyDF, row, Lmax = Lmax ), axis = 1 )
+            surveyDF["rel_S"] = rel_s( surveyDF.S.values, Lmax = Lmax )
+
+        if self.cache is not None: self.cache.store( self.tfs, self.header, surveyDF, self.variant )
 
         return surveyDF
 
@@ -113,7 +195,7 @@ class TfsReader:
         
         if relS: 
             print(" Add column 'rel_S' -- S position shifted with IP in the center.")
-            df["rel_S"] = df.apply( lambda row: rel_s( df, row ), axis = 1 )
+            df["rel_S"] = rel_s( df.S.values )
             
         return df
 
@@ -131,3 +213,65 @@ class TfsReader:
             fudge = 2*pi - angleSum
             print (" ** Ring not closed - offset of: ", fudge)           
 
+
+# batch loading of several optics versions
+#
+def readOne( args ):
+    """
+    Worker for read_optics: read a single twiss or survey file, returns (header, frame).
+    """
+    tfs, kind, relS, columns, cache = args
+    reader = TfsReader( tfs, verbose = 0, cache = cache )
+    
+    if kind == 'survey': df = reader.read_survey( relS = relS, columns = columns )
+    else: df = reader.read_twiss( relS = relS, columns = columns )
+
+    return reader.header, df
+
+def read_optics( files, kind = 'twiss', relS = 0, columns = None, processes = None, cache = 0, verbose = 0 ):
+    """
+    Read many optics versions in a process pool and combine them into one frame indexed by (optics, NAME, n), with
+    n counting repeated names (drifts, markers) within one version. NAME and KEYWORD share one categorical
+    dictionary across all versions, such that comparisons between versions are plain vectorized joins,
+    e.g. batch.BETX.unstack('optics').
+        -- files:     glob pattern, list of files or dict {optics: file}; for lists the optics name is the file name without extension
+        -- kind:      'twiss' or 'survey'
+        -- relS:      add rel_S column
+        -- columns:   only read these columns (default: all); NAME is always read
+        -- processes: number of worker processes (default: number of CPUs, 1 reads in this process)
+        -- cache:     cache argument of TfsReader (default: no caching)
+        -- verbose:   choose verbosity level
+
+    RETURNS: data frame indexed by (optics, NAME, n); the headers are stored in df.attrs['headers']
+    """
+    if isinstance( files, str ): files = sorted( glob( files ) )
+    if not isinstance( files, dict ): files = { path.splitext( path.basename(f) )[0]: f for f in files }
+    if len(files) == 0: raise FileNotFoundError( 'no TFS files to read' )
+
+    optics = list( files.keys() )
+    if columns is not None and 'NAME' not in columns: columns = ['NAME'] + list( columns )
+    jobs = [ (files[opt], kind, relS, columns, cache) for opt in optics ]
+    if verbose: print( 'reading', len(jobs), kind, 'files:', optics )
+
+    if processes == 1: results = list( map( readOne, jobs ) )
+    else:
+        with ProcessPoolExecutor( max_workers = processes ) as pool: results = list( pool.map( readOne, jobs ) )
+
+    # shared dictionaries for the string columns
+    #
+    frames = [ df for header, df in results ]
+    for col in ['NAME', 'KEYWORD']:
+        if not all( col in df for df in frames ): continue
+        categories = sorted( set().union( *[ df[col].astype( 'category' ).cat.categories for df in frames ] ) )
+        for df in frames: df[col] = Categorical( df[col], categories = categories )
+
+    for opt, df in zip( optics, frames ): df.insert( 0, 'optics', opt )
+    batch = concat( frames, ignore_index = True )
+    batch['optics'] = Categorical( batch.optics, categories = optics )
+    batch['n'] = batch.groupby( ['optics', 'NAME'], observed = True, sort = False ).cumcount()
+    batch = batch.set_index( ['optics', 'NAME', 'n'] )
+    batch.attrs['headers'] = { opt: header for opt, (header, df) in zip( optics, results ) }
+
+    if verbose: print( 'combined frame:', batch.shape, 'with', len(optics), 'optics' )
+
+    return batch
@@ -1,13 +1,18 @@
-from numpy import int, float32, sqrt, array, random, pi, sin, cos
+from numpy import sqrt, random, pi, sin, cos, column_stack
 from Tools import sbplSetUp
-from CS_to_EU import getRotVec3, RotToZ, RotFrmZ
+from CS_to_EU import getRotVec3Arr, RotToZArr, RotFrmZArr
 from BeamGen import Beam
 import matplotlib.pyplot as plt
 
 # input all global parameters for the beam here at initialization (as a dict)? 
 class Scatter():
 
-    def __init__(self, beamfile, tfs, Emit, Npart, HalfCross, pc, T, plot = 0, plotpath = '/tmp/', save = 0, verbose = 0 ):
+    def __init__(self, beamfile, tfs, Emit, Npart, HalfCross, pc, T, plot = 0, plotpath = '/tmp/', save = 0, seed = None, sampler = 'rejection', verbose = 0 ):
+        """
+        Inverse Compton scattering of thermal photons on the beam. All stages work on (Npart,4) arrays of four-momenta.
+            -- seed:    seed or numpy Generator for the random numbers (None: fresh entropy)
+            -- sampler: 'rejection' or 'table', method of genPlanck and genComptArr
+        """
         self.beamfile = beamfile
         self.tfs = tfs
         self.Emit = Emit
@@ -15,10 +20,12 @@ class Scatter():
         self.HalfCross = HalfCross
         self.pc = pc
         self.T = T
-        self.plot = plot,
-        self.plotpath = plotpath,
+        self.plot = plot
+        self.plotpath = plotpath
         self.save = save
         self.verbose = verbose
+        self.rng = random.default_rng( seed )
+        self.sampler = sampler
         if verbose > 1: print( 'check init arguments:', self.beamfile, '\n', self.tfs, '\n', self.Npart, '\n', self.HalfCross, '\n', self.pc, '\n', self.T )
 
         self.m0 = 511e-6 # in [GeV]
@@ -26,23 +33,26 @@ class Scatter():
         self.verbCond = self.verbose and self.Npart < 1e5
         
 
-    def genBeam( self, elm ):
-        b1 = Beam( self.beamfile, elm, self.tfs, self.Emit, self.Npart, self.HalfCross, self.pc )
-        b1.set_gauss( )
+    def genBeam( self, elm, beam = None ):
+        """
+        Incoming electrons at elm. A Beam passed in (as in run) is reused, only Npart new particles are drawn.
+        """
+        if beam is None: b1 = Beam( self.beamfile, elm, self.tfs, self.Emit, self.Npart, self.HalfCross, self.pc, seed = self.rng )
+        else: b1 = beam; b1.Npart = self.Npart
         # p_e = b1.gen_BeamMom( elm )
-        p_e = b1.generate_Bunch()[1]
+        p_e = b1.generate_BunchArr()[1]
 
         # generate beam energy based on normal distribution (2% acceptance), calculate lorentz gamma and beta
-        Scatter.Ebeam = b1.gen_BeamEnergy(self.pc, 0.02*self.pc)
-        Scatter.Gamm = Scatter.Ebeam/self.m0
-        Scatter.Bet = sqrt(1 - 1/Scatter.Gamm**2)
+        self.Ebeam = b1.gen_BeamEnergyArr( self.pc, 0.02*self.pc )
+        self.Gamm = self.Ebeam/self.m0
+        self.Bet = sqrt(1 - 1/self.Gamm**2)
 
         # calculate momentum (energy - restmass)
         Pbeam = sqrt( self.Ebeam**2 - self.m0**2 )
 
         # build incoming electron four-momentum
         # 
-        Scatter.qe_in = array( [ array([enrg, pbem*vec[0], pbem*vec[1], pbem*vec[2]]) for vec,enrg,pbem in zip(p_e, self.Ebeam, Pbeam)] )
+        self.qe_in = column_stack( (self.Ebeam, Pbeam[:, None]*p_e) )
         # qe_in2= [ fourMom2(vec) for vec in qe_in]
         
         # some visualization of the inital four momentum
@@ -50,7 +60,7 @@ class Scatter():
         if self.plot:
             axs = sbplSetUp(4)
             for j in range(0,4):
-                axs[j].hist([mom[j] for mom in Scatter.qe_in], bins = 100)
+                axs[j].hist( self.qe_in[:, j], bins = 100 )
                 axs[j].set_xlabel(self.labels[j])
             plt.tight_layout()
             print( 'plot incoming electron 4momentum' )
@@ -59,13 +69,13 @@ class Scatter():
 
         # rotate the beam exactly to z direction (in most cases rather minor correction)
         #
-        Scatter.angles_qe = array( [getRotVec3(vec) for vec in p_e] )
-        Scatter.qe_in_z = array([RotToZ(ang[0], ang[1]) @ vec for vec,ang in zip(Scatter.qe_in, Scatter.angles_qe)])
+        self.angles_qe = column_stack( getRotVec3Arr(p_e) )
+        self.qe_in_z = RotToZArr( self.angles_qe[:, 0], self.angles_qe[:, 1], self.qe_in )
 
         if self.plot:
             axs = sbplSetUp(4)
             for j in range(0,4):
-                axs[j].hist( [mom[j] for mom in Scatter.qe_in_z], bins = 100 )
+                axs[j].hist( self.qe_in_z[:, j], bins = 100 )
                 axs[j].set_xlabel(self.labels[j])
             plt.tight_layout()
             print( 'plot 4momentum after rotating qe_in_z to z \n' )
@@ -73,7 +83,7 @@ class Scatter():
             # if self.save: plt.savefig( self.plotpath + '', dpi = 75 )
         
         if self.verbCond:
-            print( 'length(p_e)', len(p_e), '\n p_e =', p_e, '\n qe_in =', Scatter.qe_in, '\n angles_qe =', Scatter.angles_qe, '\n qe_in_z =', Scatter.qe_in_z )
+            print( 'length(p_e)', len(p_e), '\n p_e =', p_e, '\n qe_in =', self.qe_in, '\n angles_qe =', self.angles_qe, '\n qe_in_z =', self.qe_in_z )
 
     def genPhot(self):
         """
@@ -84,96 +94,96 @@ class Scatter():
         from VisualSpecs import myColors as colors
         k = 8.617e-5 # given in [eV/K]
 
-        values = genPlanck(self.Npart)
-        Scatter.Ei = k*self.T*values
+        values = genPlanck( self.Npart, self.rng, method = self.sampler )
+        self.Ei = k*self.T*values
 
         if self.plot:
             plotname = "initial photon energy"
             plt.figure( figsize = (16, 9) )
-            plt.hist( Scatter.Ei, histtype = 'step', lw = 2.5, color = colors[3], bins = 200 )
+            plt.hist( self.Ei, histtype = 'step', lw = 2.5, color = colors[3], bins = 200 )
             plt.xlabel('$E_\\gamma$ [eV]'); plt.ylabel('photons/bin')
             plt.title( plotname )
 
             if self.save: plt.savefig( '/tmp/initial photon energy.pdf', bbox_inches = 'tight', dpi = 75 )
          
         if self.verbCond:
-            print('len(Ei) =', len(Scatter.Ei), 'Ei =', Scatter.Ei)
+            print('len(Ei) =', len(self.Ei), 'Ei =', self.Ei)
        
         # generate cosPsi, sinPsi and phi
         #
-        CosPsi = array( [random.uniform(-1,1) for i in range(self.Npart)] )
-        SinPsi = array( [sqrt(1 - cos**2) for cos in CosPsi] )
-        Phi = array( [random.uniform(0,2*pi) for i in range(self.Npart)] )
+        CosPsi = self.rng.uniform( -1, 1, self.Npart )
+        SinPsi = sqrt(1 - CosPsi**2)
+        Phi = self.rng.uniform( 0, 2*pi, self.Npart )
 
         # construct incoming photon four momentum and roate by same amount as qp_e_in
-        Scatter.qk_in = array([array([val, val*cos(phi)*sinPsi, val*sinPsi*sin(phi), val*cosPsi ]) for val, sinPsi, cosPsi, phi in zip(self.Ei, SinPsi, CosPsi, Phi)])
-        Scatter.qk_in_z = array([ RotToZ(ang[0], ang[1]) @ qk for qk,ang in zip( Scatter.qk_in, Scatter.angles_qe )])
+        Ei = self.Ei
+        self.qk_in = column_stack( (Ei, Ei*cos(Phi)*SinPsi, Ei*SinPsi*sin(Phi), Ei*CosPsi) )
+        self.qk_in_z = RotToZArr( self.angles_qe[:, 0], self.angles_qe[:, 1], self.qk_in )
         # qk2 = [ fourMom2(qkz) for qkz in qk_in_z ]
 
 
         # some visualization
         #
         if self.verbCond:
-            print( 'len(qk_in) =', len(Scatter.qk_in), '\n len(qk_in_z) =', len(Scatter.qk_in_z) )  
+            print( 'len(qk_in) =', len(self.qk_in), '\n len(qk_in_z) =', len(self.qk_in_z) )  
             axs = sbplSetUp(4)
             for j in range(4):
-                axs[j].hist( [vec[j] for vec in Scatter.qk_in], bins = 100 )
+                axs[j].hist( self.qk_in[:, j], bins = 100 )
             axs1 = sbplSetUp(4)
             for j in range(4):
-                axs1[j].hist( [vec[j] for vec in Scatter.qk_in_z], bins = 100)
+                axs1[j].hist( self.qk_in_z[:, j], bins = 100 )
             # plt.figure(); plt.plot( qk2 ); plt.xlabel('#'); plt.ylabel('$q_k^2$');
 
     def toREST(self):
-        from RelKin import Boost
+        from RelKin import BoostArr
 
         # boost into e-rest frame along z axis
         #
-        Scatter.qkstar = array( [Boost( gam, bet) @ qk for gam,bet,qk in zip(Scatter.Gamm, Scatter.Bet, Scatter.qk_in_z) ] )
-        pk_star = array( [array([vec[1], vec[2], vec[3]]) for vec in Scatter.qkstar] )
-        Scatter.qestar = array( [Boost( gam, bet) @ qe for gam, bet, qe in zip(Scatter.Gamm, Scatter.Bet, Scatter.qe_in_z) ] )
+        self.qkstar = BoostArr( self.Gamm, self.Bet, self.qk_in_z )
+        pk_star = self.qkstar[:, 1:]
+        self.qestar = BoostArr( self.Gamm, self.Bet, self.qe_in_z )
 
         # qkst2 = [ fourMom2(qkst) for qkst in qkstar ]
         # qest2 = [ fourMom2(qest) for qest in qestar ]
 
-        Scatter.angles_from_z = [getRotVec3(pk) for pk in pk_star]
+        self.angles_from_z = column_stack( getRotVec3Arr(pk_star) )
 
         # some visualization
         #
         if self.verbCond:
-            print( 'qkstar =', Scatter.qkstar, '\n pk_star =', pk_star, '\n qestar =', Scatter.qestar )
+            print( 'qkstar =', self.qkstar, '\n pk_star =', pk_star, '\n qestar =', self.qestar )
             axs = sbplSetUp(4, [10, 15])
             for j in range(0,4):
-                axs[j].hist( [vec[j] for vec in Scatter.qkstar], bins = 100 ); 
+                axs[j].hist( self.qkstar[:, j], bins = 100 )
                 axs[j].set_xlabel(self.labels[j])
 
             axs1 = sbplSetUp(4, [10, 15])
             for j in range(0,4):
-                axs1[j].hist( [vec[j] for vec in Scatter.qestar], bins = 100 )
+                axs1[j].hist( self.qestar[:, j], bins = 100 )
             # plt.tight_layout()
             # print(len(qkstar))
 
 
     def compt(self):
 
-        from Generators import genCompt, kratio
+        from Generators import genComptArr, kratio
 
-        cost = [ genCompt( qkst[0], self.m0 )[0] for qkst in Scatter.qkstar ]
-        print( 'cost =', cost )
-        sint = [ sqrt(1 - cos**2) for cos in cost]
-        phi = [ random.uniform(0,2*pi) for i in range(self.Npart)]
+        cost = genComptArr( self.qkstar[:, 0], self.m0, self.rng, method = self.sampler )
+        sint = sqrt(1 - cost**2)
+        phi = self.rng.uniform( 0, 2*pi, self.Npart )
 
         # photon energy after scattering
         #
-        # krat = array( [kratio(self.m0, qkst[0], costhet) for qkst, costhet in zip(Scatter.qkstar, cost)] )
-        kstar = [ qkst[0]*kratio(self.m0, qkst[0], costhet) for qkst,costhet in zip(Scatter.qkstar,cost) ]
+        # krat = array( [kratio(self.m0, qkst[0], costhet) for qkst, costhet in zip(self.qkstar, cost)] )
+        kstar = self.qkstar[:, 0]*kratio( self.m0, self.qkstar[:, 0], cost )
 
         # photon four momentum after scattering
         #
-        Scatter.qkstar_sct_z = array( [ array([kst, kst*sinthet*cos(Phi), kst*sinthet*sin(Phi), kst*costhet]) for kst,sinthet,costhet,Phi in zip(kstar, sint, cost, phi)] )
+        self.qkstar_sct_z = column_stack( (kstar, kstar*sint*cos(phi), kstar*sint*sin(phi), kstar*cost) )
         # qkstsct2 = [ fourMom2(qkstsct) for qkstsct in qkstar_sct_z ]
 
         if self.verbCond:
-            print('kstar =', kstar, '\n qkstar_sct_z =', Scatter.qkstar_sct_z )
+            print('kstar =', kstar, '\n qkstar_sct_z =', self.qkstar_sct_z )
             axs = sbplSetUp(4)
             axs[0].hist( kstar, bins = 200); axs[0].set_xlabel('$E$')
             axs[2].hist( cost, bins = 200); axs[2].set_xlabel('$cos\\theta$')
@@ -181,33 +191,139 @@ class Scatter():
 
             axs1 = sbplSetUp(4)
             for j in range(4):
-                axs1[j].hist( [qkst[j] for qkst in Scatter.qkstar_sct_z], bins = 200)
+                axs1[j].hist( self.qkstar_sct_z[:, j], bins = 200 )
                 axs1[j].set_xlabel(self.labels[j])
 
             plt.tight_layout()
 
 
     def toLAB(self):
-        from RelKin import Boost
+        from RelKin import BoostArr
         
         # First, rotate back from z
         #
-        qkstar_sct = array( [RotFrmZ( ang[0], ang[1] ) @ qkstz for ang,qkstz in zip(Scatter.angles_from_z, Scatter.qkstar_sct_z)] )
+        qkstar_sct = RotFrmZArr( self.angles_from_z[:, 0], self.angles_from_z[:, 1], self.qkstar_sct_z )
 
         # then, boost back to LAB
         #
-        qk_out_z = array( array([ Boost( gam, bet ) @ qksctz for gam,bet,qksctz in zip(Scatter.Gamm, Scatter.Bet, qkstar_sct)]) )
+        qk_out_z = BoostArr( self.Gamm, self.Bet, qkstar_sct )
         # qk_out_z2 = array( [ fourMom2(qkoutz) for qkoutz in qk_out_z ] )
 
 
         # return only the final energy 'qe_out_z '
-        qe_out_z = Scatter.qe_in + Scatter.qk_in - qk_out_z 
+        qe_out_z = self.qe_in + self.qk_in - qk_out_z 
         return qe_out_z, qk_out_z
 
+    def run( self, elm, output, chunk = 1000000, meta = {} ):
+        """
+        Streaming mode: generate and scatter Npart events in chunks through all stages and append the final state
+        electrons and photons to a columnar file (Columnar.ColumnWriter). Peak memory is set by chunk, not by Npart.
+            -- elm:    element at which the beam is generated
+            -- output: directory of the columnar output, columns qe_E, qe_px, qe_py, qe_pz, qk_E, ..., qk_pz
+            -- chunk:  events per chunk
+            -- meta:   additional information stored with the output
+
+        RETURNS: number of events written
+        """
+        from Columnar import ColumnWriter
 
+        Npart = self.Npart
+        labels = ['E', 'px', 'py', 'pz']
+        meta = dict( meta, element = elm, Npart = Npart, pc = self.pc, T = self.T, sampler = self.sampler )
 
- 
-
+        # beam file, twiss table and optics at elm are set up once, each chunk only draws new particles
+        #
+        beam = Beam( self.beamfile, elm, self.tfs, self.Emit, min( chunk, Npart ), self.HalfCross, self.pc, seed = self.rng )
+
+        try:
+            with ColumnWriter( output, meta ) as writer:
+                for start in range( 0, Npart, chunk ):
+                    self.Npart = min( chunk, Npart - start )
+
+                    self.genBeam( elm, beam ); self.genPhot(); self.toREST(); self.compt()
+                    qe_out_z, qk_out_z = self.toLAB()
+
+                    columns = { 'qe_' + lab: qe_out_z[:, j] for j, lab in enumerate( labels ) }
+                    columns.update({ 'qk_' + lab: qk_out_z[:, j] for j, lab in enumerate( labels ) })
+                    writer.append( columns )
+
+                    if self.verbose: print( 'Scatter.run: wrote events', start, 'to', start + self.Npart, 'of', Npart )
+        finally:
+            self.Npart = Npart
+
+        return writer.rows
+
+
+# parallel runs: the events are split into one shard per worker process, each with its own random stream spawned from
+# a master SeedSequence. Results depend only on the master seed and the number of processes.
+#
+def runShard( args ):
+    """
+    Worker for runParallel: stream one shard of events into its own columnar output and histogram it.
+    """
+    from Columnar import load_column
+    from numpy import histogram, zeros, int64
+
+    kwargs, elm, output, chunk, seed, histograms = args
+    scatter = Scatter( seed = random.default_rng( seed ), **kwargs )
+    rows = scatter.run( elm, output, chunk )
+
+    counts = {}
+    for col, edges in histograms.items():
+        counts[col] = zeros( len(edges) - 1, dtype = int64 )
+        if rows == 0: continue
+
+        values = load_column( output, col )
+        for start in range( 0, rows, chunk ): counts[col] += histogram( values[ start : start + chunk ], edges )[0]
+
+    return rows, counts
+
+def runParallel( elm, output, Npart, processes = None, seed = 0, chunk = 1000000, histograms = {}, verbose = 0, **kwargs ):
+    """
+    Run a Scatter job sharded over worker processes and merge the outputs.
+        -- elm:        element at which the beam is generated
+        -- output:     directory of the merged columnar output (see Scatter.run), shards are written to output/shardNNN
+        -- Npart:      total number of events
+        -- processes:  number of worker processes = shards (default: number of CPUs, at most Npart; 1 runs in this process)
+        -- seed:       master seed, worker i uses the i-th stream spawned from SeedSequence(seed)
+        -- chunk:      events per chunk in the workers
+        -- histograms: dict {column: bin edges} of output columns to histogram (summed over all shards)
+        -- verbose:    choose verbosity level
+        -- kwargs:     further arguments of Scatter (beamfile, tfs, Emit, HalfCross, pc, T, sampler, ...)
+
+    RETURNS: number of events, dict {column: (counts, edges)}; the histograms are also stored in output/histograms.npz
+    """
+    from os import cpu_count, path
+    from shutil import rmtree
+    from concurrent.futures import ProcessPoolExecutor
+    from numpy import savez
+    from Columnar import concat_frames
+
+    processes = max( 1, min( processes or cpu_count(), Npart ) )
+    seeds = random.SeedSequence( seed ).spawn( processes )
+    shares = [ Npart//processes + ( i < Npart%processes ) for i in range( processes ) ]
+    shards = [ path.join( output, 'shard%03i' %i ) for i in range( processes ) ]
+
+    jobs = [ ( dict( kwargs, Npart = n, plot = 0, verbose = verbose ), elm, shard, chunk, sd, histograms ) for n, shard, sd in zip( shares, shards, seeds ) ]
+    if verbose: print( 'runParallel:', Npart, 'events in', processes, 'shards', shares )
+
+    try:
+        if processes == 1: results = list( map( runShard, jobs ) )
+        else:
+            with ProcessPoolExecutor( max_workers = processes ) as pool: results = list( pool.map( runShard, jobs ) )
+
+        # merge shard outputs in shard order and sum the histograms
+        #
+        rows = concat_frames( shards, output, chunk, meta = dict( element = elm, Npart = Npart, seed = seed, processes = processes, shards = shares ) )
+    finally:
+        for shard in shards: rmtree( shard, ignore_errors = True )
 
+    hists = { col: ( sum( counts[col] for n, counts in results ), edges ) for col, edges in histograms.items() }
+    if hists:
+        arrays = {}
+        for col, ( counts, edges ) in hists.items(): arrays[col] = counts; arrays[col + '_edges'] = edges
+        savez( path.join( output, 'histograms.npz' ), **arrays )
 
+    if verbose: print( 'runParallel: merged', rows, 'events into', output )
 
+    return rows, hists
@@ -1,65 +1,45 @@
 import matplotlib.pyplot as plt
-from numpy import sqrt
+from numpy import sqrt, where, asarray
 
 # fuction to calculate S with IP in the center
 #
-def rel_s( df, row, Lmax = 0):
+def rel_s( S, Lmax = 0 ):
     """
     Shift the IP in the center of S. (KEK convention SAD, LER?)
+    Works on scalars as well as on whole columns (Series/arrays/lists) in one go.
+        -- S:    S position(s) along the ring
+        -- Lmax: ring length; if 0, the maximum of S is used
+
+    RETURNS: ndarray of the same shape as S (0-d for a scalar), shifted by -Lmax for positions beyond Lmax/2
     """
-    if Lmax == 0:
-        if row['S'] > df.S.max()/2:
-            rel_s = row['S'] - df.S.max()  
-        else:
-            rel_s = row['S']
-    else:
-        if row['S'] > Lmax/2: rel_s = row['S'] - Lmax
-        else: rel_s = row['S']
-    
-    return rel_s
-
-# # old convention
-#     def rel_s( self, df, row ):
-#         """
-#         Shift the IP in the center of S.
-#         """
-#         if row['S'] < df.S.max()/2:
-#             rel_s = -row['S']
-#         elif row['S'] > df.S.max()/2:
-#             rel_s = df.S.max() - row['S']
-        
-#         return rel_s
+    S = asarray( S )
+    if Lmax == 0: Lmax = S.max()
+
+    return where( S > Lmax/2, S - Lmax, S )
+
+# old convention (negated S, KEK)
+#
+def rel_s_neg( S, Lmax = 0 ):
+    """
+    Shift the IP in the center of S, old convention with negative S upstream of the IP.
+        -- S:    S position(s) along the ring
+        -- Lmax: ring length; if 0, the maximum of S is used
+
+    RETURNS: ndarray of the same shape as S (0-d for a scalar)
+    """
+    S = asarray( S )
+    if Lmax == 0: Lmax = S.max()
+
+    return where( S < Lmax/2, -S, Lmax - S )
 
 def calcAper(s):
-    r = 0.040
-    if((-3.640000000 <= s) & (s < -2.725000000)): r = .040000000
-    if((-2.725000000 <= s) & (s < -2.675000000)): r = (-0.100000) * s + (-.232500000)
-    if((-2.675000000 <= s) & (s < -1.750000000)): r = .035000000
-    if((-1.750000000 <= s) & (s < -1.630000000)): r = (-0.100000) * s + (-.140000000)
-    if((-1.630000000 <= s) & (s < -1.590000000)): r = (-0.025000) * s + (-.017750000)
-    if((-1.590000000 <= s) & (s < -1.252000000)): r = .022000000
-    if((-1.252000000 <= s) & (s < -1.172000000)): r = (-0.100000) * s + (-.103200000)
-    if((-1.172000000 <= s) & (s < -1.092000000)): r = (-0.006250) * s + (.006675000)
-    if((-1.092000000 <= s) & (s <  -.620500000)): r = .013500000
-    if(( -.620500000 <= s) & (s <  -.452000000)): r = (-0.020772) * s + (0.000611276)
-    if(( -.452000000 <= s) & (s <  -.220000000)): r = (-0.021552) * s + (0.000258621)
-    if(( -.220000000 <= s) & (s <  -.203340000)): r = (-0.002401) * s + (.004471789)
-    if(( -.203340000 <= s) & (s <  -.112170000)): r = (0.003071) * s + (.005584495)
-    if(( -.112170000 <= s) & (s <   .094990000)): r = (0.004007) * s + (.005689416)
-
-    if(( .094990000 <= s) & (s <  .245000000)):   r = (0.026198) * s + (.003581428)
-    if(( .245000000 <= s) & (s <  .620500000)):   r = (0.009321) * s + (.007716378)
-    if(( .620500000 <= s) & (s < 1.092000000)):   r = .013500000
-    if((1.092000000 <= s) & (s < 1.172000000)):   r = (0.006250) * s + (.006675000)
-    if((1.172000000 <= s) & (s < 1.252000000)):   r = (0.100000) * s + (-.103200000)
-    if((1.252000000 <= s) & (s < 1.590000000)):   r = .022000000
-    if((1.590000000 <= s) & (s < 1.630000000)):   r = (0.025000) * s + (-.017750000)
-    if((1.630000000 <= s) & (s < 1.750000000)):   r = (0.100000) * s + (-.140000000)
-    if((1.750000000 <= s) & (s < 2.350000000)):   r = .035000000
-    if((2.350000000 <= s) & (s < 2.400000000)):   r = (0.100000) * s + (-.200000000)
-    if((2.400000000 <= s) & (s < 3.315000000)):   r = .040000000
-    
-    return r
+    """
+    Aperture radius of the FCC-ee IR vacuum chamber at rel_S position(s) s. Accepts scalars and arrays;
+    see Aperture.ApertureProfile for other layouts.
+    """
+    from Aperture import fccIRProfile
+
+    return fccIRProfile(s)
 
 # easier way to setup a subplot arrangement
 #
@@ -83,14 +63,16 @@ def sbplSetUp(count, dim = [15,10], asp = 'auto'):
 
 # quicker way to access twiss parameters for a given element
 #
-def readTwissParams(tfs, elm):
-    i = 0
-    with open( tfs ) as file:
-        for line in file:
-            if line.startswith(' \"%s\"' %elm):
-                print('Element,', elm, 'at line', i)
-                break
-            i += 1
+def readTwissParams(tfs, elm, cache = 0):
+    """
+    Line number of an element row in a twiss file. Uses the byte-offset index (TfsIndex); use TfsIndex.row
+    to get the typed values directly.
+        -- cache: TfsCache (1: the default cache) to build the index once per file, 0: build it per call
+    """
+    from TfsIndex import TfsIndex
+
+    i = TfsIndex( tfs, cache = cache ).line( elm )
+    print('Element,', elm, 'at line', i)
     return i
 
 # add apertures in drift spaces to simplify plotting
@@ -143,10 +125,9 @@ def sigm(bet, disp, eps, delP, scaleXY):
 # radii = [151.631e3, 144.688e3]
 # epsC= [ epsCrit(Lrnt, rh)/1e3 for rh in radii] 
 
-import re
 def collSet( geomFile, collName, collh, thickness, verbose = 0 ):
     """
-    Tool to change aperture in the geometry in the GDML directly. 
+    Tool to change aperture in the geometry in the GDML directly. For scans over many settings use CollScan.CollimatorScan.
     ! Needs to have geometry with collimator closed a bit to have CONE - TUBE - CONE section !
         -- geomFile: geometry to work on
         -- collName: collimator which settings are supposed to be changed
@@ -154,45 +135,9 @@ def collSet( geomFile, collName, collh, thickness, verbose = 0 ):
         -- thickness: beam pipe thickness (material)
         -- verbose: info-output level
     """
-    with open( geomFile, "r") as sources:
-        lines = sources.readlines()
-        
-    with open( geomFile, "w") as sources:
-        i = 0
-        for line in lines:
-
-            if collName in line: 
-                if verbose: print('collimator (vac) at lines[', i, ']')
-                sources.write( re.sub('rmax="\d+.\d+"', 'rmax="%s"' %str(collh), line) )
-                if verbose > 1: print('writing new rmax to line', line)
-
-            elif 'COLL' in line and collName in lines[i+1]:
-                if verbose: print('collimator (mat) at lines[', i+1, ']')
-                sources.write( re.sub('rmax="\d+.\d+"', 'rmax="%s"' %str(collh + thickness), line) )
-                if verbose > 1: print( 'writing new rmax (material thickness) to line', line )
-                    
-            elif 'DRIFT' in line and collName in lines[i+2]: 
-                if verbose: print('drift (vac) with collimator at lines[',i+2,']')
-                sources.write( re.sub('rmax2="\d+.\d+"', 'rmax2="%s"' %str(collh), line) )
-                if verbose > 1: print('writing new rmax2 to line', line)
-            
-            elif 'DRIFT' in line and collName in lines[i+3]:
-                if verbose: print('drift (mat) with collimator at lines[', i+3, ']')
-                sources.write( re.sub('rmax2="\d+.\d+"', 'rmax2="%s"' %str(collh + thickness), line) )
-                if verbose > 1: print('writing new rmax2 to line', line)
-            
-            elif 'DRIFT' in line and collName in lines[i-1]: 
-                if verbose: print('drift (mat) with collimator at lines[',i-1,']')
-                sources.write( re.sub('rmax1="\d+.\d+"', 'rmax1="%s"' %str(collh + thickness), line) )
-                if verbose > 1: print( 'writing new rmax1 (material thickness) to line', line )
-                    
-            elif 'DRIFT' in line and collName in lines[i-2]: 
-                if verbose: print('drift (vac) with collimator at lines[',i-2,']')
-                sources.write( re.sub('rmax1="\d+.\d+"', 'rmax1="%s"' %str(collh), line) )
-                if verbose > 1: print('writing new rmax1 to line', line)
-                
-            else: sources.write( line )
-            i += 1
+    from CollScan import CollimatorScan
+
+    CollimatorScan( geomFile, [collName], verbose = verbose ).write( geomFile, [(collName, collh, thickness)] )
     return 0
 
 from numpy import exp
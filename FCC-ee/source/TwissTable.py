@@ -0,0 +1,175 @@
+from collections import namedtuple
+from numpy import asarray, searchsorted, argsort, all as npall, diff, nan, full, where, sqrt
+from TfsParser import ringLength
+
+# optics at a single element (values at the element exit, as in the twiss output)
+#
+OpticsRecord = namedtuple( 'OpticsRecord', ['NAME', 'S', 'L', 'BETX', 'BETY', 'ALFX', 'ALFY', 'DX', 'DY', 'DPX', 'DPY', 'APER_1'] )
+
+class TwissTable:
+    """
+    Indexed wrapper around a twiss frame (output of TfsReader.read_twiss). Keeps a hash index NAME -> row
+    and the sorted S column, such that element lookups do not scan the whole lattice.
+        -- twiss:   data frame from read_twiss
+        -- header:  header of the twiss file (TfsReader.header); the ring length for rel_S is taken from its LENGTH
+                    parameter, as by the readers, otherwise from the maximum S
+        -- verbose: choose verbosity level
+    """
+
+    def __init__( self, twiss, header = None, verbose = 0 ):
+
+        self.df = twiss
+        self.verbose = verbose
+        self.__coeff = None
+
+        # optics columns as plain arrays; columns missing in the frame are filled with NaN
+        #
+        self.columns = { col: asarray( twiss[col].values ) if col in twiss else full( len(twiss), nan ) for col in OpticsRecord._fields }
+        self.columns['NAME'] = asarray( twiss.NAME.values, dtype = object )
+
+        # first occurrence wins (as .values[0] on a NAME selection)
+        #
+        names = self.columns['NAME']
+        self.index = dict( zip( names[::-1], range( len(names) - 1, -1, -1 ) ) )
+
+        # S is sorted for MAD-X output, otherwise keep the sorting permutation
+        #
+        S = self.columns['S']
+        if npall( diff(S) >= 0 ): self.order = None; self.S = S
+        else: self.order = argsort( S, kind = 'stable' ); self.S = S[self.order]
+        self.length = ringLength( None, header or {}, S )
+
+        if verbose: print( 'TwissTable:', len(names), 'rows,', len(self.index), 'unique element names' )
+
+    def __len__( self ):
+        return len( self.S )
+
+    def __contains__( self, name ):
+        return name in self.index
+
+    def row( self, name ):
+        """
+        Row number of an element (first occurrence of NAME).
+        """
+        try: return self.index[name]
+        except KeyError: raise KeyError( 'element %s not found in twiss' %name ) from None
+
+    def get( self, name, column ):
+        """
+        Single value of a column at an element, e.g. get('IP.1', 'BETX').
+        """
+        if column in self.columns: return self.columns[column][ self.row( name ) ]
+        return self.df[column].values[ self.row( name ) ]
+
+    def record( self, name ):
+        """
+        Optics record (beta, alpha, dispersion, aperture, ...) at an element.
+
+        RETURNS: OpticsRecord
+        """
+        return self.recordAt( self.row( name ) )
+
+    def recordAt( self, i ):
+        """
+        Optics record of row i.
+        """
+        return OpticsRecord( *[ self.columns[col][i] for col in OpticsRecord._fields ] )
+
+    def rows_at_s( self, s ):
+        """
+        Rows of the elements containing the positions s (element whose exit is the first at or after s).
+        Vectorized O(log n) lookup per position.
+            -- s: scalar or array of S positions
+        """
+        i = searchsorted( self.S, s, side = 'left' ).clip( 0, len(self.S) - 1 )
+        if self.order is not None: i = self.order[i]
+
+        return i
+
+    def at_s( self, s ):
+        """
+        Optics record of the element containing position s.
+        """
+        return self.recordAt( int( self.rows_at_s( s ) ) )
+
+    def __interpCoefficients( self ):
+        """
+        Per-element coefficients for optics interpolation, computed once. Each element is described by its
+        entry values (exit values of the previous row): beta, alpha, gamma = (1 + alpha^2)/beta, D and D'.
+        Drifts are propagated exactly, all other elements interpolated linearly between entry and exit.
+        """
+        from numpy import concatenate, zeros_like, char
+
+        cols = self.columns
+        entry = lambda col: concatenate( ( cols[col][:1], cols[col][:-1] ) )
+
+        coeff = { 'Sin': concatenate( ( cols['S'][:1], cols['S'][:-1] ) ) }
+        for col in ['BETX', 'BETY', 'ALFX', 'ALFY', 'DX', 'DY', 'DPX', 'DPY']: coeff[col] = entry( col )
+        for plane in 'XY': coeff['GAM' + plane] = ( 1 + coeff['ALF' + plane]**2 )/coeff['BET' + plane]
+
+        # linear slopes over the element length (used for all non-drift elements)
+        #
+        length = cols['S'] - coeff['Sin']
+        safe = where( length > 0, length, 1. )
+        for col in ['BETX', 'BETY', 'ALFX', 'ALFY', 'DX', 'DY']:
+            coeff['d' + col] = where( length > 0, ( cols[col] - coeff[col] )/safe, zeros_like( length ) )
+
+        if 'KEYWORD' in self.df: keyword = asarray( self.df.KEYWORD.values, dtype = str )
+        else: keyword = asarray( self.columns['NAME'], dtype = str )
+        coeff['drift'] = char.startswith( keyword, 'DRIFT' )
+
+        self.__coeff = coeff
+        return coeff
+
+    def interpolate( self, s, columns = ['BETX', 'BETY', 'ALFX', 'ALFY', 'DX', 'DY'], relS = 0, emit = None, delP = 0 ):
+        """
+        Vectorized optics at arbitrary positions, e.g. Geant4 hits or generated particles.
+        Inside drifts beta, alpha and dispersion are propagated exactly from the element entry:
+            beta(ds) = beta0 - 2 alpha0 ds + gamma0 ds^2,  alpha(ds) = alpha0 - gamma0 ds,  D(ds) = D0 + D'0 ds
+        inside all other elements the values are interpolated linearly between entry and exit.
+            -- s:       array of S positions (or rel_S positions if relS is set)
+            -- columns: optics functions to return
+            -- relS:    positions are given as rel_S (IP in the center, ring length as for the readers)
+            -- emit:    optional [epsx, epsy]; adds beam sizes SIGX, SIGY = sqrt(beta eps + (D delP)^2)
+            -- delP:    energy spread for the beam size
+
+        RETURNS: dict column -> array (plus 'row', the element index for every position)
+        """
+        coeff = self.__coeff if self.__coeff is not None else self.__interpCoefficients()
+
+        s = asarray( s, dtype = float )
+        if relS: s = where( s < 0, s + self.length, s )
+
+        i = self.rows_at_s( s )
+        ds = s - coeff['Sin'][i]
+        drift = coeff['drift'][i]
+
+        result = { 'row': i }
+        for col in set( columns ) | ( { 'BETX', 'BETY', 'DX', 'DY' } if emit is not None else set() ):
+            if col in ['BETX', 'BETY']:
+                plane = col[-1]
+                exact = coeff[col][i] - 2*coeff['ALF' + plane][i]*ds + coeff['GAM' + plane][i]*ds**2
+            elif col in ['ALFX', 'ALFY']:
+                exact = coeff[col][i] - coeff['GAM' + col[-1]][i]*ds
+            elif col in ['DX', 'DY']:
+                exact = coeff[col][i] + coeff['DP' + col[-1]][i]*ds
+            elif col in self.columns: 
+                result[col] = self.columns[col][i]
+                continue
+            else: raise KeyError( 'cannot interpolate column %s' %col )
+
+            result[col] = where( drift, exact, coeff[col][i] + coeff['d' + col][i]*ds )
+
+        if emit is not None:
+            result['SIGX'] = sqrt( result['BETX']*emit[0] + ( result['DX']*delP )**2 )
+            result['SIGY'] = sqrt( result['BETY']*emit[1] + ( result['DY']*delP )**2 )
+
+        return result
+
+def asTwissTable( twiss, header = None ):
+    """
+    Wrap a twiss frame in a TwissTable (returned as is if it already is one).
+        -- header: header of the twiss file, see TwissTable
+    """
+    if isinstance( twiss, TwissTable ): return twiss
+    return TwissTable( twiss, header )
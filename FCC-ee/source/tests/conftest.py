@@ -0,0 +1,69 @@
+import os, sys, tempfile
+from os import path
+
+# the modules live flat in FCC-ee/source and import each other by bare name; caches go to a scratch directory
+#
+sys.path.insert( 0, path.dirname( path.dirname( path.abspath( __file__ ) ) ) )
+scratch = tempfile.mkdtemp( prefix = 'fccee-tests-' )
+os.environ['TFS_CACHE_DIR'] = path.join( scratch, 'tfs' )
+os.environ['SAMPLER_TABLE_DIR'] = path.join( scratch, 'tables' )
+
+import matplotlib
+matplotlib.use( 'Agg' )
+
+import pytest
+from numpy import random, where, isin, cumsum, pi, array
+
+header = [ ('NAME', '%05s', 'TWISS'), ('TYPE', '%05s', 'TWISS'), ('PARTICLE', '%08s', 'POSITRON'), ('MASS', '%le', 0.000510998928),
+           ('ENERGY', '%le', 45.6), ('PC', '%le', 45.59999), ('GAMMA', '%le', 89237.4), ('EX', '%le', 2.7e-10), ('EY', '%le', 1e-12) ]
+
+def makeLattice( n = 400, seed = 0, length = 1000. ):
+    """
+    Random closed lattice as a twiss frame: markers, drifts (all named DRIFT, i.e. repeated names), quadrupoles and
+    sector bends adding up to 2 pi, with the usual twiss columns.
+    """
+    from pandas import DataFrame
+
+    rng = random.default_rng( seed )
+    kw = array( ['MARKER', 'DRIFT', 'QUADRUPOLE', 'SBEND'] )[ rng.integers( 0, 4, n ) ]
+    kw[0] = kw[-1] = 'MARKER'
+    L = where( kw == 'MARKER', 0., rng.uniform( 0.1, 5, n ) ); L *= length/L.sum()
+    bend = kw == 'SBEND'
+    angle = where( bend, 2*pi/bend.sum(), 0. )
+    names = [ 'IP.1' if i == 0 else 'DRIFT' if k == 'DRIFT' else '%s.%i' %(k[:2], i) for i, k in enumerate( kw ) ]
+
+    return DataFrame({ 'NAME': names, 'KEYWORD': kw, 'S': cumsum( L ), 'L': L, 'ANGLE': angle,
+                       'BETX': rng.uniform( 1, 100, n ), 'ALFX': rng.normal( size = n ), 'BETY': rng.uniform( 1, 100, n ),
+                       'ALFY': rng.normal( size = n ), 'X': rng.normal( 0, 1e-4, n ), 'Y': rng.normal( 0, 1e-5, n ),
+                       'DX': rng.normal( 0, 0.1, n ), 'DY': 0., 'TILT': 0., 'APER_1': rng.choice( [0, 0.035, 0.015], n ) })
+
+def writeTfs( fname, df, precision = 12 ):
+    """
+    Plain TFS writer for the fixtures, independent of TfsParser.write_tfs.
+    """
+    with open( fname, 'w' ) as file:
+        for key, fmt, value in header:
+            file.write( '@ %-16s %s %s\n' %( key, fmt, '"%s"' %value if fmt.endswith('s') else repr(value) ) )
+        file.write( '* ' + ' '.join( '%-18s' %col for col in df.columns ) + '\n' )
+        file.write( '$ ' + ' '.join( '%-18s' %( '%s' if isinstance( df[col].iloc[0], str ) else '%le' ) for col in df.columns ) + '\n' )
+        for row in df.itertuples( index = False ):
+            file.write( ' ' + ' '.join( '%-18s' %( '"%s"' %v ) if isinstance( v, str ) else '%18.*e' %( precision, v ) for v in row ) + '\n' )
+
+    return fname
+
+@pytest.fixture
+def lattice():
+    return makeLattice()
+
+@pytest.fixture
+def twissFile( tmp_path, lattice ):
+    return writeTfs( str( tmp_path/'twiss.tfs' ), lattice )
+
+@pytest.fixture
+def beamFile( tmp_path ):
+    """
+    Beam gun file as written by Fields_from_tfs: beam sizes in the third line, EU start position at the end of the fourth.
+    """
+    fname = tmp_path/'beam.dat'
+    fname.write_text( 'header\nheader\n1e-5 0 2e-6 0 1e-3 1e-3\n0 0 0 0.1 0.2 0.3\n' )
+    return str( fname )
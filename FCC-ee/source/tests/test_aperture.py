@@ -0,0 +1,63 @@
+import pytest
+from numpy import allclose, array, linspace, concatenate, random
+from pandas import DataFrame
+from Aperture import ApertureProfile, fccIRSegments, fccIRProfile, inventAperture
+from Tools import calcAper, inventAper
+
+def loopAper( s ):
+    """
+    Baseline: the former if-chain of Tools.calcAper, the last matching segment wins.
+    """
+    r = 0.040
+    for start, end, slope, offset in fccIRSegments:
+        if start <= s < end: r = slope*s + offset
+    return r
+
+def test_profile_matches_if_chain():
+    s = concatenate( ( linspace( -4, 4, 4001 ), array( fccIRSegments )[:, :2].ravel() ) )
+
+    assert allclose( calcAper( s ), [ loopAper( x ) for x in s ], rtol = 0, atol = 1e-15 )
+    assert calcAper( -2.7 ) == pytest.approx( -0.1*-2.7 - 0.2325 ) and calcAper( 0.0 ) == pytest.approx( 0.005689416 )
+    assert calcAper( 5. ) == 0.040 and calcAper( 3.315 ) == 0.040 and calcAper( 3.3149 ) == 0.040
+
+def test_profile_override_and_file( tmp_path ):
+    profile = fccIRProfile.override( [-0.1, 2.], [0.1, 2.5], [0.002, 0.01] )
+
+    assert profile( 0.05 ) == 0.002 and profile( 2.2 ) == 0.01 and profile( 1.8 ) == 0.035 and profile( 2.55 ) == 0.04
+    assert profile( -0.15 ) == fccIRProfile( -0.15 ) and profile( 0.15 ) == fccIRProfile( 0.15 )
+
+    # segments partly covered keep their uncovered parts
+    #
+    s = linspace( -4, 4, 801 )
+    outside = ( ( s < -0.1 ) | ( s >= 0.1 ) ) & ( ( s < 2. ) | ( s >= 2.5 ) )
+    assert allclose( profile( s[outside] ), fccIRProfile( s[outside] ) )
+
+    profile.to_file( str( tmp_path/'profile.txt' ) )
+    again = ApertureProfile.from_file( str( tmp_path/'profile.txt' ) )
+    assert allclose( again( s ), profile( s ) ) and again.default == profile.default
+
+    with pytest.raises( ValueError, match = 'overlap' ): ApertureProfile( [0, 1], [2, 3], [0, 0], [1, 1] )
+
+def test_profile_from_twiss( lattice ):
+    profile = ApertureProfile.from_twiss( lattice, default = 0.05 )
+    withAper = lattice[ ( lattice.APER_1 > 0 ) & ( lattice.L > 0 ) ]
+    mids = withAper.S.values - withAper.L.values/2
+
+    assert allclose( profile( mids ), withAper.APER_1.values )
+    without = lattice[ lattice.APER_1 == 0 ]
+    assert ( profile( without.S.values - without.L.values/2 )[ ( without.L > 0 ).values ] == 0.05 ).all()
+
+def test_invent_aperture_matches_scalar():
+    rng = random.default_rng( 2 )
+    n = 3000
+    names = array( ['DRIFT_1', 'IP.1', 'SOL.L', 'L000013', 'QC1L1', 'COLL.H1', 'BWL'] )[ rng.integers( 0, 7, n ) ]
+    s = rng.uniform( -12, 12, n ); s[:8] = [0, 5.6, -5.6, 8.2, -8.2, 0, 5.6, -5.6]
+    df = DataFrame({ 'NAME': names, 'rel_S': s, 'APER_1': rng.choice( [0., 0.01, 0.03], n ) })
+
+    expect = [ inventAper( x, name, aper, 0.004 ) for x, name, aper in zip( s, names, df.APER_1 ) ]
+    assert allclose( inventAperture( df, 0.004 ), expect, rtol = 0, atol = 0 )
+
+    # categorical names give the same result
+    #
+    df['NAME'] = df.NAME.astype( 'category' )
+    assert allclose( inventAperture( df, 0.004 ), expect, rtol = 0, atol = 0 )
@@ -0,0 +1,73 @@
+import re, pytest
+from CollScan import CollimatorScan
+from Tools import collSet
+
+def collimator( name, r ):
+    """
+    CONE - TUBE - CONE section of a collimator as exported to GDML (material and vacuum solids).
+    """
+    return [ '  <cone name="DRIFT_%s_up_mat" rmin1="0" rmax1="0.037" rmin2="0" rmax2="0.037" z="1.0"/>\n' %name,
+             '  <cone name="DRIFT_%s_up_vac" rmin1="0" rmax1="0.035" rmin2="0" rmax2="0.035" z="1.0"/>\n' %name,
+             '  <tube name="COLL_%s_mat" rmin="0" rmax="%.3f" z="0.4"/>\n' %(name, r + 0.002),
+             '  <tube name="%s_vac" rmin="0" rmax="%.3f" z="0.4"/>\n' %(name, r),
+             '  <cone name="DRIFT_%s_dn_mat" rmin1="0" rmax1="0.037" rmin2="0" rmax2="0.037" z="1.0"/>\n' %name,
+             '  <cone name="DRIFT_%s_dn_vac" rmin1="0" rmax1="0.035" rmin2="0" rmax2="0.035" z="1.0"/>\n' %name ]
+
+def gdml():
+    drift = '  <cone name="DRIFT_%i" rmin1="0" rmax1="0.035" rmin2="0" rmax2="0.035" z="2.0"/>\n'
+    return ( ['<gdml>\n', ' <solids>\n'] + [ drift %i for i in range(3) ] + collimator( 'TCPH1', 0.010 )
+             + [ drift %i for i in range(3, 6) ] + collimator( 'TCSV2', 0.012 ) + [' </solids>\n', '</gdml>\n'] )
+
+def loopCollSet( lines, collName, collh, thickness ):
+    """
+    Baseline: the former line loop of Tools.collSet (neighbour lookups kept inside the file).
+    """
+    at = lambda j: lines[j] if 0 <= j < len(lines) else ''
+    out = []
+    for i, line in enumerate( lines ):
+        if collName in line: line = re.sub( r'rmax="\d+.\d+"', 'rmax="%s"' %str(collh), line )
+        elif 'COLL' in line and collName in at(i + 1): line = re.sub( r'rmax="\d+.\d+"', 'rmax="%s"' %str(collh + thickness), line )
+        elif 'DRIFT' in line and collName in at(i + 2): line = re.sub( r'rmax2="\d+.\d+"', 'rmax2="%s"' %str(collh), line )
+        elif 'DRIFT' in line and collName in at(i + 3): line = re.sub( r'rmax2="\d+.\d+"', 'rmax2="%s"' %str(collh + thickness), line )
+        elif 'DRIFT' in line and collName in at(i - 1): line = re.sub( r'rmax1="\d+.\d+"', 'rmax1="%s"' %str(collh + thickness), line )
+        elif 'DRIFT' in line and collName in at(i - 2): line = re.sub( r'rmax1="\d+.\d+"', 'rmax1="%s"' %str(collh), line )
+        out.append( line )
+    return out
+
+@pytest.fixture
+def geomFile( tmp_path ):
+    fname = tmp_path/'ring.gdml'
+    fname.write_text( ''.join( gdml() ) )
+    return str( fname )
+
+def test_variant_matches_line_loop( geomFile ):
+    scan = CollimatorScan( geomFile, ['TCPH1_vac', 'TCSV2_vac'] )
+    lines = gdml()
+
+    assert scan.variant( [('TCPH1_vac', 0.004, 0.002)] ) == loopCollSet( lines, 'TCPH1_vac', 0.004, 0.002 )
+    both = scan.variant( [('TCPH1_vac', 0.004, 0.002), ('TCSV2_vac', 0.006, 0.003)] )
+    assert both == loopCollSet( loopCollSet( lines, 'TCPH1_vac', 0.004, 0.002 ), 'TCSV2_vac', 0.006, 0.003 )
+    assert sum( a != b for a, b in zip( both, lines ) ) == 12 and scan.lines == lines
+
+    collSet( geomFile, 'TCSV2_vac', 0.006, 0.003 )
+    with open( geomFile ) as file: assert file.readlines() == loopCollSet( lines, 'TCSV2_vac', 0.006, 0.003 )
+
+    with pytest.raises( KeyError, match = 'NOPE' ): CollimatorScan( geomFile, ['NOPE'] )
+
+def test_collimator_at_file_end( tmp_path ):
+    lines = collimator( 'TCPH1', 0.01 )[:4]
+    fname = tmp_path/'end.gdml'; fname.write_text( ''.join( lines ) )
+
+    assert CollimatorScan( str( fname ), ['TCPH1_vac'] ).variant( [('TCPH1_vac', 0.004, 0.002)] ) == loopCollSet( lines, 'TCPH1_vac', 0.004, 0.002 )
+
+def test_scan_writes_grid( tmp_path, geomFile ):
+    scan = CollimatorScan( geomFile, ['TCPH1_vac', 'TCSV2_vac'] )
+    grid = [ ('TCPH1_vac', h, 0.002) for h in [0.003, 0.004, 0.005] ] + [[ ('TCSV2_vac', 0.006, 0.001), ('TCPH1_vac', 0.007, 0.001) ]]
+    files = scan.scan( grid, str( tmp_path/'out' ), threads = 2 )
+
+    assert [ f.split('/')[-1] for f in files ] == [ 'ring_TCPH1_vac_%s_0.002.gdml' %h for h in [0.003, 0.004, 0.005] ] + ['ring_TCSV2_vac_0.006_0.001.gdml']
+    for fname, setting in zip( files, grid ):
+        with open( fname ) as file:
+            assert file.readlines() == scan.variant( [setting] if isinstance( setting[0], str ) else setting )
+
+    with pytest.raises( ValueError, match = 'not unique' ): scan.scan( grid, str( tmp_path/'out' ), nameTemplate = '{stem}.gdml' )
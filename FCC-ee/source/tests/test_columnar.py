@@ -0,0 +1,63 @@
+import pytest
+from numpy import arange, array_equal, int32
+from Columnar import ColumnWriter, load_frame, load_column, concat_frames
+
+def writeFrame( directory, starts, rows = 10 ):
+    with ColumnWriter( directory, meta = { 'run': 1 } ) as writer:
+        for start in starts:
+            writer.append({ 'x': arange( start, start + rows, dtype = float ), 'n': arange( rows, dtype = int32 ) })
+    return directory
+
+def test_column_writer_files_and_errors( tmp_path ):
+    from numpy import load
+
+    directory = writeFrame( str( tmp_path/'a' ), [0, 10, 20], rows = 5 )
+    df, meta = load_frame( directory )
+    assert meta['run'] == 1 and meta['rows'] == 15 and len( df ) == 15
+    assert array_equal( df.x.values, list( range( 5 ) ) + list( range( 10, 15 ) ) + list( range( 20, 25 ) ) )
+
+    # every column is a plain .npy file with the final length in its header
+    #
+    assert array_equal( load( str( tmp_path/'a'/'c001.npy' ) ), list( range( 5 ) )*3 )
+
+    with ColumnWriter( str( tmp_path/'b' ) ) as writer:
+        writer.append({ 'x': arange( 3. ), 'n': arange( 3 ) })
+        with pytest.raises( ValueError, match = 'expected columns' ): writer.append({ 'n': arange( 3 ), 'x': arange( 3. ) })
+        with pytest.raises( ValueError, match = 'different length' ): writer.append({ 'x': arange( 3. ), 'n': arange( 2 ) })
+
+        # later chunks are converted to the dtypes of the first one
+        #
+        writer.append({ 'x': arange( 2, dtype = int32 ), 'n': arange( 2. ) })
+    df = load_frame( str( tmp_path/'b' ) )[0]
+    assert df.x.dtype == float and df.n.dtype == arange( 1 ).dtype and len( df ) == 5
+
+def test_column_writer_not_finalized_on_error( tmp_path ):
+    directory = writeFrame( str( tmp_path/'a' ), [0] )
+
+    # a run failing halfway must not leave a readable (truncated) output, also when overwriting an old one
+    #
+    with pytest.raises( RuntimeError, match = 'crash' ):
+        with ColumnWriter( directory ) as writer:
+            writer.append({ 'x': arange( 3. ), 'n': arange( 3 ) })
+            raise RuntimeError( 'crash' )
+
+    assert writer.closed and all( file.closed for file in writer.files.values() )
+    with pytest.raises( FileNotFoundError ): load_frame( directory )
+
+def test_load_column_unknown( tmp_path ):
+    writeFrame( str( tmp_path/'a' ), [0] )
+    assert array_equal( load_column( str( tmp_path/'a' ), 'x' ), arange( 10. ) )
+    with pytest.raises( KeyError, match = 'column y not in' ):
+        load_column( str( tmp_path/'a' ), 'y' )
+
+def test_concat_skips_empty_frames( tmp_path ):
+    dirs = [ writeFrame( str( tmp_path/'empty' ), [] ), writeFrame( str( tmp_path/'a' ), [0, 10] ), writeFrame( str( tmp_path/'b' ), [20] ) ]
+
+    assert concat_frames( dirs, str( tmp_path/'all' ), chunk = 7, meta = { 'merged': 1 } ) == 30
+    df, meta = load_frame( str( tmp_path/'all' ) )
+    assert list( df.columns ) == ['x', 'n'] and meta['merged'] == 1
+    assert array_equal( df.x.values, arange( 30. ) ) and df.n.dtype == int32
+
+def test_concat_only_empty_frames( tmp_path ):
+    assert concat_frames( [ writeFrame( str( tmp_path/'e' ), [] ) ], str( tmp_path/'all' ) ) == 0
+    assert len( load_frame( str( tmp_path/'all' ) )[0] ) == 0
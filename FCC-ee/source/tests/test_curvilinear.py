@@ -0,0 +1,41 @@
+from numpy import allclose, zeros
+from CS_to_EU import ToEuclidian
+from Survey import survey
+from Curvilinear import CurvilinearMap
+
+def test_twiss_after_toeuclidian( lattice ):
+    # the twiss frame carries the orbit column X as well, it must not be taken for a survey frame
+    #
+    ToEuclidian( lattice )
+    assert 'X' in lattice
+    curvi = CurvilinearMap( lattice, step = 0.5 )
+
+    ends = lattice[ lattice.L > 0 ].iloc[1:-1]
+    result = curvi.transform( ends[['x_EU', 'y_EU', 'z_EU']].values )
+    assert allclose( result.s.values, ends.S.values, atol = 1e-6 )
+    assert allclose( result.x.values, 0, atol = 1e-6 ) and allclose( result.y.values, 0, atol = 1e-6 )
+
+def test_survey_frame_matches_twiss_frame( lattice ):
+    ToEuclidian( lattice )
+    hits = lattice[['x_EU', 'y_EU', 'z_EU']].values[5:50] + [0.01, 0.02, 0.]
+
+    fromTwiss = CurvilinearMap( lattice ).transform( hits )
+    fromSurvey = CurvilinearMap( survey( lattice.drop( columns = ['TILT'] ) ) ).transform( hits )
+    assert allclose( fromTwiss.s.values, fromSurvey.s.values, atol = 1e-6 )
+    assert allclose( fromTwiss[['x', 'y']].values, fromSurvey[['x', 'y']].values, atol = 1e-6 )
+
+def test_offset_hits( lattice ):
+    ToEuclidian( lattice )
+    curvi = CurvilinearMap( lattice )
+    rows = lattice.index[ ( lattice.L > 1 ) & ( lattice.KEYWORD == 'QUADRUPOLE' ) ][:10]
+
+    # a point 1 cm off the orbit in the middle of a straight element (x along W column 0, y along column 1)
+    #
+    mid = zeros( (len(rows), 3) ); mid[:, 2] = lattice.L[rows]/2
+    W = [ lattice.W[r - 1] for r in rows ]
+    hits = [ lattice.loc[r - 1, ['x_EU', 'y_EU', 'z_EU']].values.astype( float ) + w @ ( m + [0.01, -0.005, 0] ) for w, m, r in zip( W, mid, rows ) ]
+
+    result = curvi.transform( hits )
+    assert allclose( result.s.values, lattice.S[rows].values - lattice.L[rows].values/2, atol = 1e-9 )
+    assert allclose( result.x.values, 0.01 ) and allclose( result.y.values, -0.005 )
+    assert list( result.NAME ) == list( lattice.NAME[rows] )
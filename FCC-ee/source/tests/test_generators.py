@@ -0,0 +1,71 @@
+import pytest
+from numpy import random, interp, exp, log, sqrt, pi, array, array_equal
+from scipy.stats import kstest, ks_2samp
+from Generators import genPlanck, genComptArr, genCompt, cmpt
+from SamplerTables import planckCDF, comptonCDF
+
+@pytest.fixture( scope = 'module' )
+def planck():
+    x, F = planckCDF( n = 2**18 + 1 )
+    return lambda values: interp( values, x, F )
+
+def loopPlanck( stats, rng ):
+    """
+    Baseline: the former scalar rejection loop of genPlanck (three uniforms per candidate).
+    """
+    c = .648; a = 1.266; b = -.6
+    x1 = c; x2 = (log(c) - a)/b; xDiff = x2 - x1
+    p1 = x1*x1/2; p2 = x1*xDiff; p3 = -1/b*exp(a + b*x2)
+    P12 = p1/(p1+p2+p3); P23 = (p1+p2)/(p1+p2+p3)
+
+    values = []
+    while len(values) < stats:
+        r1, r2, r3 = rng.random(3)
+        if r1 < P12: w = x1*sqrt(r2); ok = w > (exp(w) - 1)*r3
+        elif r1 < P23: w = x1 + xDiff*r2; ok = w**2 > x1*(exp(w) - 1)*r3
+        else: w = x2 + log(r2)/b; ok = w**2 > (exp(w) - 1)*exp(a + b*w)*r3
+        if ok: values.append(w)
+    return array( values )
+
+def test_planck_distribution( planck ):
+    values = genPlanck( 200000, seed = 1 )
+
+    assert len( values ) == 200000 and ( values > 0 ).all()
+    assert kstest( values, planck ).pvalue > 0.01
+    assert values.mean() == pytest.approx( pi**4/15/2.4041138063191885, rel = 5e-3 )
+
+    # same distribution as the scalar loop, reproducible with a seed
+    #
+    assert ks_2samp( values[:20000], loopPlanck( 20000, random.default_rng( 2 ) ) ).pvalue > 0.01
+    assert array_equal( genPlanck( 1000, seed = 3 ), genPlanck( 1000, seed = 3 ) )
+    assert len( genPlanck( 0, seed = 3 ) ) == 0 and len( genPlanck( 1, seed = 3 ) ) == 1
+
+@pytest.mark.parametrize( 'kappa', [1e-4, 0.5, 20.] )
+def test_compton_distribution( kappa ):
+    from scipy.integrate import quad
+
+    m0 = 511e-6
+    x, F = comptonCDF( kappa )
+    cost, counts = genComptArr( [kappa*m0]*100000, m0, seed = 4, counts = 1 )
+
+    assert ( abs( cost ) <= 1 ).all() and kstest( cost, lambda c: interp( c, x, F ) ).pvalue > 0.01
+
+    # trials per photon follow the acceptance of the envelope 2 on (-1, 1)
+    #
+    acceptance = quad( lambda c: cmpt( c, 1., kappa ), -1, 1 )[0]/4
+    assert counts.min() == 1 and counts.mean() == pytest.approx( 1/acceptance, rel = 0.02 )
+
+    scalar = [ genCompt( kappa*m0, m0, seed = rng )[0] for rng in random.default_rng( 5 ).spawn( 3000 ) ]
+    assert ks_2samp( cost, scalar ).pvalue > 0.01
+
+def test_compton_mixed_energies():
+    m0 = 511e-6
+    energ = random.default_rng( 6 ).choice( [1e-4*m0, 20*m0], 100000 )
+    cost = genComptArr( energ, m0, seed = 7 )
+
+    for kappa in [1e-4, 20.]:
+        x, F = comptonCDF( kappa )
+        assert kstest( cost[ energ == kappa*m0 ], lambda c: interp( c, x, F ) ).pvalue > 0.01
+
+    assert array_equal( genComptArr( energ[:100], m0, seed = 8 ), genComptArr( energ[:100], m0, seed = 8 ) )
+    assert len( genComptArr( [], m0, seed = 8 ) ) == 0
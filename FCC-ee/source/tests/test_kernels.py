@@ -0,0 +1,45 @@
+from numpy import allclose, array, random, pi, identity
+from CS_to_EU import RotY, FromNorm, RotFrmZ, RotToZ, getRotVec3, RotYArr, FromNormArr, RotFrmZArr, RotToZArr, getRotVec3Arr, fourMom2
+from RelKin import Boost, BoostArr
+
+rng = random.default_rng( 6 )
+N = 500
+theta = rng.uniform( 0, pi, N ); phi = rng.uniform( -pi/2, pi/2, N )
+vec4 = rng.normal( size = (N, 4) ); vec6 = rng.normal( size = (N, 6) )
+
+def test_rotations_match_matrices():
+    vec3 = vec4[:, 1:]
+
+    assert allclose( RotYArr( theta, vec3 ), [ RotY( t, v ) for t, v in zip( theta, vec3 ) ], rtol = 0, atol = 1e-15 )
+    assert allclose( RotYArr( 0.3, vec3 ), [ RotY( 0.3, v ) for v in vec3 ], rtol = 0, atol = 1e-15 )
+    assert allclose( RotFrmZArr( theta, phi, vec4 ), [ RotFrmZ( t, p ) @ v for t, p, v in zip( theta, phi, vec4 ) ], rtol = 0, atol = 1e-15 )
+    assert allclose( RotToZArr( theta, phi, vec4 ), [ RotToZ( t, p ) @ v for t, p, v in zip( theta, phi, vec4 ) ], rtol = 0, atol = 1e-15 )
+
+    # RotToZ inverts RotFrmZ
+    #
+    assert allclose( RotToZArr( theta, phi, RotFrmZArr( theta, phi, vec4 ) ), vec4, atol = 1e-14 )
+    assert allclose( RotY( 0.2, identity(3) ) @ RotY( -0.2, identity(3) ), identity(3) )
+
+def test_from_norm_matches_matrix():
+    betx, bety = rng.uniform( 1, 100, N ), rng.uniform( 1, 100, N )
+    alfx, alfy = rng.normal( size = N ), rng.normal( size = N )
+
+    expect = [ FromNorm( *p ) @ v for *p, v in zip( betx, bety, alfx, alfy, vec6 ) ]
+    assert allclose( FromNormArr( betx, bety, alfx, alfy, vec6 ), expect, rtol = 1e-15, atol = 1e-15 )
+    assert allclose( FromNormArr( 10., 2., 0.5, -1., vec6 ), [ FromNorm( 10., 2., 0.5, -1. ) @ v for v in vec6 ], rtol = 1e-15, atol = 1e-15 )
+
+def test_rot_vec3_matches_scalar():
+    units = RotFrmZArr( theta, phi, array( [[0., 0., 0., 1.]]*N ) )[:, 1:]
+
+    t, p = getRotVec3Arr( units )
+    assert allclose( array( [ getRotVec3( v ) for v in units ] ), array( [t, p] ).T, rtol = 0, atol = 1e-12 )
+    assert allclose( t, theta, atol = 1e-7 ) and allclose( p, phi, atol = 1e-7 )
+
+def test_boost_matches_matrix_and_keeps_mass():
+    gam = rng.uniform( 1, 1e3, N ); bet = ( 1 - 1/gam**2 )**0.5
+    mom = vec4.copy(); mom[:, 0] = ( 1 + ( vec4[:, 1:]**2 ).sum( axis = 1 ) )**0.5
+
+    boosted = BoostArr( gam, bet, mom )
+    assert allclose( boosted, [ Boost( g, b ) @ v for g, b, v in zip( gam, bet, mom ) ], rtol = 1e-15, atol = 0 )
+    assert allclose( [ fourMom2( v ) for v in boosted ], 1, rtol = 1e-8 )
+    assert allclose( BoostArr( gam, -bet, boosted ), mom, rtol = 1e-6, atol = 1e-6 )
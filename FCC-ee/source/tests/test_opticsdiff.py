@@ -0,0 +1,63 @@
+from numpy import allclose, isnan
+from OpticsDiff import matchRows, diff_optics, largest_changes
+
+def changedVersion( lattice ):
+    """
+    New optics: BETX scaled, one quadrupole renamed (matched by S overlap), one drift removed (shifts the n-th DRIFT).
+    """
+    quad = lattice.index[ lattice.KEYWORD == 'QUADRUPOLE' ][3]
+    drift = lattice.index[ lattice.NAME == 'DRIFT' ][-1]
+
+    other = lattice.copy()
+    other['BETX'] = lattice.BETX*1.5
+    other.loc[quad, 'NAME'] = 'QNEW'
+    return other.drop( index = drift ).reset_index( drop = True ), quad, drift
+
+def test_match_rows( lattice ):
+    other, quad, drift = changedVersion( lattice )
+    rows, how = matchRows( lattice, other )
+
+    assert how[quad] == 'S' and other.NAME[ rows[quad] ] == 'QNEW'
+    named = how == 'name'
+    assert ( other.NAME.values[ rows[named] ] == lattice.NAME.values[named] ).all()
+
+    # the last DRIFT has no n-th partner and no element with L > 0 covering its center
+    #
+    assert rows[drift] == -1 and how[drift] == ''
+    assert ( rows[ lattice.index != drift ] >= 0 ).all()
+
+def test_diff_optics( lattice ):
+    other, quad, drift = changedVersion( lattice )
+    diff = diff_optics( [lattice, other, lattice], labels = ['ref', 'new', 'same'], columns = ['BETX', 'S'] )
+
+    assert list( diff.columns ) == ['NAME', 'S', 'BETX', 'match_new', 'S_new', 'dS_new', 'BETX_new', 'dBETX_new',
+                                    'match_same', 'S_same', 'dS_same', 'BETX_same', 'dBETX_same']
+    matched = diff.match_new != ''
+    assert allclose( diff.dBETX_new[matched], 0.5*lattice.BETX[matched] ) and isnan( diff.dBETX_new[drift] )
+    assert ( diff.match_same == 'name' ).all() and ( diff.dBETX_same == 0 ).all()
+
+    regions = { 'first': [0, 500], 'second': [500, 1000] }
+    report = largest_changes( diff, 'BETX', label = 'new', regions = regions, n = 3 )
+    assert list( report.region ) == ['first']*3 + ['second']*3
+    for region, (smin, smax) in regions.items():
+        inside = diff[ ( diff.S >= smin ) & ( diff.S <= smax ) ]
+        assert allclose( report[ report.region == region ].dBETX_new.values, inside.dBETX_new.abs().nlargest( 3 ).values )
+
+def test_repeated_names_removed_mid_lattice():
+    from pandas import DataFrame
+
+    # FODO line QF D QF D QF D QF; the second QF/D pair is removed, the rest stays at its S
+    #
+    ref = DataFrame({ 'NAME': 'QF D QF D QF D QF'.split(), 'S': [1., 2., 4., 5., 7., 8., 10.], 'L': 1. })
+    other = ref.drop( index = [2, 3] ).reset_index( drop = True )
+    rows, how = matchRows( ref, other )
+
+    assert list( rows ) == [0, 1, -1, -1, 2, 3, 4] and list( how ) == ['name', 'name', '', '', 'name', 'name', 'name']
+    assert ( other.S.values[ rows[ rows >= 0 ] ] == ref.S.values[ rows >= 0 ] ).all()
+
+    # a repeated element moved by more than Stol is matched by S overlap only
+    #
+    moved = ref.copy(); moved.loc[4, 'S'] = 7.2
+    rows, how = matchRows( ref, moved )
+    assert how[4] == 'S' and rows[4] == 4 and ( how[ [0, 1, 2, 3, 5, 6] ] == 'name' ).all()
+    assert matchRows( ref, moved, Stol = 0.5 )[1][4] == 'name'
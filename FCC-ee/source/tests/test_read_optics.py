@@ -0,0 +1,34 @@
+from numpy import allclose, arange
+from conftest import writeTfs
+from TfsTables import read_optics
+
+def writeVersions( tmp_path, lattice ):
+    files = {}
+    for i in range(3):
+        version = lattice.copy()
+        version['BETX'] = lattice.BETX*( 1 + 0.1*i )
+        files['v%i' %i] = writeTfs( str( tmp_path/( 'v%i.tfs' %i ) ), version )
+    return files
+
+def test_duplicate_names_unstack( tmp_path, lattice ):
+    assert ( lattice.NAME == 'DRIFT' ).sum() > 1
+    batch = read_optics( writeVersions( tmp_path, lattice ), processes = 2 )
+
+    assert batch.index.is_unique and batch.index.names == ['optics', 'NAME', 'n']
+    betx = batch.BETX.unstack( 'optics' )
+    assert betx.shape == ( len(lattice), 3 )
+    assert allclose( betx.v2.values, 1.2*betx.v0.values ) and allclose( betx.v1.values, 1.1*betx.v0.values )
+
+    # n-th DRIFT of every version is the n-th DRIFT of the lattice
+    #
+    drifts = batch.xs( ('v0', 'DRIFT'), level = ['optics', 'NAME'] )
+    assert list( drifts.index ) == list( arange( len(drifts) ) )
+    assert allclose( drifts.S.values, lattice.S[ lattice.NAME == 'DRIFT' ].values )
+
+def test_columns_without_name( tmp_path, lattice ):
+    files = writeVersions( tmp_path, lattice )
+    batch = read_optics( files, columns = ['S', 'BETX'], processes = 1 )
+
+    assert list( batch.columns ) == ['S', 'BETX'] and len(batch) == 3*len(lattice)
+    assert allclose( batch.loc['v1'].BETX.values, 1.1*lattice.BETX.values )
+    assert set( batch.attrs['headers'] ) == set( files )
@@ -0,0 +1,57 @@
+import os
+import pytest
+from numpy import interp, isfinite, array, linspace
+from scipy.stats import kstest
+import SamplerTables
+from SamplerTables import samplePlanck, sampleCompton, planckAccuracy, comptonAccuracy, planckCDF, comptonCDF
+from Generators import genPlanck, genComptArr
+
+def test_accuracy_bounds():
+    # bounds stated in SamplerTables: 5e-9 in u for Planck, 1e-4 for Klein-Nishina inside the kappa grid
+    #
+    assert planckAccuracy( samples = 10**5 ) < 5e-9
+    assert comptonAccuracy( nkappa = 10, samples = 5000 ) < 1e-4
+
+def test_tables_are_stored_once( monkeypatch ):
+    samplePlanck( [0.5] ); sampleCompton( 1., [0.5] )
+    assert { 'planck_65536.npy', 'compton_256x2049.npy' } <= set( os.listdir( SamplerTables.tableDir ) )
+
+    # a new process loads the stored file instead of building the table again
+    #
+    monkeypatch.setattr( SamplerTables, 'loaded', {} )
+    monkeypatch.setattr( SamplerTables, 'buildPlanck', lambda n: pytest.fail( 'table rebuilt' ) )
+    assert samplePlanck( array([0.3]) )[0] > 0 and type( SamplerTables.loaded['planck_65536'] ).__name__ == 'memmap'
+
+def test_table_samplers():
+    values = genPlanck( 100000, seed = 1, method = 'table' )
+    x, F = planckCDF( n = 2**18 + 1 )
+    assert kstest( values, lambda v: interp( v, x, F ) ).pvalue > 0.01
+
+    m0 = 511e-6
+    cost, counts = genComptArr( [0.3*m0]*100000, m0, seed = 2, counts = 1, method = 'table' )
+    x, F = comptonCDF( 0.3 )
+    assert kstest( cost, lambda c: interp( c, x, F ) ).pvalue > 0.01 and ( counts == 1 ).all()
+
+    # ends of the u range and kappa outside of the grid stay finite and inside the physical range
+    #
+    u = array([ 0., 1e-300, 0.5, 1 - 1e-16, 1. ])
+    assert isfinite( samplePlanck( u ) ).all() and samplePlanck( u )[0] == 0 and samplePlanck( u )[-1] <= 50
+    c = sampleCompton( 1e-9, linspace( 0, 1, 101 ) )
+    assert ( abs( c ) <= 1 + 1e-12 ).all() and ( c[1:] >= c[:-1] ).all()
+    with pytest.raises( ValueError, match = 'above the table range' ): sampleCompton( [1., 1e5], [0.5, 0.5] )
+
+def test_table_sampler_above_kappa_grid():
+    from numpy import random
+    from scipy.stats import ks_2samp
+
+    # thermal photons at room temperature reach kappa ~ 1e4 to 1e8 in the electron rest frame, beyond kappaMax
+    #
+    m0 = 511e-6
+    energ = random.default_rng( 3 ).choice( [0.3*m0, 3e3*m0], 20000 )
+    cost, counts = genComptArr( energ, m0, seed = 4, counts = 1, method = 'table' )
+    high = energ > SamplerTables.kappaMax*m0
+
+    assert ( counts[~high] == 1 ).all() and counts[high].mean() > 1.5
+    assert ks_2samp( cost[high], genComptArr( energ[high], m0, seed = 5 ) ).pvalue > 0.01
+    x, F = comptonCDF( 0.3 )
+    assert kstest( cost[~high], lambda c: interp( c, x, F ) ).pvalue > 0.01
@@ -0,0 +1,110 @@
+import pytest
+from numpy import allclose, array, zeros, identity, pi, random
+from pandas import DataFrame
+from CS_to_EU import ToEuclidian
+from Survey import survey, rotation, elementTransforms, compare_survey
+
+def loopSurvey( df ):
+    """
+    Baseline: V_i = V_(i-1) + W_(i-1) R_i, W_i = W_(i-1) S_i element by element.
+    """
+    S, R = elementTransforms( df )
+    W = identity(3); V = zeros(3); Ws = []; Vs = []
+    for s, r in zip( S, R ):
+        V = V + W @ r; W = W @ s
+        Ws.append( W ); Vs.append( V )
+    return array( Ws ), array( Vs )
+
+def ring( n = 16, radius = 10. ):
+    """
+    Regular polygon ring of n bends, each followed by a drift.
+    """
+    angle = 2*pi/n
+    L = [0.] + [ radius*angle, 1. ]*n
+    return DataFrame({ 'NAME': [ 'E%i' %i for i in range( len(L) ) ], 'S': array( L ).cumsum(), 'L': L,
+                       'ANGLE': [0.] + [ angle, 0. ]*n, 'TILT': 0., 'KEYWORD': ['MARKER'] + ['SBEND', 'DRIFT']*n })
+
+def test_prefix_scan_matches_loop( lattice ):
+    rng = random.default_rng( 4 )
+    lattice['TILT'] = rng.choice( [0., pi/2, 0.3], len(lattice) )
+    W, V = loopSurvey( lattice )
+    result = survey( lattice )
+
+    assert allclose( result[['X', 'Y', 'Z']].values, V, atol = 1e-9 ) and allclose( result.attrs['W'], W, atol = 1e-12 )
+    assert allclose( rotation( result.THETA, result.PHI, result.PSI ), W, atol = 1e-12 )
+
+def test_flat_ring_matches_toeuclidian_and_closes( lattice ):
+    result = survey( lattice.drop( columns = ['TILT'] ) )
+    W = ToEuclidian( lattice )
+    assert allclose( result[['X', 'Y', 'Z']].values, lattice[['x_EU', 'y_EU', 'z_EU']].values, atol = 1e-9 )
+    assert allclose( result.attrs['W'], W, atol = 1e-12 )
+
+    # closed polygon: back at the start after THETA = -2 pi
+    #
+    closed = survey( ring() )
+    assert allclose( closed[['X', 'Y', 'Z']].values[-1], 0, atol = 1e-12 ) and closed.THETA.values[-1] == pytest.approx( -2*pi )
+    assert ( abs( closed.PHI ) < 1e-15 ).all() and ( closed.THETA.diff().dropna() <= 1e-15 ).all()
+
+def test_vertical_bend_rotations_and_start():
+    df = DataFrame({ 'NAME': ['START', 'BV', 'D', 'XROT', 'SROT'], 'S': [0, 2, 3, 3, 3], 'L': [0., 2., 1., 0., 0.],
+                     'ANGLE': [0., 0.1, 0., 0.05, 0.2], 'TILT': [0., pi/2, 0., 0., 0.],
+                     'KEYWORD': ['MARKER', 'SBEND', 'DRIFT', 'XROTATION', 'SROTATION'] })
+    result = survey( df )
+
+    # a positive angle bends towards -x, rolled by pi/2 towards -y: PHI = -angle, y = -rho (1 - cos(angle))
+    #
+    assert result.PHI[1] == pytest.approx( -0.1 ) and result.THETA[1] == pytest.approx( 0 )
+    assert result.Y[1] == pytest.approx( -20*( 1 - 0.99500416527802582 ) ) and result.X[1] == pytest.approx( 0 )
+    assert result.PHI[3] == pytest.approx( -0.05 ) and result.PSI[4] == pytest.approx( 0.2 ) and result.PHI[4] == result.PHI[3]
+
+    # start point and orientation: survey is moved and rotated as a whole
+    #
+    moved = survey( df, X0 = 1, Y0 = 2, Z0 = 3, THETA0 = 0.4 )
+    expect = result[['X', 'Y', 'Z']].values @ rotation( 0.4 ).T + [1, 2, 3]
+    assert allclose( moved[['X', 'Y', 'Z']].values, expect ) and allclose( moved.THETA - result.THETA, 0.4 )
+
+def test_compare_survey( tmp_path ):
+    result = survey( ring() )
+    assert max( compare_survey( result, result.copy(), verbose = 0 ).values() ) == 0
+
+    shifted = result.copy(); shifted['X'] += 1e-3
+    with pytest.raises( ValueError, match = 'X' ): compare_survey( result, shifted, verbose = 0 )
+
+def test_incremental_survey_update( lattice ):
+    from Survey import IncrementalSurvey
+
+    lattice['TILT'] = random.default_rng( 5 ).choice( [0., pi/2], len(lattice) )
+    inc = IncrementalSurvey( lattice, X0 = 1, THETA0 = 0.2 )
+    full = survey( lattice, X0 = 1, THETA0 = 0.2 )
+    cols = ['X', 'Y', 'Z', 'THETA', 'PHI', 'PSI']
+    assert allclose( inc.coordinates()[cols].values, full[cols].values, atol = 1e-9 )
+
+    # change a length and an angle, compare with a new full survey of the changed lattice
+    #
+    bend = lattice.index[ lattice.KEYWORD == 'SBEND' ][3]
+    quad = lattice.NAME[ lattice.index[ lattice.KEYWORD == 'QUADRUPOLE' ][2] ]
+    inc.update( [quad], L = 2.5 ); inc.update( [bend], ANGLE = 0.02, TILT = 0.1 )
+
+    changed = lattice.copy()
+    row = changed.index[ changed.NAME == quad ][0]
+    changed['S'] = changed.S + ( changed.index >= row )*( 2.5 - changed.L[row] )
+    changed.loc[row, 'L'] = 2.5; changed.loc[bend, ['ANGLE', 'TILT']] = [0.02, 0.1]
+    full = survey( changed, X0 = 1, THETA0 = 0.2 )
+
+    assert allclose( inc.coordinates()[cols].values, full[cols].values, atol = 1e-9 ) and allclose( inc.df.S, changed.S )
+    assert allclose( inc.coordinates( [quad, 'IP.1'] ).X.values, full.X.values[[row, 0]], atol = 1e-9 )
+
+    # apply writes the ToEuclidian columns, only from the first changed row on
+    #
+    frame = changed.copy()
+    inc.apply( frame )
+    assert allclose( frame[['x_EU', 'y_EU', 'z_EU']].values, full[['X', 'Y', 'Z']].values, atol = 1e-9 )
+    assert allclose( array( list( frame.W ) ), full.attrs['W'], atol = 1e-12 )
+    assert inc.apply( frame ) is frame
+
+    inc.update( [bend], ANGLE = 0.03 ); changed.loc[bend, 'ANGLE'] = 0.03
+    inc.apply( frame )
+    assert allclose( frame[['x_EU', 'y_EU', 'z_EU']].values, survey( changed, X0 = 1, THETA0 = 0.2 )[['X', 'Y', 'Z']].values, atol = 1e-9 )
+
+    with pytest.raises( KeyError, match = 'cannot update' ): inc.update( [quad], K1 = 0.1 )
+    with pytest.raises( KeyError, match = 'NOPE' ): inc.update( ['NOPE'], L = 1 )
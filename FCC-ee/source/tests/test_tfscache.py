@@ -0,0 +1,94 @@
+import time
+import pytest
+from numpy import array_equal
+from conftest import writeTfs, makeLattice
+from TfsCache import TfsCache, fingerprint
+from TfsTables import TfsReader
+
+def test_cache_hit_keeps_derived_columns( tmp_path, twissFile, monkeypatch ):
+    import TfsTables
+
+    cache = TfsCache( str( tmp_path/'cache' ) )
+    reader = TfsReader( twissFile, verbose = 0, cache = cache )
+    df = reader.read_twiss( relS = 1 )
+    df['x_EU'] = df.S.values*2
+    reader.update_cache( df )
+
+    # a second reader must not parse the file again
+    #
+    monkeypatch.setattr( TfsTables, 'read_tfs', lambda *args, **kwargs: pytest.fail( 'file parsed despite cache entry' ) )
+    again = TfsReader( twissFile, verbose = 0, cache = cache )
+    cached = again.read_twiss( relS = 1 )
+
+    assert array_equal( cached.x_EU.values, df.x_EU.values ) and list( cached.NAME ) == list( df.NAME )
+    assert cached.NAME.dtype == 'category' and again.header == reader.header
+
+    # other read options are separate entries
+    #
+    monkeypatch.undo()
+    assert 'rel_S' not in TfsReader( twissFile, verbose = 0, cache = cache ).read_twiss()
+
+def test_cache_invalidated_by_change( tmp_path, twissFile ):
+    cache = TfsCache( str( tmp_path/'cache' ) )
+    before = TfsReader( twissFile, verbose = 0, cache = cache ).read_twiss()
+    source = fingerprint( twissFile )
+
+    writeTfs( twissFile, makeLattice( seed = 1 ) )
+    assert fingerprint( twissFile ) != source
+    assert cache.load( twissFile, 'twiss-relS0-float64' ) is None and not cache.entries()
+
+    after = TfsReader( twissFile, verbose = 0, cache = cache ).read_twiss()
+    assert not array_equal( after.BETX.values, before.BETX.values ) and len( cache.entries() ) == 1
+
+def test_cache_evicts_least_recently_used( tmp_path, lattice ):
+    files = [ writeTfs( str( tmp_path/( 'f%i.tfs' %i ) ), lattice ) for i in range(3) ]
+    cache = TfsCache( str( tmp_path/'cache' ) )
+
+    for fname in files[:2]:
+        TfsReader( fname, verbose = 0, cache = cache ).read_twiss(); time.sleep( 0.01 )
+    size = max( size for lastUsed, size, entry in cache.entries() )
+
+    # use the first entry again, then a third entry pushes out the second one
+    #
+    cache.maxSize = 2.5*size
+    cache.load( files[0], 'twiss-relS0-float64' ); time.sleep( 0.01 )
+    TfsReader( files[2], verbose = 0, cache = cache ).read_twiss()
+
+    kept = [ entry for lastUsed, size, entry in cache.entries() ]
+    assert sorted( kept ) == sorted([ cache.entry( files[0], 'twiss-relS0-float64' ), cache.entry( files[2], 'twiss-relS0-float64' ) ])
+
+    cache.clear()
+    assert cache.entries() == []
+
+def test_cache_store_is_atomic( tmp_path, twissFile, monkeypatch ):
+    import TfsCache as module
+    from os import listdir, path
+
+    cache = TfsCache( str( tmp_path/'cache' ) )
+    reader = TfsReader( twissFile, verbose = 0, cache = cache )
+    df = reader.read_twiss()
+
+    # a write failing halfway must leave the previous entry intact and readable
+    #
+    save = module.save_frame
+    def failingSave( directory, frame, meta = None ):
+        save( directory, frame.iloc[:, :2], meta )
+        raise OSError( 'disk full' )
+
+    monkeypatch.setattr( module, 'save_frame', failingSave )
+    changed = df.copy()
+    changed['x_EU'] = 1.
+    with pytest.raises( OSError ): reader.update_cache( changed )
+    monkeypatch.undo()
+    assert listdir( cache.cacheDir ) == [ path.basename( cache.entry( twissFile, 'twiss-relS0-float64' ) ) ]
+
+    header, cached = cache.load( twissFile, 'twiss-relS0-float64' )
+    assert list( cached.columns ) == list( df.columns ) and array_equal( cached.BETX.values, df.BETX.values )
+    assert [ entry for lastUsed, size, entry in cache.entries() ] == [ cache.entry( twissFile, 'twiss-relS0-float64' ) ]
+
+    # a successful update replaces the entry, without left-overs next to it
+    #
+    reader.update_cache( changed )
+    assert 'x_EU' in cache.load( twissFile, 'twiss-relS0-float64' )[1]
+    cache.clear()
+    assert listdir( cache.cacheDir ) == []
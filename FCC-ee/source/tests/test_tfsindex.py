@@ -0,0 +1,41 @@
+import pytest
+from numpy import isclose
+from TfsCache import TfsCache
+from TfsIndex import TfsIndex
+from Tools import readTwissParams
+
+def scanLine( tfs, elm ):
+    """
+    Baseline: the former line scan of Tools.readTwissParams.
+    """
+    with open( tfs ) as file:
+        for i, line in enumerate( file ):
+            if line.startswith( ' "%s"' %elm ): return i
+
+def test_lines_and_rows( tmp_path, twissFile, lattice ):
+    index = TfsIndex( twissFile, cache = TfsCache( str( tmp_path/'cache' ) ) )
+
+    for name in [ 'IP.1', 'DRIFT', lattice.NAME[57], lattice.NAME.iloc[-1] ]:
+        assert index.line( name ) == scanLine( twissFile, name ) and name in index
+    assert readTwissParams( twissFile, lattice.NAME[57] ) == scanLine( twissFile, lattice.NAME[57] )
+    assert readTwissParams( twissFile, lattice.NAME[57], cache = index.cache ) == scanLine( twissFile, lattice.NAME[57] )
+
+    # typed rows, first occurrence of repeated names
+    #
+    drift = lattice[ lattice.NAME == 'DRIFT' ].iloc[0]
+    row = index.row( 'DRIFT' )
+    assert row['KEYWORD'] == 'DRIFT' and isclose( row['S'], drift.S, rtol = 1e-12 ) and isclose( row['BETX'], drift.BETX, rtol = 1e-12 )
+
+    rows = index.rows( [ lattice.NAME[9], 'IP.1' ] )
+    assert list( rows.NAME ) == [ lattice.NAME[9], 'IP.1' ] and list( rows.columns ) == list( lattice.columns )
+    assert index.raw( ['IP.1'] )[0].startswith( ' "IP.1"' )
+
+    with pytest.raises( KeyError, match = 'NOPE' ): index.line( 'NOPE' )
+
+def test_index_is_cached( tmp_path, twissFile, monkeypatch ):
+    cache = TfsCache( str( tmp_path/'cache' ) )
+    first = TfsIndex( twissFile, cache = cache )
+
+    monkeypatch.setattr( TfsIndex, '_TfsIndex__build', lambda *args: pytest.fail( 'index rebuilt despite cache entry' ) )
+    again = TfsIndex( twissFile, cache = cache )
+    assert list( again.index ) == list( first.index ) and ( again.offsets == first.offsets ).all()
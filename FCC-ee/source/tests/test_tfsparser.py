@@ -0,0 +1,44 @@
+import pytest
+from numpy import array_equal, allclose, float32, float64, int64
+from conftest import writeTfs, header
+from TfsParser import parse_header, read_tfs, windowMask
+from Tools import rel_s
+
+def test_parse_header( twissFile, lattice ):
+    params, names, formats, offset, nlines = parse_header( twissFile )
+
+    assert params == { key: value for key, fmt, value in header }
+    assert names == list( lattice.columns ) and formats[:2] == ['%s', '%s'] and set( formats[2:] ) == {'%le'}
+    with open( twissFile, 'rb' ) as file:
+        assert nlines == len( header ) + 2 and file.read()[offset:].startswith( b' "IP.1"' )
+
+def test_read_tfs_types_and_values( twissFile, lattice ):
+    params, df = read_tfs( twissFile )
+
+    assert list( df.columns ) == list( lattice.columns ) and len( df ) == len( lattice )
+    assert df.NAME.dtype == 'category' and df.KEYWORD.dtype == 'category' and df.S.dtype == float64
+    assert list( df.NAME ) == list( lattice.NAME ) and allclose( df.BETX.values, lattice.BETX.values, rtol = 1e-12 )
+
+    assert read_tfs( twissFile, floatType = float32 )[1].BETX.dtype == float32
+    assert read_tfs( twissFile, categorical = [] )[1].NAME.dtype != 'category'
+
+def test_read_tfs_integer_and_tab_separated( tmp_path ):
+    fname = tmp_path/'ints.tfs'
+    fname.write_text( '@ NAME %05s "TWISS"\n* NAME S N\n$ %s %le %d\n "A"\t1.5\t3\n "B" 2.5  4\n' )
+
+    params, df = read_tfs( str( fname ) )
+    assert list( df.NAME ) == ['A', 'B'] and array_equal( df.S.values, [1.5, 2.5] ) and df.N.dtype == int64
+
+def test_read_tfs_columns_and_windows( twissFile, lattice ):
+    with pytest.raises( KeyError, match = 'columns not found' ): read_tfs( twissFile, columns = ['NAME', 'NOPE'] )
+
+    full = read_tfs( twissFile )[1]
+    df = read_tfs( twissFile, columns = ['NAME', 'BETX'], Srange = [100, 400], chunksize = 50 )[1]
+    inside = full[ ( full.S >= 100 ) & ( full.S <= 400 ) ]
+    assert list( df.columns ) == ['NAME', 'BETX'] and array_equal( df.BETX.values, inside.BETX.values )
+
+    # rel_S window around the IP spans the end and the start of the table
+    #
+    df = read_tfs( twissFile, relSrange = [-50, 50] )[1]
+    assert array_equal( df.S.values, full.S.values[ windowMask( full.S.values, relSrange = [-50, 50], Lmax = full.S.max() ) ] )
+    assert ( abs( rel_s( df.S.values, full.S.max() ) ) <= 50 ).all() and ( df.S < 50 ).any() and ( df.S > 950 ).any()
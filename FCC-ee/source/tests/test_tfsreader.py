@@ -0,0 +1,66 @@
+import pytest
+from numpy import array_equal
+from conftest import writeTfs
+from TfsCache import TfsCache
+from TfsTables import TfsReader
+from Tools import rel_s
+
+@pytest.fixture( params = [None, 1010.] )
+def ringFile( request, tmp_path, lattice ):
+    """
+    Twiss file without and with a LENGTH header (the latter differs from the last S on purpose).
+    """
+    fname = writeTfs( str( tmp_path/'twiss.tfs' ), lattice )
+    if request.param is not None:
+        with open( fname ) as file: text = file.read()
+        with open( fname, 'w' ) as file: file.write( '@ LENGTH           %%le %r\n' %request.param + text )
+
+    return fname, request.param
+
+@pytest.mark.parametrize( 'method', ['read_twiss', 'read_survey'] )
+def test_windowed_rel_s_matches_full_read( tmp_path, ringFile, method ):
+    fname, Lmax = ringFile
+    full = getattr( TfsReader( fname, verbose = 0, cache = 0 ), method )( relS = 1 )
+    assert array_equal( full.rel_S.values, rel_s( full.S.values, Lmax or full.S.max() ) )
+
+    # streamed window, and window out of a cached full table
+    #
+    window = dict( columns = ['NAME', 'S'], relSrange = [-200, 300] )
+    streamed = getattr( TfsReader( fname, verbose = 0, cache = 0 ), method )( relS = 1, **window )
+
+    cached = TfsReader( fname, verbose = 0, cache = TfsCache( str( tmp_path/'cache' ) ) )
+    getattr( cached, method )( relS = 1 )
+    fromCache = getattr( cached, method )( relS = 1, **window )
+
+    inside = full[ ( full.rel_S >= -200 ) & ( full.rel_S <= 300 ) ]
+    for df in [streamed, fromCache]:
+        assert list( df.columns ) == ['NAME', 'S', 'rel_S']
+        assert array_equal( df.S.values, inside.S.values ) and array_equal( df.rel_S.values, inside.rel_S.values )
+
+def test_read_survey_window_respects_verbose( capsys, twissFile ):
+    reader = TfsReader( twissFile, verbose = 1, cache = 0 )
+    capsys.readouterr()
+
+    reader.read_survey( columns = ['NAME', 'S'], Srange = [0, 100] )
+    assert capsys.readouterr().out == ''
+
+    reader.read_survey( verbose = 1, columns = ['NAME', 'S'], Srange = [0, 100] )
+    assert 'reading' in capsys.readouterr().out
+
+def test_header_parsed_once( twissFile, monkeypatch ):
+    import TfsTables
+
+    calls = []
+    parse = TfsTables.parse_header
+    monkeypatch.setattr( TfsTables, 'parse_header', lambda tfs: calls.append( tfs ) or parse( tfs ) )
+
+    reader = TfsReader( twissFile, verbose = 0, cache = 0 )
+    assert reader.read_twiss_header( 'PARTICLE' ) == 'POSITRON' and reader.read_twiss_header( 'GAMMA' ) == 89237.4
+    assert reader.read_twiss_header( ['EX', 'EY', 'NAME'] ) == [2.7e-10, 1e-12, 'TWISS']
+    assert len( calls ) == 1
+
+    # a full read sets the header as well
+    #
+    other = TfsReader( twissFile, verbose = 0, cache = 0 )
+    other.read_twiss()
+    assert other.read_twiss_header( 'ENERGY' ) == 45.6 and len( calls ) == 1
@@ -0,0 +1,69 @@
+import pytest
+from numpy import random, concatenate, frombuffer, isfinite, array, stack, allclose
+from TfsParser import formatFloats, expDigits, write_tfs, read_tfs
+
+def referenceFormat( values, precision, nExp ):
+    # % formatting with a sign place and the exponent padded to nExp digits
+    #
+    texts = []
+    for v in values:
+        mantissa, exponent = ( '% .*e' %(precision - 1, v) ).split( 'e' )
+        texts.append( mantissa + 'e' + exponent[0] + exponent[1:].zfill( nExp ) )
+    return texts
+
+def floatSample( n = 20000, seed = 0 ):
+    rng = random.default_rng( seed )
+    x = concatenate( ( rng.normal( size = n )*10.0**rng.integers( -300, 300, n ), frombuffer( rng.bytes( 8*n ), dtype = float ),
+                       rng.integers( -10**6, 10**6, n )/8., [0., -0., 0.5, 1.25, 2.5, 5e-324, 1.7976931348623157e308, 9.9999999999995, 0.15] ) )
+    return x[ isfinite( x ) ]
+
+@pytest.mark.parametrize( 'precision', [1, 2, 7, 12, 15, 16, 17] )
+def test_format_floats_matches_percent( precision ):
+    x = floatSample()
+    nExp = expDigits( x )
+    got = [ row.tobytes().decode() for row in formatFloats( x, precision, nExp ) ]
+    assert got == referenceFormat( x, precision, nExp )
+
+def test_format_floats_round_trip():
+    x = floatSample( seed = 1 )
+    assert all( float( row.tobytes() ) == v for row, v in zip( formatFloats( x, 17, expDigits( x ) ), x ) )
+
+def test_format_floats_special_values():
+    rows = formatFloats( array( [float('nan'), float('inf'), -float('inf'), 1.] ), 4 )
+    assert [ row.tobytes().decode().strip() for row in rows ] == ['nan', 'inf', '-inf', '1.000e+00']
+
+@pytest.mark.parametrize( 'precision', [1, 12, 17, 20] )
+def test_format_floats_edge_values( precision ):
+    # denormals, values rounding up to the next power of ten, negative zero and the float range limits
+    #
+    x = array( [5e-324, -5e-324, 2.2250738585072014e-308, 1e-310, -0., 0., 9.9999999999999e99, -9.99999999999999e-100,
+                9.5, 0.95, 99.5, 9.999999999999999e22, 1e23, 1.7976931348623157e308, -1.7976931348623157e308, 0.5, 2.5] )
+    for nExp in [3, expDigits( x )]:
+        rows = formatFloats( x, precision, nExp )
+        assert rows.shape == ( len(x), precision + 3 + nExp + ( precision > 1 ) )
+        assert [ row.tobytes().decode() for row in rows ] == referenceFormat( x, precision, nExp )
+    assert rows[4].tobytes().decode().startswith( '-0' )
+
+def test_format_floats_random_exponents():
+    x = floatSample( n = 5000, seed = 2 )
+    small = x[ ( abs( x ) < 1e99 ) & ( abs( x ) > 1e-99 ) ]
+    assert expDigits( small ) == 2
+    for nExp in [2, 3]:
+        assert [ row.tobytes().decode() for row in formatFloats( small, 12, nExp ) ] == referenceFormat( small, 12, nExp )
+
+def test_write_read_round_trip( tmp_path, lattice ):
+    from CS_to_EU import ToEuclidian
+
+    ToEuclidian( lattice )
+    lattice['N'] = range( len(lattice) )
+    header = { 'TITLE': 'test', 'LENGTH': float( lattice.S.max() ), 'NPART': 3 }
+    write_tfs( str( tmp_path/'out.tfs' ), lattice, header, precision = 17, blockRows = 77, processes = 2 )
+
+    readHeader, df = read_tfs( str( tmp_path/'out.tfs' ) )
+    assert readHeader['TITLE'] == 'test' and readHeader['NPART'] == 3 and readHeader['LENGTH'] == header['LENGTH']
+    assert list( df.NAME.astype( str ) ) == list( lattice.NAME ) and ( df.N.values == lattice.N.values ).all()
+
+    # 17 digits are exact (test_format_floats_round_trip); the fast float parser of pandas may be one ulp off
+    #
+    for col in ['S', 'L', 'ANGLE', 'BETX', 'x_EU', 'z_EU']: assert allclose( df[col].values, lattice[col].values, rtol = 4.5e-16, atol = 0 )
+    assert allclose( stack( lattice.W.values )[:, 0, 2], df.W13.values, rtol = 4.5e-16, atol = 0 )
@@ -0,0 +1,130 @@
+import os
+import pytest
+from numpy import array_equal, histogram, linspace, isfinite
+from Columnar import load_frame
+from ThrmlPht import Scatter, runParallel
+
+def scatterArgs( beamFile, lattice, **kwargs ):
+    # T is small enough that the photons stay well below the electron mass in the rest frame (Ei is in eV = 1e-9 GeV units)
+    #
+    return dict( dict( beamfile = beamFile, tfs = lattice, Emit = [1e-9, 1e-12], HalfCross = 0.015, pc = 45.6, T = 3e-7 ), **kwargs )
+
+def test_chain_matches_per_particle_matrices( beamFile, lattice ):
+    from numpy import array, allclose
+    from CS_to_EU import RotToZ, RotFrmZ, getRotVec3
+    from RelKin import Boost
+
+    scatter = Scatter( Npart = 400, seed = 9, **scatterArgs( beamFile, lattice ) )
+    scatter.genBeam( lattice.NAME[5] ); scatter.genPhot(); scatter.toREST(); scatter.compt()
+    qe_out_z, qk_out_z = scatter.toLAB()
+
+    # every stage recomputed particle by particle with the matrix versions, as the former loops did
+    #
+    s = scatter
+    assert allclose( s.qe_in_z, [ RotToZ( *ang ) @ q for ang, q in zip( s.angles_qe, s.qe_in ) ], rtol = 1e-14, atol = 1e-16 )
+    assert allclose( s.qk_in_z, [ RotToZ( *ang ) @ q for ang, q in zip( s.angles_qe, s.qk_in ) ], rtol = 1e-14, atol = 1e-25 )
+    assert allclose( s.qkstar, [ Boost( g, b ) @ q for g, b, q in zip( s.Gamm, s.Bet, s.qk_in_z ) ], rtol = 1e-12, atol = 1e-25 )
+    assert allclose( s.qestar, [ Boost( g, b ) @ q for g, b, q in zip( s.Gamm, s.Bet, s.qe_in_z ) ], rtol = 1e-9, atol = 1e-12 )
+    assert allclose( s.angles_from_z, [ getRotVec3( q[1:] ) for q in s.qkstar ], rtol = 1e-12, atol = 1e-12 )
+
+    qk = array([ Boost( g, b ) @ RotFrmZ( *ang ) @ q for g, b, ang, q in zip( s.Gamm, s.Bet, s.angles_from_z, s.qkstar_sct_z ) ])
+    assert allclose( qk_out_z, qk, rtol = 1e-12, atol = 1e-25 ) and allclose( qe_out_z, s.qe_in + s.qk_in - qk, rtol = 1e-14 )
+
+    # the rotation keeps the electron mass, scattered photons stay massless
+    #
+    mass2 = lambda q: q[:, 0]**2 - ( q[:, 1:]**2 ).sum( axis = 1 )
+    assert allclose( mass2( s.qe_in_z ), scatter.m0**2, rtol = 1e-3 )
+    assert allclose( ( s.qkstar_sct_z[:, 1:]**2 ).sum( axis = 1 )**0.5, s.qkstar_sct_z[:, 0], rtol = 1e-12 )
+
+def test_run_sets_up_beam_once( tmp_path, beamFile, lattice, monkeypatch ):
+    import ThrmlPht, BeamGen
+    from numpy import concatenate
+
+    built = []; reads = []
+    class CountingBeam( BeamGen.Beam ):
+        def __init__( self, *args, **kwargs ):
+            built.append( args[1] ); super().__init__( *args, **kwargs )
+    genfromtxt = BeamGen.genfromtxt
+    monkeypatch.setattr( ThrmlPht, 'Beam', CountingBeam )
+    monkeypatch.setattr( BeamGen, 'genfromtxt', lambda *args, **kwargs: reads.append( 1 ) or genfromtxt( *args, **kwargs ) )
+
+    kwargs = scatterArgs( beamFile, lattice, Npart = 1000, seed = 5 )
+    rows = Scatter( **kwargs ).run( lattice.NAME[5], str( tmp_path/'run' ), chunk = 300 )
+    assert rows == 1000 and built == [lattice.NAME[5]] and len( reads ) == 3
+
+    # same random stream as a fresh Beam per chunk
+    #
+    scatter = Scatter( **kwargs ); out = []
+    for n in [300, 300, 300, 100]:
+        scatter.Npart = n
+        scatter.genBeam( lattice.NAME[5] ); scatter.genPhot(); scatter.toREST(); scatter.compt()
+        out.append( concatenate( scatter.toLAB(), axis = 1 ) )
+
+    run = load_frame( str( tmp_path/'run' ) )[0]
+    assert array_equal( run.values, concatenate( out ) )
+
+def test_run_chunks_bound_memory_not_results( tmp_path, beamFile, lattice ):
+    from numpy import concatenate
+
+    kwargs = scatterArgs( beamFile, lattice, Npart = 1500, seed = 11 )
+    elm = lattice.NAME[5]
+
+    # one chunk is the plain in-memory chain with the same seed
+    #
+    scatter = Scatter( **kwargs )
+    scatter.genBeam( elm ); scatter.genPhot(); scatter.toREST(); scatter.compt()
+    single = concatenate( scatter.toLAB(), axis = 1 )
+    assert Scatter( **kwargs ).run( elm, str( tmp_path/'one' ), chunk = 5000 ) == 1500
+    assert array_equal( load_frame( str( tmp_path/'one' ) )[0].values, single )
+
+    # smaller chunks: same number of finite events, meta data of the run
+    #
+    run = Scatter( **kwargs )
+    assert run.run( elm, str( tmp_path/'many' ), chunk = 400, meta = { 'tag': 'x' } ) == 1500 and run.Npart == 1500
+    df, meta = load_frame( str( tmp_path/'many' ) )
+    assert df.shape == ( 1500, 8 ) and isfinite( df.values ).all()
+    assert meta['tag'] == 'x' and meta['Npart'] == 1500 and meta['element'] == elm
+
+def test_run_parallel_reproducible( tmp_path, beamFile, lattice ):
+    edges = { 'qk_E': linspace( 0, 2e-6, 41 ), 'qe_pz': linspace( 40, 50, 21 ) }
+    kwargs = scatterArgs( beamFile, lattice, sampler = 'table' )
+    elm = lattice.NAME[5]
+
+    rowsA, histA = runParallel( elm, str( tmp_path/'a' ), 5000, processes = 3, seed = 7, chunk = 1000, histograms = edges, **kwargs )
+    rowsB, histB = runParallel( elm, str( tmp_path/'b' ), 5000, processes = 3, seed = 7, chunk = 1000, histograms = edges, **kwargs )
+    runParallel( elm, str( tmp_path/'c' ), 5000, processes = 3, seed = 8, chunk = 1000, **kwargs )
+
+    a, meta = load_frame( str( tmp_path/'a' ) )
+    b = load_frame( str( tmp_path/'b' ) )[0]
+    c = load_frame( str( tmp_path/'c' ) )[0]
+
+    assert rowsA == rowsB == len(a) == 5000 and meta['shards'] == [1667, 1667, 1666]
+    assert array_equal( a.values, b.values ) and not array_equal( a.values, c.values )
+    assert isfinite( a.values ).all()
+
+    # merged histograms are the histograms of the merged data, and are stored next to it
+    #
+    for col, e in edges.items():
+        assert array_equal( histA[col][0], histogram( a[col].values, e )[0] ) and array_equal( histA[col][0], histB[col][0] )
+    assert sorted( os.listdir( tmp_path/'a' ) ) == ['c%03i.npy' %i for i in range(8)] + ['frame.json', 'histograms.npz']
+
+def test_run_parallel_more_processes_than_events( tmp_path, beamFile, lattice ):
+    rows, hists = runParallel( lattice.NAME[5], str( tmp_path/'out' ), 3, processes = 4, seed = 1,
+                               histograms = { 'qk_E': linspace( 0, 1, 3 ) }, **scatterArgs( beamFile, lattice ) )
+
+    out, meta = load_frame( str( tmp_path/'out' ) )
+    assert rows == len(out) == 3 and meta['processes'] == 3 and len( out.columns ) == 8
+    assert not [ d for d in os.listdir( tmp_path/'out' ) if d.startswith( 'shard' ) ]
+
+def test_run_single_process_matches_scatter_run( tmp_path, beamFile, lattice ):
+    from numpy import random
+
+    kwargs = scatterArgs( beamFile, lattice )
+    runParallel( lattice.NAME[5], str( tmp_path/'par' ), 2000, processes = 1, seed = 3, chunk = 500, **kwargs )
+
+    # one process uses the first stream spawned from the master seed
+    #
+    seed = random.SeedSequence( 3 ).spawn( 1 )[0]
+    Scatter( Npart = 2000, seed = random.default_rng( seed ), **kwargs ).run( lattice.NAME[5], str( tmp_path/'one' ), chunk = 500 )
+
+    assert array_equal( load_frame( str( tmp_path/'par' ) )[0].values, load_frame( str( tmp_path/'one' ) )[0].values )
@@ -0,0 +1,41 @@
+from numpy import allclose, array, identity, cos, sin, pi
+from CS_to_EU import ToEuclidian, RotY
+
+def loopEuclidian( df ):
+    """
+    Baseline: the former element loop of ToEuclidian (frame and position updated element by element).
+    """
+    mats = [ identity(3) ]; vecs = [ array([0., 0., 0.]) ]
+    for L, angle in zip( df.L.values[1:], df.ANGLE.values[1:] ):
+        if L == 0 or angle == 0: R = array([0, 0, L]); W = mats[-1]
+        else:
+            rho = L/angle
+            R = array([ rho*( cos(angle) - 1 ), 0, rho*sin(angle) ])
+            W = mats[-1]@RotY( -angle, identity(3) )
+        vecs.append( mats[-1]@R + vecs[-1] ); mats.append( W )
+
+    return array( vecs ), array( mats )
+
+def test_matches_element_loop( lattice ):
+    vecs, mats = loopEuclidian( lattice )
+    W = ToEuclidian( lattice )
+
+    assert allclose( lattice[['x_EU', 'y_EU', 'z_EU']].values, vecs, rtol = 0, atol = 1e-9 )
+    assert allclose( W, mats, rtol = 0, atol = 1e-12 ) and allclose( lattice.W.iloc[7], mats[7] )
+
+    # bends add up to 2 pi: the frame is back to the start
+    #
+    assert allclose( W[-1], identity(3), atol = 1e-12 )
+
+def test_straight_line_and_single_bend():
+    from pandas import DataFrame
+
+    line = DataFrame({ 'L': [0., 1., 2., 0.], 'ANGLE': 0. })
+    ToEuclidian( line )
+    assert allclose( line.z_EU, [0, 1, 3, 3] ) and allclose( line.x_EU, 0 )
+
+    # quarter circle of radius 10 after a 1 m drift
+    #
+    arc = DataFrame({ 'L': [0., 1., 10*pi/2], 'ANGLE': [0., 0., pi/2] })
+    W = ToEuclidian( arc )
+    assert allclose( arc[['x_EU', 'z_EU']].values[-1], [-10, 11] ) and allclose( W[-1]@[0, 0, 1], [-1, 0, 0] )
@@ -0,0 +1,16 @@
+from numpy import array, array_equal, ndarray
+from pandas import Series
+from Tools import rel_s, rel_s_neg
+
+def test_rel_s_inputs():
+    S = [0., 100., 600., 1000.]
+    expect = array([0., 100., -400., 0.])
+
+    for values in [S, array(S), Series(S)]:
+        assert isinstance( rel_s( values ), ndarray ) and array_equal( rel_s( values ), expect )
+    assert array_equal( rel_s_neg( S ), array([-0., -100., 400., 0.]) )
+
+    # scalars give 0-d arrays (without a ring length, the scalar itself is Lmax)
+    #
+    assert rel_s( 600., 1000. ).shape == () and rel_s( 600., 1000. ) == -400.
+    assert rel_s_neg( 100., 1000. ) == -100. and rel_s( 600. ) == 0.
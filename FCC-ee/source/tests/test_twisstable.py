@@ -0,0 +1,89 @@
+import pytest
+from numpy import allclose, array
+from TwissTable import TwissTable, asTwissTable
+
+def test_first_occurrence_and_records( lattice ):
+    table = TwissTable( lattice )
+    first = lattice.index[ lattice.NAME == 'DRIFT' ][0]
+
+    assert table.row( 'DRIFT' ) == first and 'DRIFT' in table and 'NOPE' not in table
+    assert table.get( 'IP.1', 'BETX' ) == lattice.BETX[0] and table.get( 'IP.1', 'KEYWORD' ) == 'MARKER'
+    record = table.record( lattice.NAME[10] )
+    assert record.S == lattice.S[10] and record.BETY == lattice.BETY[10]
+    with pytest.raises( KeyError, match = 'NOPE' ):
+        table.record( 'NOPE' )
+
+def test_rows_at_s( lattice ):
+    table = TwissTable( lattice )
+    S = lattice.S.values
+
+    # inside an element, at its exit and beyond the end
+    #
+    assert ( table.rows_at_s( S[1:] - 1e-9 ) <= range( 1, len(S) ) ).all()
+    assert ( S[ table.rows_at_s( S[1:] - 1e-9 ) ] >= S[1:] - 1e-9 ).all()
+    assert table.rows_at_s( S[-1] + 10 ) == len(S) - 1
+    assert table.at_s( S[20] ).NAME == lattice.NAME[ table.rows_at_s( S[20] ) ]
+
+def test_unsorted_s( lattice ):
+    shuffled = lattice.sample( frac = 1, random_state = 1 ).reset_index( drop = True )
+    table = TwissTable( shuffled )
+    rows = table.rows_at_s( lattice.S.values[5:50] )
+    assert allclose( shuffled.S.values[rows], lattice.S.values[5:50] )
+
+def test_as_twiss_table_is_idempotent( lattice ):
+    table = TwissTable( lattice )
+    assert asTwissTable( table ) is table
+
+def test_bunch_wraps_twiss_once( monkeypatch, tmp_path, lattice ):
+    pytest.importorskip( 'uproot' )
+    import Primaries
+
+    calls = []
+    monkeypatch.setattr( Primaries, 'asTwissTable', lambda twiss: calls.append( 1 ) or TwissTable( twiss ) )
+    ntuple = tmp_path/'primaries.root'; ntuple.write_bytes( b'' )
+    bunch = Primaries.Bunch( [str( ntuple )], emit = [1e-9, 1e-12], plotpath = str( tmp_path ) )
+
+    lattice.loc[5, 'NAME'] = 'QC1L1.1'
+    for i in range(3): bunch._Bunch__beamSizeElm( lattice, 'QC1L1_1_v' )
+    assert len(calls) == 1
+
+def driftLattice():
+    """
+    Marker, drift and quadrupole with consistent optics: the drift exit follows from the exact propagation.
+    """
+    from pandas import DataFrame
+
+    b0, a0, d0, dp0 = 10., -1.5, 0.2, 0.01
+    g0 = ( 1 + a0**2 )/b0; L = 4.
+    return DataFrame({ 'NAME': ['IP.1', 'DRIFT', 'QF'], 'KEYWORD': ['MARKER', 'DRIFT', 'QUADRUPOLE'], 'S': [0., L, L + 1],
+                       'BETX': [b0, b0 - 2*a0*L + g0*L**2, 20.], 'ALFX': [a0, a0 - g0*L, 1.], 'BETY': [b0, b0 - 2*a0*L + g0*L**2, 5.],
+                       'ALFY': [a0, a0 - g0*L, -1.], 'DX': [d0, d0 + dp0*L, 0.3], 'DPX': [dp0, dp0, 0.02], 'DY': 0., 'DPY': 0.,
+                       'APER_1': [0., 0.03, 0.02] })
+
+def test_interpolate_drift_exact_and_linear():
+    twiss = driftLattice()
+    table = TwissTable( twiss )
+    s = array([ 0., 1., 2.5, 4., 4.25, 5. ])
+    result = table.interpolate( s, columns = ['BETX', 'ALFX', 'DX', 'APER_1'], emit = [1e-9, 1e-12], delP = 1e-3 )
+
+    b0, a0 = twiss.BETX[0], twiss.ALFX[0]; g0 = ( 1 + a0**2 )/b0
+    inDrift = s[:4]
+    assert allclose( result['BETX'][:4], b0 - 2*a0*inDrift + g0*inDrift**2 ) and allclose( result['ALFX'][:4], a0 - g0*inDrift )
+    assert allclose( result['DX'][:4], twiss.DX[0] + twiss.DPX[0]*inDrift )
+
+    # linear inside the quadrupole, exit values at the element ends
+    #
+    assert allclose( result['BETX'][4:], [ twiss.BETX[1] + 0.25*( twiss.BETX[2] - twiss.BETX[1] ), twiss.BETX[2] ] )
+    assert list( result['row'] ) == [0, 1, 1, 1, 2, 2] and list( result['APER_1'] ) == [0., .03, .03, .03, .02, .02]
+    assert allclose( result['SIGX'], ( result['BETX']*1e-9 + ( result['DX']*1e-3 )**2 )**0.5 )
+
+    # rel_S positions before the IP are taken from the end of the ring
+    #
+    assert allclose( table.interpolate( [-0.5], relS = 1 )['BETX'], table.interpolate( [4.5] )['BETX'] )
+
+    # the ring length comes from the LENGTH header parameter if given, as for rel_S in the readers
+    #
+    longer = TwissTable( twiss, header = { 'LENGTH': 5.5 } )
+    assert longer.length == 5.5 and table.length == 5.
+    assert allclose( longer.interpolate( [-0.5], relS = 1 )['BETX'], longer.interpolate( [5.] )['BETX'] )
+    with pytest.raises( KeyError, match = 'cannot interpolate' ): table.interpolate( s, columns = ['NOPE'] )